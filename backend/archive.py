@@ -0,0 +1,470 @@
+"""Archival of old ledger rows to compressed columnar files.
+
+``archive_ledger`` moves every ``account_transaction`` row dated before a
+cutoff out of the database. The cutoff is the first day of a month, by
+default the month ``ARCHIVE_HORIZON_DAYS`` ago. Accounts are processed in
+account-number chunks of ``CHUNK_SIZE``. Each chunk writes one file per
+month under ``ARCHIVE_DIR``, records it in ``ledger_archive_file``, sets
+the accounts' carry-forward and deletes the rows, then commits. The
+carry-forward is ``archived_balance``, the balance after the last
+archived row, and ``archived_before``, the cutoff. ``archived_balance``
+replaces the initial deposit as the opening balance of what stays in the
+hot table.
+
+Once a run has started, postings dated before its cutoff are rejected.
+That cutoff is the archive watermark. Archived rows are never changed
+again.
+
+A file holds row groups of up to ``ROW_GROUP_SIZE`` rows sorted by
+``(account_number, transaction_date, transaction_id)``. Every column of a
+row group is a separately compressed block. Account numbers are
+run-length encoded in the footer. ``transaction_id`` and
+``transaction_date`` are delta encoded before compression. The footer
+also holds the offset of each block. Readers memory-map the file and
+decompress only the row groups that hold the accounts they need. With
+``--codec none`` the blocks are stored raw and read straight from the
+mapping.
+
+    python archive.py [--cutoff 2023-01-01] [--codec zlib]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from itertools import groupby
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import BigInteger, cast, delete, func, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "730"))
+
+CHUNK_SIZE = 10000
+ROW_GROUP_SIZE = 16384
+
+MAGIC = b"LEDGARC1"
+_TRAILER = struct.Struct("<Q8s")
+
+# Columns stored as blocks: (dtype, encoding)
+BLOCK_COLUMNS = {
+    "transaction_id": ("<i8", "delta"),
+    "transaction_date": ("<i8", "delta"),  # Microseconds since the epoch
+    "transaction_type": ("<i1", "plain"),
+    "transaction_amount": ("<i8", "plain"),
+    "balance_after_transaction": ("<i8", "plain"),
+    "registration_date": ("<i8", "plain"),  # NaT for none
+}
+
+COLUMNS = (
+    "transaction_id",
+    "account_number",
+    "transaction_date",
+    "transaction_type",
+    "transaction_amount",
+    "balance_after_transaction",
+    "registration_date",
+)
+
+CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "none": (bytes, bytes),
+}
+
+
+def default_cutoff(today: Optional[date] = None, horizon_days: int = ARCHIVE_HORIZON_DAYS) -> datetime:
+    """First day of the month ``horizon_days`` before ``today``."""
+    day = (today or date.today()) - timedelta(days=horizon_days)
+    return datetime(day.year, day.month, 1)
+
+
+def _month_start(moment) -> date:
+    return date(moment.year, moment.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _encode(values: np.ndarray, encoding: str) -> np.ndarray:
+    if encoding == "delta" and len(values):
+        return np.concatenate((values[:1], np.diff(values)))
+    return values
+
+
+def _decode(values: np.ndarray, encoding: str) -> np.ndarray:
+    return np.cumsum(values) if encoding == "delta" else values
+
+
+def write_file(path: str, columns: dict, codec: str = "zlib", row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """Write sorted rows given as arrays keyed by column name; returns the file size.
+
+    ``account_number`` is a sequence of strings, the datetime columns are
+    ``datetime64[us]`` arrays and the rest are integer arrays.
+    """
+    compress = CODECS[codec][0]
+    account_numbers = columns["account_number"]
+    rows = len(account_numbers)
+    blocks = {
+        name: np.asarray(columns[name]).astype("datetime64[us]").view("<i8")
+        if name.endswith("_date") else np.asarray(columns[name], dtype=dtype)
+        for name, (dtype, _) in BLOCK_COLUMNS.items()
+    }
+
+    row_groups = []
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(MAGIC)
+        for start in range(0, rows, row_group_size):
+            stop = min(start + row_group_size, rows)
+            accounts = [[number, len(list(run))] for number, run in groupby(account_numbers[start:stop])]
+            offsets = {}
+            for name, (dtype, encoding) in BLOCK_COLUMNS.items():
+                data = compress(_encode(blocks[name][start:stop], encoding).tobytes())
+                offsets[name] = [f.tell(), len(data)]
+                f.write(data)
+            row_groups.append({"rows": stop - start, "accounts": accounts, "blocks": offsets})
+        footer = json.dumps({
+            "codec": codec,
+            "rows": rows,
+            "columns": {name: {"dtype": dtype, "encoding": encoding}
+                        for name, (dtype, encoding) in BLOCK_COLUMNS.items()},
+            "row_groups": row_groups,
+        }).encode()
+        f.write(footer)
+        f.write(_TRAILER.pack(len(footer), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(path + ".tmp", path)
+    return size
+
+
+class ArchiveFile:
+    """Memory-mapped archive file; use as a context manager."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_length, magic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        if magic != MAGIC or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a ledger archive file")
+        footer_end = len(self._map) - _TRAILER.size
+        footer = json.loads(self._map[footer_end - footer_length:footer_end])
+        self.codec = footer["codec"]
+        self.rows = footer["rows"]
+        self.row_groups = footer["row_groups"]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _block(self, row_group: dict, name: str, start: int, stop: int) -> np.ndarray:
+        dtype, encoding = BLOCK_COLUMNS[name]
+        offset, length = row_group["blocks"][name]
+        if self.codec == "none" and encoding == "plain":
+            # Straight from the page cache; copied so the mapping can close
+            return np.frombuffer(self._map, dtype, stop - start, offset + start * np.dtype(dtype).itemsize).copy()
+        data = CODECS[self.codec][1](self._map[offset:offset + length])
+        return _decode(np.frombuffer(data, dtype), encoding)[start:stop]
+
+    def read(self, account_number: Optional[str] = None) -> dict:
+        """Return every column as an array, for one account or the whole file."""
+        parts = []
+        for row_group in self.row_groups:
+            start, stop = 0, row_group["rows"]
+            accounts = row_group["accounts"]
+            if account_number is not None:
+                if not accounts[0][0] <= account_number <= accounts[-1][0]:
+                    continue
+                position = 0
+                for number, count in accounts:
+                    if number == account_number:
+                        start, stop = position, position + count
+                        accounts = [[number, count]]
+                        break
+                    position += count
+                else:
+                    continue
+            block = {name: self._block(row_group, name, start, stop) for name in BLOCK_COLUMNS}
+            block["account_number"] = np.repeat(
+                np.array([number for number, _ in accounts], dtype=object), [count for _, count in accounts])
+            parts.append(block)
+        if not parts:
+            return {name: np.empty(0, dtype=object if name == "account_number" else BLOCK_COLUMNS[name][0])
+                    for name in COLUMNS}
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+@lru_cache
+def _row_type(fields):
+    return namedtuple("ArchivedTransaction", fields)
+
+
+def _to_python(name: str, values: np.ndarray) -> list:
+    if name.endswith("_date"):
+        return values.view("datetime64[us]").astype(object).tolist()
+    if name in ("transaction_amount", "balance_after_transaction"):
+        return [Decimal(value) for value in values.tolist()]
+    return values.tolist()
+
+
+def _select(columns: dict, after=None, from_date=None, to_date=None, through=None) -> np.ndarray:
+    """Positions of the rows in the range, in ``(transaction_date, transaction_id)`` order."""
+    dates = columns["transaction_date"].view("datetime64[us]")
+    ids = columns["transaction_id"]
+    mask = np.ones(len(ids), dtype=bool)
+    if from_date is not None:
+        mask &= dates >= np.datetime64(from_date, "us")
+    if to_date is not None:
+        mask &= dates < np.datetime64(to_date, "us")
+    if through is not None:
+        mask &= dates <= np.datetime64(through, "us")
+    if after is not None:
+        after_date = np.datetime64(after[0], "us")
+        mask &= (dates > after_date) | ((dates == after_date) & (ids > after[1]))
+    positions = np.flatnonzero(mask)
+    return positions[np.lexsort((ids[positions], dates[positions]))]
+
+
+def scan(partitions, fields=COLUMNS, account_number: Optional[str] = None, after=None,
+         from_date: Optional[datetime] = None, to_date: Optional[datetime] = None, directory: Optional[str] = None):
+    """Yield the archived rows in range as lists of named tuples, one month at a time.
+
+    ``partitions`` are catalog entries from ``partitions``; ``after`` is a
+    ``(transaction_date, transaction_id)`` key to continue strictly after.
+    Rows come in ``(transaction_date, transaction_id)`` order.
+    """
+    directory = directory or ARCHIVE_DIR
+    row_type = _row_type(tuple(fields))
+    for _, files in groupby(partitions, key=lambda partition: partition.month):
+        parts = []
+        for partition in files:
+            with ArchiveFile(os.path.join(directory, partition.path)) as archive_file:
+                parts.append(archive_file.read(account_number))
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+        positions = _select(columns, after, from_date, to_date)
+        if len(positions):
+            values = [_to_python(name, columns[name][positions]) for name in fields]
+            yield [row_type(*row) for row in zip(*values)]
+
+
+def read_transactions(partitions, fields=COLUMNS, account_number: Optional[str] = None, after=None,
+                      from_date: Optional[datetime] = None, to_date: Optional[datetime] = None,
+                      limit: Optional[int] = None, directory: Optional[str] = None) -> list:
+    """Return up to ``limit`` archived rows in range; see ``scan``."""
+    rows = []
+    for batch in scan(partitions, fields, account_number, after, from_date, to_date, directory):
+        rows.extend(batch)
+        if limit is not None and len(rows) >= limit:
+            return rows[:limit]
+    return rows
+
+
+def partitions(db: Session, account_number: Optional[str] = None, from_date: Optional[datetime] = None,
+               to_date: Optional[datetime] = None, after=None) -> list:
+    """Catalog entries of the files that may hold rows in range, ordered by month."""
+    F = models.LedgerArchiveFile
+    stmt = select(F.month, F.path).order_by(F.month, F.first_account, F.file_id)
+    lower = max((moment for moment in (from_date, after[0] if after else None) if moment is not None), default=None)
+    if lower is not None:
+        stmt = stmt.where(F.month >= _month_start(lower))
+    if to_date is not None:
+        stmt = stmt.where(F.month <= (to_date - timedelta(microseconds=1)).date())
+    if account_number is not None:
+        stmt = stmt.where(F.first_account <= account_number, F.last_account >= account_number)
+    return db.execute(stmt).all()
+
+
+def latest_balance(db: Session, account_number: str, as_of: datetime, since: Optional[datetime] = None,
+                   directory: Optional[str] = None) -> Optional[Decimal]:
+    """Balance after the last archived row dated in ``[since, as_of]``, or None."""
+    for partition in reversed(partitions(db, account_number, since, as_of + timedelta(microseconds=1))):
+        with ArchiveFile(os.path.join(directory or ARCHIVE_DIR, partition.path)) as archive_file:
+            columns = archive_file.read(account_number)
+        positions = _select(columns, from_date=since, through=as_of)
+        if len(positions):
+            return Decimal(int(columns["balance_after_transaction"][positions[-1]]))
+    return None
+
+
+def watermark(db: Session) -> Optional[datetime]:
+    """Cutoff of the latest archive run; postings dated before it are rejected."""
+    return db.execute(select(func.max(models.LedgerArchiveRun.cutoff))).scalar_one_or_none()
+
+
+def _chunk_bounds(db: Session, after, chunk_size: int):
+    stmt = select(models.Account.account_number)\
+        .order_by(models.Account.account_number)\
+        .limit(chunk_size)
+    if after is not None:
+        stmt = stmt.where(models.Account.account_number > after)
+    numbers = db.execute(stmt).scalars().all()
+    return (numbers[0], numbers[-1]) if numbers else None
+
+
+def _month_columns(db: Session, first: str, last: str, month: date, cutoff: datetime) -> dict:
+    T = models.AccountTransaction
+    stmt = select(
+        T.transaction_id, T.account_number, T.transaction_date, T.transaction_type,
+        cast(T.transaction_amount, BigInteger), cast(T.balance_after_transaction, BigInteger), T.registration_date,
+    ).where(
+        T.account_number.between(first, last),
+        T.transaction_date >= datetime.combine(month, datetime.min.time()),
+        T.transaction_date < min(datetime.combine(_next_month(month), datetime.min.time()), cutoff),
+    ).order_by(T.account_number, T.transaction_date, T.transaction_id)
+    rows = db.execute(stmt).all()
+    if not rows:
+        return None
+    values = list(zip(*rows))
+    return {
+        "transaction_id": np.array(values[0], dtype=np.int64),
+        "account_number": list(values[1]),
+        "transaction_date": np.array(values[2], dtype="datetime64[us]"),
+        "transaction_type": np.array(values[3], dtype=np.int8),
+        "transaction_amount": np.array(values[4], dtype=np.int64),
+        "balance_after_transaction": np.array(values[5], dtype=np.int64),
+        "registration_date": np.array(values[6], dtype="datetime64[us]"),
+    }
+
+
+def _archive_chunk(db: Session, run: models.LedgerArchiveRun, first: str, last: str, directory: str,
+                   codec: str, written: list) -> int:
+    A = models.Account
+    T = models.AccountTransaction
+    cutoff = run.cutoff
+    # Locks the rows like ledger postings do
+    db.execute(
+        update(A).where(A.account_number.between(first, last))
+        .values(archived_before=cutoff)
+        .execution_options(synchronize_session=False)
+    )
+    oldest = db.execute(
+        select(func.min(T.transaction_date))
+        .where(T.account_number.between(first, last), T.transaction_date < cutoff)
+    ).scalar_one_or_none()
+    if oldest is None:
+        return 0
+
+    month = _month_start(oldest)
+    while month < cutoff.date():
+        columns = _month_columns(db, first, last, month, cutoff)
+        if columns is not None:
+            path = os.path.join(f"{month:%Y-%m}", f"{first}_{last}.r{run.run_id}.ledger")
+            write_file(os.path.join(directory, path), columns, codec)
+            written.append(os.path.join(directory, path))
+            db.add(models.LedgerArchiveFile(
+                run_id=run.run_id, month=month, first_account=first, last_account=last,
+                row_count=len(columns["account_number"]), path=path, created_at=datetime.utcnow(),
+            ))
+        month = _next_month(month)
+
+    latest = select(T.balance_after_transaction)\
+        .where(T.account_number == A.account_number, T.transaction_date < cutoff)\
+        .order_by(T.transaction_date.desc(), T.transaction_id.desc())\
+        .limit(1)\
+        .scalar_subquery()
+    db.execute(
+        update(A).where(A.account_number.between(first, last))
+        .values(archived_balance=func.coalesce(latest, A.archived_balance))
+        .execution_options(synchronize_session=False)
+    )
+    result = db.execute(
+        delete(T).where(T.account_number.between(first, last), T.transaction_date < cutoff)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def archive_ledger(db: Session, cutoff: Optional[datetime] = None, directory: Optional[str] = None,
+                   codec: str = "zlib", chunk_size: int = CHUNK_SIZE) -> models.LedgerArchiveRun:
+    """Move every ledger row dated before ``cutoff`` to archive files.
+
+    ``cutoff`` must be the first day of a month and must not be earlier
+    than the watermark; it defaults to ``default_cutoff()``. Each chunk of
+    accounts commits on its own, and rerunning the same cutoff finishes an
+    interrupted run.
+    """
+    cutoff = cutoff or default_cutoff()
+    if cutoff != datetime(cutoff.year, cutoff.month, 1):
+        raise ValueError("The archive cutoff must be the first day of a month")
+    if cutoff > datetime.utcnow():
+        raise ValueError("The archive cutoff must not be in the future")
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}")
+    previous = watermark(db)
+    if previous is not None and cutoff < previous:
+        raise ValueError("The archive cutoff cannot move back")
+    directory = directory or ARCHIVE_DIR
+
+    run = models.LedgerArchiveRun(cutoff=cutoff, started_at=datetime.utcnow())
+    db.add(run)
+    db.commit()
+
+    archived = 0
+    files = 0
+    after = None
+    while True:
+        bounds = _chunk_bounds(db, after, chunk_size)
+        if bounds is None:
+            break
+        after = bounds[1]
+        written = []
+        try:
+            archived += _archive_chunk(db, run, *bounds, directory, codec, written)
+            db.commit()
+        except BaseException:
+            db.rollback()
+            for path in written:
+                os.remove(path)
+            raise
+        files += len(written)
+
+    run.finished_at = datetime.utcnow()
+    run.rows_archived = archived
+    run.files_written = files
+    db.commit()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old ledger rows to columnar files")
+    parser.add_argument("--cutoff", type=date.fromisoformat, default=None,
+                        help=f"archive rows dated before this first day of a month "
+                             f"(default: the month {ARCHIVE_HORIZON_DAYS} days ago)")
+    parser.add_argument("--directory", default=ARCHIVE_DIR)
+    parser.add_argument("--codec", choices=CODECS, default="zlib")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        cutoff = datetime.combine(args.cutoff, datetime.min.time()) if args.cutoff else None
+        run = archive_ledger(db, cutoff, args.directory, args.codec, args.chunk_size)
+        print({"run_id": run.run_id, "cutoff": run.cutoff.isoformat(),
+               "rows_archived": run.rows_archived, "files_written": run.files_written})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
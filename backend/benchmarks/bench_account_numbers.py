@@ -0,0 +1,82 @@
+"""Account opening cost as the account table grows.
+
+Grows the account table in steps and, at each size, times allocating
+account numbers with the old ``COUNT(*) + 1000`` query and with the
+block allocator. The allocator should stay flat while the count grows
+linearly with the table.
+
+    python benchmarks/bench_account_numbers.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+import models
+import sequences
+
+
+def grow(SessionLocal, start, stop):
+    db = SessionLocal()
+    for chunk_start in range(start, stop, 50000):
+        db.execute(models.Account.__table__.insert(), [
+            dict(account_number=f"900-{n:07d}", customer_id="bench", product_code="000001",
+                 real_name_identification_number="0000000000000", customer_type=1, taxation_code="1",
+                 initial_deposit_amount=0, base_interest_rate=0, additional_interest_rate=0,
+                 applied_interest_rate=0, account_password="0000", cash_amount=0,
+                 linked_substitute_amount=0, current_balance=0, ledger_sequence=0)
+            for n in range(chunk_start, min(chunk_start + 50000, stop))
+        ])
+        db.commit()
+    db.close()
+
+
+def per_second(fn, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: temporary SQLite file)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--openings", type=int, default=200, help="numbers allocated per size")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = SessionLocal()
+    db.add(models.Customer(customer_id="bench", customer_name="Bench", customer_type=1,
+                           real_name_identification_number="0000000000000"))
+    db.add(models.Product(product_code="000001", product_name="Bench", eligible_customer_type=1,
+                          taxation_code="1", base_interest_rate=0, additional_interest_rate=0,
+                          applied_interest_rate=0))
+    db.commit()
+
+    size = 0
+    for target in sorted(args.sizes):
+        grow(SessionLocal, size, target)
+        size = target
+        count_rate = per_second(
+            lambda: sequences.format_account_number(db.execute(select(func.count()).select_from(models.Account)).scalar() + 1000),
+            args.openings,
+        )
+        allocator_rate = per_second(lambda: sequences.next_account_number(db), args.openings)
+        print(f"rows={size:<9,} count(*)/s={count_rate:>10,.0f} allocator/s={allocator_rate:>10,.0f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Batch posting versus looping single postings.
+
+Posts the same synthetic feed (e.g. a payroll run) once through
+``ledger.post_transaction`` per entry and once through
+``ledger.post_batch``, and reports entries per second for both.
+
+    python benchmarks/bench_batch.py --entries 20000 --accounts 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import ledger
+import models
+import schemas
+from bench_posting import seed
+
+
+def feed(entries, accounts):
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    return [
+        schemas.TransactionCreate(
+            account_number=f"100-{rng.randrange(accounts):07d}",
+            transaction_date=start + timedelta(seconds=i),
+            transaction_type=ledger.DEPOSIT,
+            transaction_amount=Decimal(rng.randint(1, 100000)),
+        )
+        for i in range(entries)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: temporary SQLite file)")
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--accounts", type=int, default=2000)
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    transactions = feed(args.entries, args.accounts)
+
+    seed(SessionLocal, args.accounts)
+    db = SessionLocal()
+    started = time.perf_counter()
+    for transaction in transactions:
+        ledger.post_transaction(db, transaction)
+    single = args.entries / (time.perf_counter() - started)
+    db.close()
+
+    seed(SessionLocal, args.accounts)
+    db = SessionLocal()
+    started = time.perf_counter()
+    ledger.post_batch(db, transactions)
+    batch = args.entries / (time.perf_counter() - started)
+    db.close()
+
+    print(f"single entries/s={single:,.0f}")
+    print(f"batch  entries/s={batch:,.0f} ({batch / single:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Customer search latency at a large customer count.
+
+Seeds customers with random two-part names and distinct real-name
+identification numbers, then times ``search.find_customers`` for name
+prefixes of one to four characters, three-character substrings and
+exact real-name identification numbers.
+
+    python benchmarks/bench_customer_search.py --customers 1000000
+    python benchmarks/bench_customer_search.py --url postgresql://... --customers 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import datagen
+import models
+import search
+
+BATCH = 10000
+
+
+def random_name(rng) -> str:
+    def part():
+        return rng.choice(string.ascii_uppercase) + "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8)))
+    return f"{part()} {part()}"
+
+
+def seed(SessionLocal, customers: int, rng) -> list:
+    db = SessionLocal()
+    names = []
+    for start in range(0, customers, BATCH):
+        rows = []
+        for n in range(start, min(start + BATCH, customers)):
+            name = random_name(rng)
+            names.append(name)
+            rows.append(dict(customer_id=f"c{n}", customer_name=name, customer_type=1,
+                             real_name_identification_number=f"{n:013d}"))
+        db.execute(insert(models.Customer), rows)
+        db.commit()
+    db.close()
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL; the database is emptied (default: temporary SQLite file)")
+    parser.add_argument("--customers", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=500, help="queries per kind")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    datagen.reset(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    rng = random.Random(7)
+    names = seed(SessionLocal, args.customers, rng)
+
+    kinds = {f"prefix{length}": (lambda length=length: rng.choice(names)[:length].lower()) for length in (1, 2, 4)}
+    kinds["substring3"] = lambda: (lambda name: name[rng.randint(1, len(name) - 3):][:3])(rng.choice(names))
+    kinds["real_name_id"] = lambda: f"{rng.randrange(args.customers):013d}"
+
+    db = SessionLocal()
+    for kind, query in kinds.items():
+        latencies = []
+        for _ in range(args.queries):
+            q = query()
+            started = time.perf_counter()
+            search.find_customers(db, q)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        print(f"{kind:<13} customers={args.customers} p50_ms={statistics.median(latencies):.2f} "
+              f"p99_ms={latencies[int(len(latencies) * 0.99) - 1]:.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Vectorized interest accrual versus a per-account Python loop.
+
+Seeds accounts with random balances, rates and taxation codes, then
+accrues one day of interest twice: once with ``interest.accrue_interest``
+and once with a naive loop that computes each account's interest with
+Decimal arithmetic and posts it through ``ledger.post_transaction``.
+
+    python benchmarks/bench_interest.py --accounts 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from decimal import Decimal, ROUND_DOWN
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import sessionmaker
+
+import interest
+import ledger
+import models
+import schemas
+
+
+def seed(SessionLocal, accounts):
+    rng = random.Random(7)
+    db = SessionLocal()
+    for table in (models.AccountTransaction, models.Account, models.Product, models.Customer):
+        db.execute(delete(table))
+    db.add(models.Customer(customer_id="bench", customer_name="Bench", customer_type=1,
+                           real_name_identification_number="0000000000000"))
+    db.add(models.Product(product_code="000001", product_name="Bench", eligible_customer_type=1,
+                          taxation_code="1", base_interest_rate=0, additional_interest_rate=0,
+                          applied_interest_rate=0))
+    db.flush()
+    for start in range(0, accounts, 50000):
+        rows = []
+        for n in range(start, min(start + 50000, accounts)):
+            balance = rng.randint(0, 10 ** 9)
+            rows.append(dict(
+                account_number=f"100-{n:07d}", customer_id="bench", product_code="000001",
+                real_name_identification_number="0000000000000", customer_type=1,
+                taxation_code=rng.choice("123"), initial_deposit_amount=balance,
+                base_interest_rate=0, additional_interest_rate=0,
+                applied_interest_rate=Decimal(rng.randint(0, 5000)) / 1000,
+                account_password="0000", cash_amount=balance, linked_substitute_amount=0,
+                current_balance=balance, ledger_sequence=0, interest_accrual_remainder=0,
+                account_opening_date=datetime(2024, 1, 1),
+            ))
+        db.execute(models.Account.__table__.insert(), rows)
+    db.commit()
+    db.close()
+
+
+def naive_accrual(db, accrual_date):
+    posted_at = datetime.combine(accrual_date, datetime.max.time())
+    accounts = db.execute(select(models.Account.account_number, models.Account.current_balance,
+                                 models.Account.applied_interest_rate, models.Account.taxation_code)).all()
+    for account_number, balance, rate, taxation_code in accounts:
+        gross = (Decimal(balance) * Decimal(rate) / 100 / interest.DAYS_IN_YEAR).to_integral_value(ROUND_DOWN)
+        withholding = Decimal(interest.WITHHOLDING_RATES.get(taxation_code, interest.DEFAULT_WITHHOLDING_RATE))
+        net = gross - (gross * withholding / 10000).to_integral_value(ROUND_DOWN)
+        if net > 0:
+            ledger.post_transaction(db, schemas.TransactionCreate(
+                account_number=account_number,
+                transaction_date=posted_at,
+                transaction_type=ledger.DEPOSIT,
+                transaction_amount=net,
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: temporary SQLite file)")
+    parser.add_argument("--accounts", type=int, default=200000)
+    parser.add_argument("--naive-accounts", type=int, default=5000,
+                        help="accounts for the naive loop, which is extrapolated")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    seed(SessionLocal, args.accounts)
+    db = SessionLocal()
+    started = time.perf_counter()
+    totals = interest.accrue_interest(db, date(2024, 1, 31))
+    vectorized = time.perf_counter() - started
+    db.close()
+    print(f"vectorized accounts={totals['accounts']:,} postings={totals['postings']:,} seconds={vectorized:.2f} "
+          f"accounts/s={totals['accounts'] / vectorized:,.0f}")
+
+    seed(SessionLocal, args.naive_accounts)
+    db = SessionLocal()
+    started = time.perf_counter()
+    naive_accrual(db, date(2024, 1, 31))
+    naive = time.perf_counter() - started
+    db.close()
+    rate = args.naive_accounts / naive
+    print(f"naive      accounts={args.naive_accounts:,} seconds={naive:.2f} accounts/s={rate:,.0f} "
+          f"(speedup {totals['accounts'] / vectorized / rate:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
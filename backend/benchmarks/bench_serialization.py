@@ -0,0 +1,93 @@
+"""CPU per 1000 rows of list pages: ORM and response model versus row tuples and orjson.
+
+Generates a dataset with ``datagen`` and builds the same pages of
+accounts and of a hot account's transactions twice. The first path is
+the one FastAPI takes for a ``response_model`` route: load ORM
+instances, validate each one into the schema and JSON-encode the
+result. The second is ``serialization.rows_response`` over a column
+select. Both include the query; CPU time is process time.
+
+    python benchmarks/bench_serialization.py --page 1000 --pages 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from functools import lru_cache
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import datagen
+import models
+import pagination
+import schemas
+import serialization
+
+
+@lru_cache
+def response_field(schema):
+    # FastAPI builds this once per route
+    return create_response_field(name=f"Response_{schema.__name__}", type_=List[schema])
+
+
+def orm_page(loop, db, model, schema, stmt):
+    field = response_field(schema)
+    instances = db.scalars(stmt).all()
+    content = loop.run_until_complete(serialize_response(field=field, response_content=instances))
+    return JSONResponse(content).body
+
+
+def rows_page(loop, db, model, schema, stmt):
+    columns = serialization.columns(model, schema)
+    return serialization.rows_response(schema, db.execute(stmt.with_only_columns(*columns))).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL; the database is emptied (default: temporary SQLite file)")
+    parser.add_argument("--page", type=int, default=1000, help="rows per page")
+    parser.add_argument("--pages", type=int, default=50, help="pages per endpoint and path")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    datagen.reset(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    dataset = datagen.generate(SessionLocal, customers=max(args.page, 1000), accounts=max(args.page * 2, 2000),
+                               cold_rows=args.page * 10, hot_accounts=1, hot_rows=args.page * 10)
+
+    T = models.AccountTransaction
+    pages = {
+        "accounts": (models.Account, schemas.Account, lambda n: select(models.Account)
+                     .order_by(models.Account.account_number).offset(n % 2 * args.page).limit(args.page)),
+        "transactions": (T, schemas.Transaction, lambda n: pagination.transaction_page(
+            select(T).where(T.account_number == dataset.hot_accounts[0]).offset(n % 10 * args.page),
+            None, None, None, args.page)),
+    }
+    loop = asyncio.new_event_loop()
+    db = SessionLocal()
+    for name, (model, schema, page) in pages.items():
+        bodies = {}
+        for path, build in (("orm", orm_page), ("rows", rows_page)):
+            build(loop, db, model, schema, page(0))
+            started = time.process_time()
+            for n in range(args.pages):
+                bodies[path] = build(loop, db, model, schema, page(n))
+            per_thousand = (time.process_time() - started) * 1000 / (args.pages * args.page) * 1000
+            print(f"{name:<13} {path:<5} pages={args.pages} rows/page={args.page} cpu_ms/1000 rows={per_thousand:.2f}")
+        assert bodies["orm"] == bodies["rows"], f"{name}: encoded pages differ"
+    db.close()
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
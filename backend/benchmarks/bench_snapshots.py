@@ -0,0 +1,95 @@
+"""Point-in-time balance lookups: snapshots versus a ledger scan.
+
+Seeds accounts with years of daily postings, backfills the end-of-day
+snapshots with ``snapshots.close_days`` and then answers random
+"balance of account X as of D" queries twice: with
+``snapshots.balance_as_of`` and by summing the account's signed amounts
+up to D.
+
+    python benchmarks/bench_snapshots.py --accounts 50 --days 3650
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as day_time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import case, create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+import ledger
+import models
+import snapshots
+from bench_interest import seed
+
+
+def seed_ledger(SessionLocal, start, days):
+    rng = random.Random(11)
+    db = SessionLocal()
+    numbers = db.execute(select(models.Account.account_number, models.Account.current_balance)).all()
+    for account_number, balance in numbers:
+        rows = []
+        for day in range(days):
+            amount = rng.randint(1, 10 ** 5)
+            balance += amount
+            rows.append(dict(
+                account_number=account_number, transaction_date=start + timedelta(days=day),
+                transaction_type=ledger.DEPOSIT, transaction_amount=amount, balance_after_transaction=balance,
+            ))
+        db.execute(models.AccountTransaction.__table__.insert(), rows)
+    db.commit()
+    db.close()
+    return [number for number, _ in numbers]
+
+
+def scan_balance(db, account_number, as_of):
+    T = models.AccountTransaction
+    signed = case((T.transaction_type == ledger.DEPOSIT, T.transaction_amount), else_=-T.transaction_amount)
+    opening = db.execute(select(models.Account.initial_deposit_amount)
+                         .where(models.Account.account_number == account_number)).scalar_one()
+    total = db.execute(select(func.sum(signed))
+                       .where(T.account_number == account_number, T.transaction_date <= as_of)).scalar()
+    return opening + (total or 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: temporary SQLite file)")
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    # The history ends yesterday so every seeded day can be closed
+    start = datetime.combine(date.today() - timedelta(days=args.days), day_time(9))
+    seed(SessionLocal, args.accounts)
+    numbers = seed_ledger(SessionLocal, start, args.days)
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    run = snapshots.close_days(db, backfill=True)
+    print(f"backfill   snapshots={run.snapshots_written:,} seconds={time.perf_counter() - started:.2f}")
+
+    rng = random.Random(3)
+    queries = [(rng.choice(numbers), start + timedelta(days=rng.randint(0, args.days - 1), hours=rng.randint(0, 23)))
+               for _ in range(args.lookups)]
+    for name, lookup in (("snapshot", snapshots.balance_as_of), ("scan", scan_balance)):
+        started = time.perf_counter()
+        for account_number, as_of in queries:
+            lookup(db, account_number, as_of)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<10} lookups={args.lookups:,} seconds={elapsed:.2f} lookups/s={args.lookups / elapsed:,.0f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
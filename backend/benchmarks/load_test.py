@@ -0,0 +1,131 @@
+"""HTTP load test comparing API deployments at high concurrency.
+
+Seeds a customer, a product and a set of accounts through the API of
+every target, then drives a read/write mix (account detail, transaction
+history, postings) from many concurrent clients and reports requests
+per second with p50/p99 latency per target.
+
+To compare the sync handlers with the async ones, serve the last
+revision before the async port next to the current tree against the
+same database:
+
+    git worktree add /tmp/deposit-sync <last sync revision>
+    (cd /tmp/deposit-sync/backend && uvicorn main:app --port 8001)
+    (cd backend && uvicorn main:app --port 8000)
+    python benchmarks/load_test.py --target sync=http://localhost:8001 --target async=http://localhost:8000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime
+
+import httpx
+
+
+async def seed(client, accounts):
+    customer = (await client.post("/customers/", json={
+        "customer_name": "Load Test",
+        "customer_type": 1,
+        "real_name_identification_number": "0000000000000",
+    })).json()
+    product_code = f"{random.randrange(10 ** 6):06d}"
+    await client.post("/products/", json={
+        "product_code": product_code,
+        "product_name": "Load Test",
+        "eligible_customer_type": 1,
+        "taxation_code": "1",
+        "base_interest_rate": "1.000",
+        "additional_interest_rate": "0.000",
+        "applied_interest_rate": "1.000",
+    })
+    numbers = []
+    for _ in range(accounts):
+        response = await client.post("/accounts/", json={
+            "customer_id": customer["customer_id"],
+            "product_code": product_code,
+            "real_name_identification_number": "0000000000000",
+            "customer_type": 1,
+            "taxation_code": "1",
+            "initial_deposit_amount": "1000000",
+            "base_interest_rate": "1.000",
+            "additional_interest_rate": "0.000",
+            "applied_interest_rate": "1.000",
+            "account_password": "0000",
+            "cash_amount": "1000000",
+            "linked_substitute_amount": "0",
+        })
+        numbers.append(response.json()["account_number"])
+    return numbers
+
+
+async def client_loop(client, numbers, deadline, write_ratio, latencies, errors):
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        account_number = rng.choice(numbers)
+        roll = rng.random()
+        started = time.perf_counter()
+        try:
+            if roll < write_ratio:
+                response = await client.post("/transactions/", json={
+                    "account_number": account_number,
+                    "transaction_date": datetime.utcnow().isoformat(),
+                    "transaction_type": 1,
+                    "transaction_amount": "1",
+                })
+            elif roll < (1 + write_ratio) / 2:
+                response = await client.get(f"/accounts/{account_number}")
+            else:
+                response = await client.get(f"/accounts/{account_number}/transactions/", params={"limit": 20})
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_target(name, base_url, args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        numbers = await seed(client, args.accounts)
+        latencies = []
+        errors = []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            client_loop(client, numbers, deadline, args.write_ratio, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "target": name,
+        "url": base_url,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 2),
+        "p99_ms": round(quantiles[98] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", action="append", required=True, metavar="NAME=URL")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per target")
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    for target in args.target:
+        name, _, url = target.partition("=")
+        print(json.dumps(asyncio.run(run_target(name, url, args))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Endpoint benchmark suite.
+
+For every database given, generates a synthetic dataset with
+``datagen.generate``, serves the API from a uvicorn subprocess pointed
+at it, and drives every endpoint in ``main.py`` from concurrent clients.
+Each scenario reports throughput and p50/p95/p99 latency; postings run
+against both the few hot accounts (contended, long ledgers) and the cold
+ones. SQLite runs offline; PostgreSQL is used when ``--postgres`` is
+given and reachable, and skipped otherwise. The target databases are
+emptied first.
+
+Results are written as JSON. ``--compare`` checks them against an
+earlier run and exits non-zero when a scenario's p95 latency or
+throughput regressed by more than ``--tolerance``:
+
+    python benchmarks/suite.py --output before.json
+    git checkout my-branch
+    python benchmarks/suite.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+import datagen
+
+
+@dataclass
+class Scenario:
+    name: str
+    # (context, rng) -> (method, url, request kwargs)
+    request: Callable
+    # Async (client, context) hook run before timing, e.g. creating rows to delete
+    setup: Optional[Callable] = None
+    concurrency: Optional[int] = None
+    max_requests: Optional[int] = None
+
+
+class Context:
+    def __init__(self, dataset: datagen.Dataset):
+        self.dataset = dataset
+        self.counter = 0
+        self.pools = {}
+
+    def next_id(self) -> int:
+        self.counter += 1
+        return self.counter
+
+    def take(self, pool: str):
+        return self.pools[pool].pop()
+
+
+def customer_body(n):
+    return {"customer_name": f"Suite {n}", "customer_type": 1, "real_name_identification_number": f"{n:013d}"}
+
+
+def product_body(code):
+    return {
+        "product_code": code, "product_name": "Suite", "eligible_customer_type": 1, "taxation_code": "1",
+        "base_interest_rate": "1.000", "additional_interest_rate": "0.000", "applied_interest_rate": "1.000",
+    }
+
+
+def account_body(ctx, customer_id=None):
+    return {
+        "customer_id": customer_id or random.choice(ctx.dataset.customer_ids),
+        "product_code": ctx.dataset.product_codes[0], "real_name_identification_number": "0000000000000",
+        "customer_type": 1, "taxation_code": "1", "initial_deposit_amount": "1000000",
+        "base_interest_rate": "1.000", "additional_interest_rate": "0.000", "applied_interest_rate": "1.000",
+        "account_password": "0000", "cash_amount": "1000000", "linked_substitute_amount": "0",
+    }
+
+
+def posting(account_number, amount=1, transaction_type=1, when=None):
+    return {
+        "account_number": account_number,
+        "transaction_date": (when or datetime.utcnow()).isoformat(),
+        "transaction_type": transaction_type,
+        "transaction_amount": str(amount),
+    }
+
+
+def existing_account_body(ctx, account_number):
+    fields = dict(ctx.dataset.accounts[account_number])
+    return {key: (str(value) if isinstance(value, float) else value) for key, value in fields.items()}
+
+
+async def create_pool(client, ctx, pool, count, method, url, body):
+    """Create ``count`` rows through the API and keep the ids a scenario will consume."""
+    ids = []
+    for _ in range(count):
+        response = await client.request(method, url, json=body(ctx))
+        response.raise_for_status()
+        ids.append(response.json())
+    ctx.pools[pool] = ids
+
+
+def put_account(ctx, rng):
+    account_number = rng.choice(ctx.dataset.cold_accounts)
+    return "PUT", f"/accounts/{account_number}", {"json": existing_account_body(ctx, account_number)}
+
+
+def scenarios(args):
+    hot = lambda ctx, rng: rng.choice(ctx.dataset.hot_accounts)
+    cold = lambda ctx, rng: rng.choice(ctx.dataset.cold_accounts)
+    customer = lambda ctx, rng: rng.choice(ctx.dataset.customer_ids)
+    product = lambda ctx, rng: rng.choice(ctx.dataset.product_codes)
+    as_of = lambda rng: (datetime.utcnow() - timedelta(days=rng.randint(1, 360), hours=rng.randint(0, 23))).isoformat()
+    pool_size = args.pool_size
+
+    return [
+        Scenario("POST /customers/", lambda ctx, rng: ("POST", "/customers/", {"json": customer_body(ctx.next_id())})),
+        Scenario("GET /customers/", lambda ctx, rng: ("GET", "/customers/", {"params": {"limit": 100}})),
+        Scenario("GET /customers/{customer_id}", lambda ctx, rng: ("GET", f"/customers/{customer(ctx, rng)}", {})),
+        Scenario("PUT /customers/{customer_id}", lambda ctx, rng: (
+            "PUT", f"/customers/{customer(ctx, rng)}", {"json": customer_body(ctx.next_id())})),
+        Scenario("DELETE /customers/{customer_id}",
+                 lambda ctx, rng: ("DELETE", f"/customers/{ctx.take('customers')['customer_id']}", {}),
+                 setup=lambda client, ctx: create_pool(client, ctx, "customers", pool_size, "POST", "/customers/",
+                                                       lambda ctx: customer_body(ctx.next_id())),
+                 max_requests=pool_size),
+        Scenario("GET /customers/{customer_id}/accounts",
+                 lambda ctx, rng: ("GET", f"/customers/{customer(ctx, rng)}/accounts", {})),
+        Scenario("GET /customers/{customer_id}/summary",
+                 lambda ctx, rng: ("GET", f"/customers/{customer(ctx, rng)}/summary", {})),
+
+        Scenario("POST /products/", lambda ctx, rng: (
+            "POST", "/products/", {"json": product_body(f"8{ctx.next_id():05d}")})),
+        Scenario("GET /products/", lambda ctx, rng: ("GET", "/products/", {})),
+        Scenario("GET /products/{product_code}", lambda ctx, rng: ("GET", f"/products/{product(ctx, rng)}", {})),
+        Scenario("PUT /products/{product_code}", lambda ctx, rng: (
+            "PUT", f"/products/{ctx.dataset.product_codes[-1]}", {"json": product_body(ctx.dataset.product_codes[-1])}),
+                 concurrency=1),
+        Scenario("DELETE /products/{product_code}",
+                 lambda ctx, rng: ("DELETE", f"/products/{ctx.take('products')['product_code']}", {}),
+                 setup=lambda client, ctx: create_pool(client, ctx, "products", pool_size, "POST", "/products/",
+                                                       lambda ctx: product_body(f"7{ctx.next_id():05d}")),
+                 max_requests=pool_size),
+
+        Scenario("POST /accounts/", lambda ctx, rng: ("POST", "/accounts/", {"json": account_body(ctx)})),
+        Scenario("GET /accounts/", lambda ctx, rng: ("GET", "/accounts/", {"params": {"limit": 100}})),
+        Scenario("GET /accounts/{account_number}", lambda ctx, rng: ("GET", f"/accounts/{cold(ctx, rng)}", {})),
+        Scenario("GET /accounts/{account_number}/balance [hot]", lambda ctx, rng: (
+            "GET", f"/accounts/{hot(ctx, rng)}/balance", {"params": {"as_of": as_of(rng)}})),
+        Scenario("GET /accounts/{account_number}/balance [cold]", lambda ctx, rng: (
+            "GET", f"/accounts/{cold(ctx, rng)}/balance", {"params": {"as_of": as_of(rng)}})),
+        Scenario("PUT /accounts/{account_number}", put_account),
+        Scenario("DELETE /accounts/{account_number}",
+                 lambda ctx, rng: ("DELETE", f"/accounts/{ctx.take('accounts')['account_number']}", {}),
+                 setup=lambda client, ctx: create_pool(client, ctx, "accounts", pool_size, "POST", "/accounts/",
+                                                       account_body),
+                 max_requests=pool_size),
+
+        Scenario("POST /transactions/ [hot]", lambda ctx, rng: (
+            "POST", "/transactions/", {"json": posting(hot(ctx, rng))})),
+        Scenario("POST /transactions/ [cold]", lambda ctx, rng: (
+            "POST", "/transactions/", {"json": posting(cold(ctx, rng))})),
+        Scenario("POST /transactions/ [idempotent retry]", lambda ctx, rng: (
+            "POST", "/transactions/", {"json": posting(ctx.dataset.cold_accounts[0], when=datetime(2099, 1, 1)),
+                                       "headers": {"Idempotency-Key": "suite-retry"}})),
+        Scenario("POST /transactions/batch", lambda ctx, rng: (
+            "POST", "/transactions/batch", {"json": [posting(cold(ctx, rng)) for _ in range(100)]})),
+        Scenario("GET /transactions/", lambda ctx, rng: ("GET", "/transactions/", {"params": {"limit": 100}})),
+        Scenario("GET /accounts/{account_number}/transactions/ [hot]", lambda ctx, rng: (
+            "GET", f"/accounts/{hot(ctx, rng)}/transactions/",
+            {"params": {"limit": 100, "from": as_of(rng)}})),
+        Scenario("GET /accounts/{account_number}/transactions/ [cold]", lambda ctx, rng: (
+            "GET", f"/accounts/{cold(ctx, rng)}/transactions/", {"params": {"limit": 100}})),
+        Scenario("GET /accounts/{account_number}/statement", lambda ctx, rng: (
+            "GET", f"/accounts/{cold(ctx, rng)}/statement", {"headers": {"Accept-Encoding": "gzip"}})),
+        Scenario("DELETE /transactions/{transaction_id}",
+                 lambda ctx, rng: ("DELETE", f"/transactions/{ctx.take('transactions')['transaction_id']}", {}),
+                 setup=lambda client, ctx: create_pool(client, ctx, "transactions", pool_size, "POST",
+                                                       "/transactions/",
+                                                       lambda ctx: posting(random.choice(ctx.dataset.cold_accounts))),
+                 max_requests=pool_size),
+
+        Scenario("POST /reconciliation/", lambda ctx, rng: (
+            "POST", "/reconciliation/", {"params": {"incremental": "true"}}), concurrency=1, max_requests=3),
+        Scenario("GET /health/pool", lambda ctx, rng: ("GET", "/health/pool", {})),
+        Scenario("GET /health/cache", lambda ctx, rng: ("GET", "/health/cache", {})),
+    ]
+
+
+def latency_summary(latencies, elapsed):
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 2),
+        "p95_ms": round(quantiles[94] * 1000, 2),
+        "p99_ms": round(quantiles[98] * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+async def run_scenario(client, ctx, scenario, args):
+    if scenario.setup is not None:
+        await scenario.setup(client, ctx)
+    concurrency = scenario.concurrency or args.concurrency
+    budget = scenario.max_requests or args.max_requests
+    latencies = []
+    errors = []
+    issued = 0
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(seed):
+        nonlocal issued
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline and issued < budget:
+            issued += 1
+            method, url, kwargs = scenario.request(ctx, rng)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                await response.aread()
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(args.seed * 1000 + i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    result = {"scenario": scenario.name, "concurrency": concurrency, "errors": len(errors)}
+    result.update(latency_summary(latencies, elapsed))
+    return result
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(url: str, port: int):
+    env = dict(os.environ, DATABASE_URL=url)
+    env.pop("DATABASE_REPLICA_URL", None)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+async def wait_until_ready(client, server, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode}")
+        try:
+            if (await client.get("/health/pool")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+async def run_database(name, url, dataset, args, selected):
+    port = free_port()
+    server = start_server(url, port)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120) as client:
+            await wait_until_ready(client, server)
+            ctx = Context(dataset)
+            results = []
+            for scenario in selected:
+                result = await run_scenario(client, ctx, scenario, args)
+                result["database"] = name
+                print(json.dumps(result), flush=True)
+                results.append(result)
+            return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def reachable(url: str) -> Optional[str]:
+    """Return None when ``url`` accepts connections, else the reason it does not."""
+    try:
+        with create_engine(url).connect():
+            return None
+    except Exception as e:
+        return str(e).splitlines()[0]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Return the scenarios that got slower than ``baseline`` by more than ``tolerance``."""
+    previous = {(r["database"], r["scenario"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["database"], result["scenario"]))
+        if before is None:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append({"database": result["database"], "scenario": result["scenario"],
+                                "metric": "p95_ms", "before": before["p95_ms"], "after": result["p95_ms"]})
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append({"database": result["database"], "scenario": result["scenario"],
+                                "metric": "throughput_rps", "before": before["throughput_rps"],
+                                "after": result["throughput_rps"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sqlite", default=None, help="SQLite file to use (default: temporary file)")
+    parser.add_argument("--postgres", default=os.getenv("BENCH_POSTGRES_URL"),
+                        help="PostgreSQL URL of a dedicated benchmark database (default: $BENCH_POSTGRES_URL)")
+    parser.add_argument("--scale", choices=datagen.SCALES, default="small")
+    parser.add_argument("--scenario", action="append", help="only run scenarios whose name contains this")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--max-requests", type=int, default=100000, help="requests per scenario")
+    parser.add_argument("--pool-size", type=int, default=200, help="rows created for each delete scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="earlier results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    databases = [("sqlite", f"sqlite:///{args.sqlite or os.path.join(tempfile.mkdtemp(), 'suite.db')}")]
+    skipped = {}
+    if args.postgres:
+        reason = reachable(args.postgres)
+        if reason is None:
+            databases.append(("postgresql", args.postgres))
+        else:
+            skipped["postgresql"] = reason
+            print(f"skipping postgresql: {reason}", file=sys.stderr)
+
+    selected = [s for s in scenarios(args) if not args.scenario or any(part in s.name for part in args.scenario)]
+    random.seed(args.seed)
+    results = []
+    for name, url in databases:
+        engine = create_engine(url)
+        datagen.reset(engine)
+        started = time.perf_counter()
+        dataset = datagen.generate(sessionmaker(bind=engine), seed=args.seed, **datagen.SCALES[args.scale])
+        engine.dispose()
+        print(f"{name}: generated {dataset.rows:,} transactions in {time.perf_counter() - started:.1f}s",
+              file=sys.stderr)
+        results.extend(asyncio.run(run_database(name, url, dataset, args, selected)))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "seed": args.seed,
+            "databases": {name: make_url(url).render_as_string() for name, url in databases},
+            "skipped": skipped,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(json.dumps(regression), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
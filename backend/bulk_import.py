@@ -0,0 +1,274 @@
+"""Bulk import of customers, products and accounts.
+
+Input is CSV with a header row or NDJSON, one record per line, read as a
+stream. Records are validated with the ``schemas`` create models in
+chunks of ``CHUNK_SIZE``. For each chunk, existing keys and the
+referenced customers and products are looked up with one IN query each,
+account numbers are reserved in blocks, and the valid rows are written
+with one multi-row INSERT before the chunk commits. Invalid rows are
+rejected individually and never abort the import.
+
+Every record gets one result line, ``{"index", "status", "id"}`` when
+created or ``{"index", "status", "detail"}`` when rejected, where
+``index`` counts data rows from 0. ``POST /import/{entity}`` streams
+the result lines back and reports the totals in the ``X-Import-Created``
+and ``X-Import-Rejected`` headers. Only one chunk is held at a time, so
+memory does not depend on the input size.
+
+Customers may carry their own ``customer_id``, for example the id from
+the migrated system, so that an accounts file can reference them; a
+UUID is generated otherwise. CSV rows must not contain line breaks and
+empty CSV fields are treated as missing.
+
+    python bulk_import.py customers customers.csv > customers.results.ndjson
+    python bulk_import.py accounts accounts.ndjson --format ndjson
+"""
+import argparse
+import csv
+import json
+import sys
+import uuid
+from typing import Optional
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+import sequences
+
+CREATED_HEADER = "X-Import-Created"
+REJECTED_HEADER = "X-Import-Rejected"
+
+CHUNK_SIZE = 5000
+MAX_CUSTOMER_ID_LENGTH = 36
+
+FORMATS = ("csv", "ndjson")
+
+
+def _created(key) -> dict:
+    return {"status": "created", "id": key}
+
+
+def _rejected(detail: str) -> dict:
+    return {"status": "rejected", "detail": detail}
+
+
+def _validate(items, schema, results) -> list:
+    """Return ``(position, model)`` for each valid item; rejected items get their result."""
+    valid = []
+    for position, item in enumerate(items):
+        if isinstance(item, Exception):
+            results[position] = _rejected(str(item))
+            continue
+        try:
+            valid.append((position, schema(**item)))
+        except ValidationError as e:
+            results[position] = _rejected(str(e))
+    return valid
+
+
+def _existing(db: Session, column, keys) -> set:
+    if not keys:
+        return set()
+    return set(db.execute(select(column).where(column.in_(keys))).scalars())
+
+
+def import_customers(db: Session, items) -> list:
+    results = [None] * len(items)
+    candidates = []
+    for position, customer in _validate(items, schemas.CustomerCreate, results):
+        customer_id = items[position].get("customer_id") or str(uuid.uuid4())
+        if not isinstance(customer_id, str) or len(customer_id) > MAX_CUSTOMER_ID_LENGTH:
+            results[position] = _rejected("Invalid customer_id")
+            continue
+        candidates.append((position, customer_id, customer))
+
+    taken = _existing(db, models.Customer.customer_id, [customer_id for _, customer_id, _ in candidates])
+    rows = []
+    for position, customer_id, customer in candidates:
+        if customer_id in taken:
+            results[position] = _rejected("Customer already exists")
+            continue
+        taken.add(customer_id)
+        rows.append(dict(customer.model_dump(), customer_id=customer_id))
+        results[position] = _created(customer_id)
+    if rows:
+        db.execute(insert(models.Customer), rows)
+    return results
+
+
+def import_products(db: Session, items) -> list:
+    results = [None] * len(items)
+    valid = _validate(items, schemas.ProductCreate, results)
+
+    taken = _existing(db, models.Product.product_code, [product.product_code for _, product in valid])
+    rows = []
+    for position, product in valid:
+        if product.product_code in taken:
+            results[position] = _rejected("Product already exists")
+            continue
+        taken.add(product.product_code)
+        rows.append(product.model_dump())
+        results[position] = _created(product.product_code)
+    if rows:
+        db.execute(insert(models.Product), rows)
+    return results
+
+
+def import_accounts(db: Session, items) -> list:
+    results = [None] * len(items)
+    valid = _validate(items, schemas.AccountCreate, results)
+
+    customers = _existing(db, models.Customer.customer_id, list({account.customer_id for _, account in valid}))
+    products = _existing(db, models.Product.product_code, list({account.product_code for _, account in valid}))
+    accepted = []
+    for position, account in valid:
+        if account.customer_id not in customers:
+            results[position] = _rejected("Customer not found")
+        elif account.product_code not in products:
+            results[position] = _rejected("Product not found")
+        else:
+            accepted.append((position, account))
+
+    numbers = sequences.account_numbers.reserve(db, len(accepted)) if accepted else []
+    rows = []
+    for (position, account), value in zip(accepted, numbers):
+        account_number = sequences.format_account_number(value)
+        rows.append(dict(account.model_dump(), account_number=account_number,
+                         current_balance=account.initial_deposit_amount, ledger_sequence=0))
+        results[position] = _created(account_number)
+    if rows:
+        db.execute(insert(models.Account), rows)
+    return results
+
+
+IMPORTERS = {
+    "customers": import_customers,
+    "products": import_products,
+    "accounts": import_accounts,
+}
+
+
+class Importer:
+    """Collect input lines into chunks and import them one chunk at a time."""
+
+    def __init__(self, entity: str, format: str, chunk_size: Optional[int] = None):
+        if entity not in IMPORTERS:
+            raise ValueError(f"Unknown entity {entity!r}")
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format!r}")
+        self.entity = entity
+        self.format = format
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self.header = None
+        self.pending = []
+        self.next_index = 0
+        self.created = 0
+        self.rejected = 0
+
+    def add(self, line: bytes) -> bool:
+        """Queue one input line; return True once a chunk is ready for ``flush``."""
+        try:
+            text = line.decode("utf-8").rstrip("\r\n")
+        except UnicodeDecodeError as e:
+            if self.format == "csv" and self.header is None:
+                raise ValueError("CSV header is not valid UTF-8")
+            self.pending.append(ValueError(f"Invalid UTF-8: {e}"))
+            return len(self.pending) >= self.chunk_size
+        if not text.strip():
+            return False
+        if self.format == "csv" and self.header is None:
+            self.header = next(csv.reader([text.lstrip("\ufeff")]))
+            return False
+        self.pending.append(self._parse(text))
+        return len(self.pending) >= self.chunk_size
+
+    def _parse(self, text: str):
+        if self.format == "ndjson":
+            try:
+                item = json.loads(text)
+            except ValueError as e:
+                return e
+            return item if isinstance(item, dict) else ValueError("Record must be a JSON object")
+        values = next(csv.reader([text]))
+        if len(values) != len(self.header):
+            return ValueError(f"Expected {len(self.header)} columns, got {len(values)}")
+        return {name: value for name, value in zip(self.header, values) if value != ""}
+
+    def flush(self, db: Session) -> bytes:
+        """Import the queued chunk and return its results as NDJSON lines."""
+        items, self.pending = self.pending, []
+        if not items:
+            return b""
+        try:
+            results = IMPORTERS[self.entity](db, items)
+            db.commit()
+        except IntegrityError:
+            # A concurrent writer took one of the keys after the lookup;
+            # the second pass sees it and rejects that row
+            db.rollback()
+            try:
+                results = IMPORTERS[self.entity](db, items)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        except Exception:
+            db.rollback()
+            raise
+
+        lines = []
+        for result in results:
+            if result["status"] == "created":
+                self.created += 1
+            else:
+                self.rejected += 1
+            lines.append(orjson.dumps({"index": self.next_index, **result}))
+            self.next_index += 1
+        lines.append(b"")
+        return b"\n".join(lines)
+
+
+async def aiter_lines(chunks):
+    """Split an async stream of byte chunks into lines."""
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import customers, products or accounts")
+    parser.add_argument("entity", choices=IMPORTERS)
+    parser.add_argument("path", help="CSV or NDJSON file, - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension, else ndjson")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    importer = Importer(args.entity, format, args.chunk_size)
+
+    from database import SessionLocal
+    db = SessionLocal()
+    source = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    try:
+        for line in source:
+            if importer.add(line):
+                sys.stdout.buffer.write(importer.flush(db))
+        sys.stdout.buffer.write(importer.flush(db))
+    finally:
+        source.close()
+        db.close()
+    print(json.dumps({"created": importer.created, "rejected": importer.rejected}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""In-process read-through caches for the product catalog and customers.
+
+Entries are immutable schema snapshots, never ORM instances, so they can
+be shared across sessions and requests. Each cache is a size-bounded LRU
+whose entries also expire after a TTL, which bounds staleness from
+writes made by other processes. Local writes invalidate immediately and
+notify any registered listeners, which is the hook for propagating
+invalidations to other workers (e.g. Redis pub/sub or LISTEN/NOTIFY);
+messages received from other workers are applied with
+``apply_remote_invalidation``.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS,
+                 clock=time.monotonic):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None when absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None, notify: bool = True):
+        """Drop ``key``, or every entry when ``key`` is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        if notify:
+            for listener in _listeners:
+                listener(self.name, key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_caches = {}
+_listeners = []
+
+
+def register_cache(cache: TTLCache) -> TTLCache:
+    _caches[cache.name] = cache
+    return cache
+
+
+def register_invalidation_listener(listener):
+    """Call ``listener(cache_name, key)`` after every local invalidation."""
+    _listeners.append(listener)
+
+
+def apply_remote_invalidation(cache_name: str, key=None):
+    """Apply an invalidation published by another process without re-publishing it."""
+    cache = _caches.get(cache_name)
+    if cache is not None:
+        cache.invalidate(key, notify=False)
+
+
+def clear_all():
+    for cache in _caches.values():
+        cache.invalidate(notify=False)
+
+
+def all_stats() -> dict:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+products = register_cache(TTLCache("products"))
+product_lists = register_cache(TTLCache("product_lists", maxsize=64))
+customers = register_cache(TTLCache("customers"))
@@ -0,0 +1,132 @@
+"""Response compression negotiated from ``Accept-Encoding``.
+
+Brotli is preferred when the optional ``brotli`` package is installed.
+Otherwise gzip is used. A body is compressed once it reaches
+``COMPRESSION_MINIMUM_SIZE`` bytes. Smaller bodies, such as 304s and
+single resources, are sent as they are.
+
+Starlette's ``GZipMiddleware`` buffers the whole response, which would
+stall server-sent events. This middleware instead compresses a streaming
+response chunk by chunk and flushes after every chunk. The following
+responses pass through unchanged:
+
+- responses that already carry a ``Content-Encoding``, such as the
+  statement export, which gzips itself;
+- ``text/event-stream`` responses;
+- 204 and 304 responses, which have no body.
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+def negotiate(accept_encoding: str):
+    """Return the encoding to use for ``accept_encoding``, or None."""
+    offered = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip()] = quality
+    for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH if more else zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + (self._compressor.flush() if more else self._compressor.finish())
+
+
+CODECS = {"gzip": _Gzip, "br": _Brotli}
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        codec = None
+
+        async def send_compressed(message):
+            nonlocal start, codec
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk decides the encoding
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(scope=start)
+                if self._compressible(start["status"], headers, body, more):
+                    codec = CODECS[encoding]()
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if more:
+                        del headers["content-length"]
+                    else:
+                        body = codec.compress(body, more=False)
+                        headers["Content-Length"] = str(len(body))
+                elif start["status"] not in (204, 304) and "content-encoding" not in headers:
+                    headers.add_vary_header("Accept-Encoding")
+                await send(start)
+                start = None
+                if codec is not None and not more:
+                    await send({"type": "http.response.body", "body": body})
+                    return
+            if codec is None:
+                await send(message)
+            else:
+                await send({"type": "http.response.body", "body": codec.compress(body, more), "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _compressible(self, status: int, headers: MutableHeaders, body: bytes, more: bool) -> bool:
+        if status in (204, 304) or "content-encoding" in headers:
+            return False
+        if headers.get("content-type", "").split(";")[0].strip() in UNCOMPRESSED_TYPES:
+            return False
+        # A stream's size is unknown up front, so it is always compressed
+        return more or len(body) >= self.minimum_size
@@ -0,0 +1,90 @@
+"""Conditional GET for read endpoints.
+
+Each endpoint derives the version of what it serves from one cheap
+query: a primary-key lookup or an index-only MAX. It hashes that
+version with the request's query string into a weak ETag. A request
+whose ``If-None-Match`` holds the current tag gets an empty 304 and
+skips the full read.
+
+Single resources are versioned by their ``last_modified_date``. Accounts
+are also versioned by their ``ledger_sequence``. Lists are versioned as
+follows:
+
+- The product list uses the product count and the latest
+  ``last_modified_date``.
+- An account's transactions use the account's own version, since every
+  posting, delete, rebalance and archival updates the account row.
+- The full ledger uses the latest account ``last_modified_date`` and the
+  highest transaction id.
+
+The tag of a 200 is computed from the version of the content served, so
+a stale cache entry is never confirmed by a 304. Responses carry
+``Cache-Control: no-cache``, so browsers revalidate on every request
+instead of reusing an entry unchecked. The tags are weak because the
+body may be compressed on the way out.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+ETAG_HEADER = "ETag"
+CACHE_CONTROL = "no-cache"
+
+
+def etag(*parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def request_etag(request: Request, *version) -> str:
+    """Tag of ``version`` as served for this path and query string."""
+    return etag(request.url.path, request.url.query, *version)
+
+
+def matches(request: Request, tag: str) -> bool:
+    """Whether ``If-None-Match`` holds ``tag``, compared weakly."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    opaque = tag.removeprefix("W/")
+    return any(candidate.strip() == "*" or candidate.strip().removeprefix("W/") == opaque
+               for candidate in header.split(","))
+
+
+def headers(tag: str) -> dict:
+    return {ETAG_HEADER: tag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=304, headers=headers(tag))
+
+
+async def customer_version(db: AsyncSession, customer_id: str) -> Optional[tuple]:
+    C = models.Customer
+    return (await db.execute(select(C.last_modified_date).where(C.customer_id == customer_id))).one_or_none()
+
+
+async def account_version(db: AsyncSession, account_number: str) -> Optional[tuple]:
+    A = models.Account
+    return (await db.execute(
+        select(A.last_modified_date, A.ledger_sequence).where(A.account_number == account_number)
+    )).one_or_none()
+
+
+async def product_list_version(db: AsyncSession) -> tuple:
+    P = models.Product
+    return tuple((await db.execute(select(func.count(), func.max(P.last_modified_date)))).one())
+
+
+async def ledger_version(db: AsyncSession) -> tuple:
+    A = models.Account
+    T = models.AccountTransaction
+    return (
+        await db.scalar(select(func.max(A.last_modified_date))),
+        await db.scalar(select(func.max(T.transaction_id))),
+    )
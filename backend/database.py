@@ -1,9 +1,13 @@
 from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+# The one declarative base; importing it from here keeps older imports working
+from models import Base  # noqa: F401
+
 load_dotenv()
 
 POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
@@ -12,16 +16,105 @@ POSTGRES_DB = os.getenv("POSTGRES_DB", "deposit")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+SQLALCHEMY_DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}",
+)
+# Optional read replica for read-only endpoints
+SQLALCHEMY_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# Connection pool settings, per engine and per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Connections GET /ready opens on each engine when a worker warms up
+DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", "1"))
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_url(url: str):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+def sync_url(url) -> str:
+    """Inverse of async_url, rendered with the password for use in worker processes."""
+    url = make_url(url)
+    if url.drivername in ASYNC_DRIVERS.values():
+        url = url.set(drivername=url.get_backend_name())
+    return url.render_as_string(hide_password=False)
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool and connection options for ``url`` from the DB_* environment settings."""
+    url = make_url(url)
+    if url.get_backend_name() != "postgresql":
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS:
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+# Sync engine for batch jobs and scripts
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
+# Async engine for the API; handlers never block the event loop on the database
+async_engine = create_async_engine(
+    async_url(SQLALCHEMY_DATABASE_URL),
+    **engine_options(SQLALCHEMY_DATABASE_URL, is_async=True),
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# Read-only endpoints go to the replica when one is configured
+if SQLALCHEMY_REPLICA_URL:
+    read_async_engine = create_async_engine(
+        async_url(SQLALCHEMY_REPLICA_URL),
+        **engine_options(SQLALCHEMY_REPLICA_URL, is_async=True),
+    )
+else:
+    read_async_engine = async_engine
+ReadAsyncSessionLocal = async_sessionmaker(bind=read_async_engine, autoflush=False, expire_on_commit=False)
 
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db():
+    async with ReadAsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def pool_status(pool) -> dict:
+    """Utilization counters of a connection pool, where the pool keeps them."""
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        counter = getattr(pool, name, None)
+        if counter is not None:
+            stats[name] = counter()
+    return stats
+
+def engine_pool_status() -> dict:
+    status = {"primary": pool_status(async_engine.pool), "sync": pool_status(engine.pool)}
+    if read_async_engine is not async_engine:
+        status["replica"] = pool_status(read_async_engine.pool)
+    return status
@@ -0,0 +1,252 @@
+"""Server-sent events for account activity.
+
+``hub`` is an in-process publish/subscribe hub keyed by account number.
+The posting endpoints publish after they commit, and only when someone
+is subscribed to the account, so postings nobody watches pay nothing.
+There are three event types:
+
+- ``transaction`` carries a new ledger row and has the transaction id
+  as its SSE id.
+- ``deleted`` carries the id of a removed row.
+- ``balance`` carries the account's current balance and ledger
+  sequence after every change.
+
+Each subscriber has a bounded queue. Publishers never wait on it: a
+subscriber that falls behind has its queue dropped and is told to
+resync, and it then reads the rows it missed from the database. A
+client that reconnects with ``Last-Event-ID`` resumes the same way.
+Postings made by other worker processes or by batch jobs never reach
+this hub, so an idle stream also catches up from the database at every
+heartbeat.
+
+Resuming goes by transaction id, which is assigned at insert. A posting
+that commits after a higher id was already delivered is therefore only
+seen live, not on resume, but the ``balance`` event that follows it is
+always current. Deletions are not replayed on resume.
+"""
+import asyncio
+import os
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Optional
+
+import orjson
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import schemas
+import serialization
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+MAX_STREAM_ACCOUNTS = 100
+
+# Rows read per query when catching up from the database
+CATCH_UP_PAGE_SIZE = 500
+# Delivered ids remembered to drop duplicates between catch-up and live events
+RECENT_IDS = 4096
+# Reconnect delay suggested to EventSource clients, in milliseconds
+RETRY_MS = 3000
+
+
+@dataclass(frozen=True)
+class Event:
+    name: str
+    data: bytes
+    id: Optional[int] = None
+
+    def frame(self) -> bytes:
+        head = f"event: {self.name}\n"
+        if self.id is not None:
+            head += f"id: {self.id}\n"
+        return head.encode() + b"data: " + self.data + b"\n\n"
+
+
+def transaction_event(row) -> Event:
+    return Event("transaction", serialization.encode_row(schemas.Transaction, row), row.transaction_id)
+
+
+def balance_event(account_number: str, current_balance, ledger_sequence: int) -> Event:
+    data = orjson.dumps({"account_number": account_number, "current_balance": str(current_balance),
+                         "ledger_sequence": ledger_sequence})
+    return Event("balance", data)
+
+
+def deleted_event(account_number: str, transaction_id: int) -> Event:
+    return Event("deleted", orjson.dumps({"account_number": account_number, "transaction_id": transaction_id}))
+
+
+# Queued in place of the dropped events of a subscriber that fell behind
+RESYNC = Event("resync", b"{}")
+
+
+class Subscription:
+    def __init__(self, account_numbers, maxsize: int):
+        self.account_numbers = frozenset(account_numbers)
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, event: Event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class Hub:
+    """Fan events out to the subscriptions of each account; event loop only."""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, account_numbers) -> Subscription:
+        subscription = Subscription(account_numbers, self.queue_size)
+        for account_number in subscription.account_numbers:
+            self._subscriptions[account_number].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for account_number in subscription.account_numbers:
+            subscriptions = self._subscriptions.get(account_number)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[account_number]
+
+    def watched(self, account_numbers) -> list:
+        return [account_number for account_number in account_numbers if account_number in self._subscriptions]
+
+    def publish(self, account_number: str, event: Event):
+        for subscription in list(self._subscriptions.get(account_number, ())):
+            subscription.offer(event)
+
+    def stats(self) -> dict:
+        subscriptions = set().union(*self._subscriptions.values()) if self._subscriptions else set()
+        return {
+            "accounts": len(self._subscriptions),
+            "subscriptions": len(subscriptions),
+            "queued": sum(subscription.queue.qsize() for subscription in subscriptions),
+        }
+
+
+hub = Hub()
+
+
+async def publish_activity(db: AsyncSession, account_numbers, transaction_ids=(), deleted=()):
+    """Publish committed changes to the accounts' subscribers.
+
+    ``deleted`` holds ``(account_number, transaction_id)`` pairs. The new
+    rows and balances are read back only for watched accounts.
+    """
+    watched = hub.watched(set(account_numbers))
+    if not watched:
+        return
+    T = models.AccountTransaction
+    A = models.Account
+    if transaction_ids:
+        rows = await db.execute(
+            select(*serialization.columns(T, schemas.Transaction))
+            .where(T.transaction_id.in_(transaction_ids), T.account_number.in_(watched))
+            .order_by(T.transaction_id)
+        )
+        for row in rows:
+            hub.publish(row.account_number, transaction_event(row))
+    for account_number, transaction_id in deleted:
+        hub.publish(account_number, deleted_event(account_number, transaction_id))
+    balances = await db.execute(
+        select(A.account_number, A.current_balance, A.ledger_sequence).where(A.account_number.in_(watched))
+    )
+    for account_number, current_balance, ledger_sequence in balances:
+        hub.publish(account_number, balance_event(account_number, current_balance, ledger_sequence))
+
+
+async def latest_transaction_id(db: AsyncSession) -> int:
+    T = models.AccountTransaction
+    return await db.scalar(select(func.coalesce(func.max(T.transaction_id), 0)))
+
+
+class AccountStream:
+    """SSE frames for one subscription: missed rows after ``last_id``, balances, then live events."""
+
+    def __init__(self, db: AsyncSession, subscription: Subscription, last_id: int,
+                 heartbeat: float = EVENT_HEARTBEAT_SECONDS):
+        self.db = db
+        self.subscription = subscription
+        self.last_id = last_id
+        self.heartbeat = heartbeat
+        self._recent = deque(maxlen=RECENT_IDS)
+        self._recent_ids = set()
+
+    def _deliver(self, event: Event) -> bool:
+        """Record a transaction event as delivered; False when it already was."""
+        if event.id is None:
+            return True
+        if event.id in self._recent_ids:
+            return False
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_ids.discard(self._recent[0])
+        self._recent.append(event.id)
+        self._recent_ids.add(event.id)
+        self.last_id = max(self.last_id, event.id)
+        return True
+
+    async def catch_up(self, balances: bool = False):
+        """Yield the rows committed after ``last_id``, then the balances if any arrived."""
+        T = models.AccountTransaction
+        A = models.Account
+        accounts = self.subscription.account_numbers
+        try:
+            while True:
+                rows = (await self.db.execute(
+                    select(*serialization.columns(T, schemas.Transaction))
+                    .where(T.account_number.in_(accounts), T.transaction_id > self.last_id)
+                    .order_by(T.transaction_id)
+                    .limit(CATCH_UP_PAGE_SIZE)
+                )).all()
+                for row in rows:
+                    event = transaction_event(row)
+                    if self._deliver(event):
+                        balances = True
+                        yield event.frame()
+                if len(rows) < CATCH_UP_PAGE_SIZE:
+                    break
+            if balances:
+                result = await self.db.execute(
+                    select(A.account_number, A.current_balance, A.ledger_sequence)
+                    .where(A.account_number.in_(accounts))
+                    .order_by(A.account_number)
+                )
+                for row in result.all():
+                    yield balance_event(*row).frame()
+        finally:
+            # Hand the connection back to the pool while the stream idles
+            await self.db.rollback()
+
+    async def frames(self):
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            async for frame in self.catch_up(balances=True):
+                yield frame
+            while True:
+                try:
+                    event = await asyncio.wait_for(self.subscription.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    async for frame in self.catch_up():
+                        yield frame
+                    continue
+                if event is RESYNC:
+                    self.subscription.overflowed = False
+                    async for frame in self.catch_up(balances=True):
+                        yield frame
+                elif self._deliver(event):
+                    yield event.frame()
+        finally:
+            hub.unsubscribe(self.subscription)
@@ -0,0 +1,191 @@
+"""Idempotency keys for create endpoints.
+
+A request carrying an ``Idempotency-Key`` header runs its handler once;
+retries with the same key get the stored response back, marked with
+``Idempotent-Replayed: true``, without touching the posting logic.
+Responses are kept in a size-bounded TTL cache keyed by
+``(method and path, key)``, so lookups are a dict access.
+
+Concurrent duplicates in one process wait on the first request's
+in-flight future instead of running the handler again, so retry storms
+collapse into one database call per key. With
+``IDEMPOTENCY_STORE=database`` keys are also claimed in the
+``idempotency_key`` table before the handler runs, which extends the
+guarantee across worker processes; a duplicate arriving while another
+process still holds the claim gets ``IdempotencyInProgressError``.
+A claim is a lease of ``IDEMPOTENCY_LEASE_SECONDS``, not the full TTL,
+so a retry takes over the key of a worker that died mid-request. Handlers
+that write in their own transaction, like postings, store the response
+with ``record`` before they commit, so the write and its stored response
+cannot diverge; a retry after that commit replays instead of re-posting.
+
+Failed handlers release the key, so only successful responses replay. A
+key reused with a different request body raises
+``IdempotencyConflictError``.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import cache
+import models
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "memory")  # memory, database
+# How long a database claim blocks retries before they may take it over
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+
+# Expired database keys are purged at most this often per process
+PURGE_INTERVAL_SECONDS = 60
+
+
+class IdempotencyError(Exception):
+    """Base class for requests refused by the key store."""
+
+
+class IdempotencyConflictError(IdempotencyError):
+    pass
+
+
+class IdempotencyInProgressError(IdempotencyError):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    body: bytes
+
+
+def fingerprint(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class KeyStore:
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_SECONDS, maxsize: int = IDEMPOTENCY_MAX_KEYS,
+                 use_database: bool = IDEMPOTENCY_STORE == "database", clock=time.monotonic,
+                 lease: float = IDEMPOTENCY_LEASE_SECONDS):
+        self.ttl = ttl
+        self.lease = lease
+        self.use_database = use_database
+        self.responses = cache.register_cache(cache.TTLCache("idempotency_keys", maxsize, ttl, clock))
+        self._in_flight = {}
+        self._purged_at = None
+
+    async def run(self, db: AsyncSession, scope: str, key: str, request_fingerprint: str, handler):
+        """Return ``(StoredResponse, replayed)`` for a keyed request.
+
+        ``handler`` is an async callable returning ``(status_code, body)``;
+        it runs at most once per key while the response is retained.
+        """
+        store_key = (scope, key)
+        while True:
+            stored = self.responses.get(store_key)
+            if stored is not None:
+                return self._replay(stored, request_fingerprint), True
+            pending = self._in_flight.get(store_key)
+            if pending is None:
+                break
+            await asyncio.shield(pending)
+
+        done = asyncio.get_running_loop().create_future()
+        self._in_flight[store_key] = done
+        try:
+            if self.use_database:
+                stored = await self._claim(db, scope, key, request_fingerprint)
+                if stored is not None:
+                    self.responses.set(store_key, stored)
+                    return self._replay(stored, request_fingerprint), True
+            try:
+                status_code, body = await handler()
+            except BaseException:
+                if self.use_database:
+                    await self._release(db, scope, key)
+                raise
+            stored = StoredResponse(request_fingerprint, status_code, body)
+            if self.use_database:
+                await self._complete(db, scope, key, stored)
+            self.responses.set(store_key, stored)
+            return stored, False
+        finally:
+            del self._in_flight[store_key]
+            done.set_result(None)
+
+    @staticmethod
+    def _replay(stored: StoredResponse, request_fingerprint: str) -> StoredResponse:
+        if stored.fingerprint != request_fingerprint:
+            raise IdempotencyConflictError()
+        return stored
+
+    async def _claim(self, db: AsyncSession, scope: str, key: str, request_fingerprint: str) -> Optional[StoredResponse]:
+        """Insert a pending row for the key; return the stored response if it already completed."""
+        K = models.IdempotencyKey
+        now = datetime.utcnow()
+        await self._purge_expired(db, now)
+        # Also takes over a claim whose lease ran out
+        await db.execute(delete(K).where(K.scope == scope, K.key == key, K.expires_at <= now))
+        db.add(K(scope=scope, key=key, fingerprint=request_fingerprint,
+                 created_at=now, expires_at=now + timedelta(seconds=self.lease)))
+        try:
+            await db.commit()
+            return None
+        except IntegrityError:
+            await db.rollback()
+        row = (await db.execute(
+            select(K.fingerprint, K.status_code, K.response_body).where(K.scope == scope, K.key == key)
+        )).one_or_none()
+        if row is None:
+            # Released between our insert and this read; let the client retry
+            raise IdempotencyInProgressError()
+        stored_fingerprint, status_code, body = row
+        if stored_fingerprint != request_fingerprint:
+            raise IdempotencyConflictError()
+        if status_code is None:
+            raise IdempotencyInProgressError()
+        return StoredResponse(stored_fingerprint, status_code, body)
+
+    def _completion(self, scope: str, key: str, status_code: int, body: bytes):
+        K = models.IdempotencyKey
+        # A no-op when the handler already recorded the response
+        return update(K).where(K.scope == scope, K.key == key, K.status_code.is_(None))\
+            .values(status_code=status_code, response_body=body,
+                    expires_at=datetime.utcnow() + timedelta(seconds=self.ttl))
+
+    def record(self, db: Session, scope: str, key: str, status_code: int, body: bytes):
+        """Store the response in ``db``'s open transaction, to commit with the handler's writes."""
+        if self.use_database:
+            db.execute(self._completion(scope, key, status_code, body))
+
+    async def _complete(self, db: AsyncSession, scope: str, key: str, stored: StoredResponse):
+        await db.execute(self._completion(scope, key, stored.status_code, stored.body))
+        await db.commit()
+
+    async def _release(self, db: AsyncSession, scope: str, key: str):
+        K = models.IdempotencyKey
+        await db.rollback()
+        await db.execute(delete(K).where(K.scope == scope, K.key == key))
+        await db.commit()
+
+    async def _purge_expired(self, db: AsyncSession, now: datetime):
+        clock = self.responses.clock()
+        if self._purged_at is not None and clock - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = clock
+        await db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at <= now))
+
+
+store = KeyStore()
@@ -0,0 +1,215 @@
+"""Vectorized daily interest accrual.
+
+Accounts are processed in chunks of ``CHUNK_SIZE`` ordered by account
+number. For each chunk the account rows are locked and their applied
+rate and withholding rate are fetched as integer columns, together with
+each account's closing balance on the accrual date, so postings made
+after that day do not earn interest for it. The day's interest and
+withholding tax are computed with NumPy on int64 arrays, and the net
+interest is posted as deposits with one multi-row INSERT plus one
+executemany UPDATE before the chunk commits. Accounts opened after the
+accrual date are skipped.
+
+All arithmetic is exact integer arithmetic. Rates are scaled to
+thousandths of a percent, so one day of interest is::
+
+    (balance * rate_milli + remainder) / (100_000 * DAYS_IN_YEAR)
+
+The integer quotient is credited in won and the remainder is stored on
+the account and carried into the next day, so nothing is lost to
+rounding however small the daily amount.
+
+    python interest.py --date 2024-01-31
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from sqlalchemy import BigInteger, Integer, case, cast, func, or_, select, update, bindparam
+from sqlalchemy.orm import Session
+
+import archive
+import ledger
+import models
+import snapshots
+
+DAYS_IN_YEAR = 365
+RATE_SCALE = 1000  # applied_interest_rate is Numeric(5, 3), in percent
+DAILY_DENOMINATOR = 100 * RATE_SCALE * DAYS_IN_YEAR
+
+# Withholding tax per taxation_code, in hundredths of a percent
+WITHHOLDING_RATES = {
+    "1": 1540,  # General taxation, 15.4%
+    "2": 0,     # Tax exempt
+    "3": 950,   # Tax preferred, 9.5%
+}
+DEFAULT_WITHHOLDING_RATE = WITHHOLDING_RATES["1"]
+
+CHUNK_SIZE = 10000
+
+
+def compute_daily_interest(balances, rates_milli, remainders, withholding_rates):
+    """Return ``(gross, tax, net, new_remainders)`` as int64 arrays."""
+    numerators = balances * rates_milli + remainders
+    gross, new_remainders = np.divmod(numerators, DAILY_DENOMINATOR)
+    tax = gross * withholding_rates // 10000
+    return gross, tax, gross - tax, new_remainders
+
+
+def _chunk_bounds(db: Session, after, chunk_size: int):
+    stmt = select(models.Account.account_number)\
+        .order_by(models.Account.account_number)\
+        .limit(chunk_size)
+    if after is not None:
+        stmt = stmt.where(models.Account.account_number > after)
+    numbers = db.execute(stmt).scalars().all()
+    return (numbers[0], numbers[-1]) if numbers else None
+
+
+def _lock_chunk(db: Session, first: str, last: str, accrual_date: date, posted_at: datetime):
+    A = models.Account
+    withholding = case(WITHHOLDING_RATES, value=A.taxation_code, else_=DEFAULT_WITHHOLDING_RATE)
+    # Locks the rows like ledger postings do; accounts already accrued for
+    # the day are skipped so a rerun never double-credits.
+    stmt = update(A)\
+        .where(A.account_number.between(first, last))\
+        .where(or_(A.interest_accrued_through.is_(None), A.interest_accrued_through < accrual_date))\
+        .where(A.account_opening_date <= posted_at)\
+        .values(interest_accrued_through=accrual_date)\
+        .returning(
+            A.account_number,
+            cast(A.current_balance, BigInteger),
+            cast(func.round(A.applied_interest_rate * RATE_SCALE), Integer),
+            A.interest_accrual_remainder,
+            withholding,
+            A.last_transaction_date,
+        )\
+        .execution_options(synchronize_session=False)
+    return db.execute(stmt).all()
+
+
+def _closing_balances(db: Session, first: str, last: str, posted_at: datetime) -> dict:
+    """Return each account's balance after its last posting at or before ``posted_at``.
+
+    One index probe per account on ``ix_account_transaction_account_date_id``.
+    Without such a posting the balance is the archived balance, else the
+    initial deposit; accrual dates never precede the archive cutoff.
+    """
+    A = models.Account
+    T = models.AccountTransaction
+    latest = select(T.balance_after_transaction)\
+        .where(T.account_number == A.account_number, T.transaction_date <= posted_at)\
+        .order_by(T.transaction_date.desc(), T.transaction_id.desc())\
+        .limit(1)\
+        .scalar_subquery()
+    stmt = select(A.account_number,
+                  cast(func.coalesce(latest, A.archived_balance, A.initial_deposit_amount), BigInteger))\
+        .where(A.account_number.between(first, last))
+    return dict(db.execute(stmt).all())
+
+
+def accrue_interest(db: Session, accrual_date: date, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Accrue and post one day of interest for every account.
+
+    Returns totals for the run. Each chunk commits on its own; rerunning
+    the same date only processes accounts not yet accrued for it. Dates
+    before the archive watermark are rejected.
+    """
+    posted_at = datetime.combine(accrual_date, time(23, 59, 59))
+    cutoff = archive.watermark(db)
+    if cutoff is not None and posted_at < cutoff:
+        raise ValueError("Cannot accrue interest in an archived period")
+    totals = {"accounts": 0, "postings": 0, "gross_interest": 0, "withholding_tax": 0, "net_interest": 0}
+    after = None
+    while True:
+        bounds = _chunk_bounds(db, after, chunk_size)
+        if bounds is None:
+            break
+        after = bounds[1]
+        try:
+            rows = _lock_chunk(db, *bounds, accrual_date, posted_at)
+            if rows:
+                _post_chunk(db, rows, _closing_balances(db, *bounds, posted_at), posted_at, totals)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return totals
+
+
+def _post_chunk(db: Session, rows, closing_balances: dict, posted_at: datetime, totals: dict):
+    account_numbers = [row[0] for row in rows]
+    last_transaction_dates = [row[5] for row in rows]
+    columns = np.array([row[1:5] for row in rows], dtype=np.int64)
+    current_balances, rates_milli, remainders, withholding_rates = columns.T
+    balances = np.array([closing_balances[number] for number in account_numbers], dtype=np.int64)
+    gross, tax, net, new_remainders = compute_daily_interest(balances, rates_milli, remainders, withholding_rates)
+    new_balances = current_balances + net
+    credited = np.flatnonzero(net > 0)
+
+    if len(credited):
+        db.execute(models.AccountTransaction.__table__.insert(), [
+            {
+                "account_number": account_numbers[i],
+                "transaction_date": posted_at,
+                "transaction_type": ledger.DEPOSIT,
+                "transaction_amount": int(net[i]),
+                "balance_after_transaction": int(balances[i] + net[i]),
+            }
+            for i in credited
+        ])
+
+    account_table = models.Account.__table__
+    db.execute(
+        account_table.update()
+        .where(account_table.c.account_number == bindparam("b_account_number"))
+        .values(
+            current_balance=bindparam("b_balance"),
+            ledger_sequence=account_table.c.ledger_sequence + bindparam("b_posted"),
+            interest_accrual_remainder=bindparam("b_remainder"),
+            last_transaction_date=bindparam("b_last_transaction_date"),
+        ),
+        [
+            {
+                "b_account_number": account_number,
+                "b_balance": int(new_balances[i]),
+                "b_posted": int(net[i] > 0),
+                "b_remainder": int(new_remainders[i]),
+                "b_last_transaction_date": max(last_transaction_dates[i] or posted_at, posted_at)
+                if net[i] > 0 else last_transaction_dates[i],
+            }
+            for i, account_number in enumerate(account_numbers)
+        ],
+    )
+
+    # A late run lands before postings already made after the accrual date
+    for i in credited:
+        if last_transaction_dates[i] is not None and last_transaction_dates[i] > posted_at:
+            ledger.rebalance_from(db, account_numbers[i], posted_at)
+    if len(credited) and posted_at.date() < date.today():
+        snapshots.invalidate(db, [account_numbers[i] for i in credited], posted_at.date())
+
+    totals["accounts"] += len(account_numbers)
+    totals["postings"] += len(credited)
+    totals["gross_interest"] += int(gross.sum())
+    totals["withholding_tax"] += int(tax.sum())
+    totals["net_interest"] += int(net.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accrue one day of interest for every account")
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today() - timedelta(days=1),
+                        help="accrual date (default: yesterday)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        print(accrue_interest(db, args.date, args.chunk_size))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""Transaction posting engine.
+
+Postings are applied with a single guarded UPDATE on the account row that
+adds the signed amount to ``current_balance`` only while the result stays
+non-negative. The row lock taken by that UPDATE is held until the ledger
+row is committed, so postings to one account are serialized by the
+database while postings to different accounts never wait on each other.
+
+The ledger chain is ordered by ``(transaction_date, transaction_id)``.
+Appending a posting is the common case and needs nothing beyond the
+guarded UPDATE. A back-dated posting or a deleted row changes the balance
+of every later row; those are recomputed by ``rebalance_from`` with one
+window-function UPDATE per account. Postings dated before today also
+rebuild the account's end-of-day snapshots from that day on.
+
+Rows dated before the archive watermark live in archive files (see
+``archive``); postings into that period are rejected, and the hot chain
+of an archived account opens from its ``archived_balance``.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Callable, Optional
+
+from sqlalchemy import DateTime, Numeric, bindparam, case, func, insert, literal, or_, select, tuple_, update
+from sqlalchemy.orm import Session, aliased
+
+import archive
+import models
+import schemas
+import snapshots
+
+DEPOSIT = 1
+WITHDRAWAL = 2
+
+# Accounts posted per commit by post_batch
+BATCH_ACCOUNTS_PER_COMMIT = 500
+
+
+class PostingError(Exception):
+    """Base class for postings rejected by the ledger."""
+
+
+class AccountNotFoundError(PostingError):
+    pass
+
+
+class InsufficientFundsError(PostingError):
+    pass
+
+
+class ArchivedPeriodError(PostingError):
+    """The posting is dated before the archive watermark."""
+
+
+def signed_amount(transaction_type: int, transaction_amount) -> Decimal:
+    amount = Decimal(str(transaction_amount))
+    return amount if transaction_type == DEPOSIT else -amount
+
+
+def apply_to_balance(db: Session, account_number: str, delta: Decimal, postings: int = 1,
+                     transaction_date=None, recompute_last_date: bool = False):
+    """Atomically add ``delta`` to the running balance.
+
+    Returns ``(new_balance, last_transaction_date)``; when ``transaction_date``
+    is given it advances the account's last transaction date and must not
+    be before the archive watermark. ``recompute_last_date`` instead resets
+    it to the latest row left in the ledger, after a row was removed. The
+    caller owns the transaction; the account row stays locked until it
+    commits or rolls back.
+    """
+    A = models.Account
+    T = models.AccountTransaction
+    values = {
+        "current_balance": A.current_balance + delta,
+        "ledger_sequence": A.ledger_sequence + postings,
+    }
+    if recompute_last_date:
+        values["last_transaction_date"] = select(func.max(T.transaction_date))\
+            .where(T.account_number == account_number)\
+            .scalar_subquery()
+    stmt = update(A)\
+        .where(A.account_number == account_number)\
+        .where(A.current_balance + delta >= 0)
+    if transaction_date is not None:
+        posted_at = literal(transaction_date, DateTime)
+        # Checked in the same statement as the row lock, so no posting lands
+        # below the cutoff of a run that has started
+        stmt = stmt.where(posted_at >= func.coalesce(
+            select(func.max(models.LedgerArchiveRun.cutoff)).scalar_subquery(), posted_at))
+        values["last_transaction_date"] = case(
+            (or_(A.last_transaction_date.is_(None), A.last_transaction_date <= transaction_date), transaction_date),
+            else_=A.last_transaction_date,
+        )
+    stmt = stmt\
+        .values(**values)\
+        .returning(A.current_balance, A.last_transaction_date)\
+        .execution_options(synchronize_session=False)
+    row = db.execute(stmt).one_or_none()
+    if row is None:
+        found = db.query(models.Account.account_number)\
+            .filter(models.Account.account_number == account_number)\
+            .first()
+        if found is None:
+            raise AccountNotFoundError(account_number)
+        cutoff = archive.watermark(db) if transaction_date is not None else None
+        if cutoff is not None and transaction_date < cutoff:
+            raise ArchivedPeriodError(account_number)
+        raise InsufficientFundsError(account_number)
+    return Decimal(str(row[0])), row[1]
+
+
+def _signed_amount_column(T):
+    return case((T.transaction_type == DEPOSIT, T.transaction_amount), else_=-T.transaction_amount)
+
+
+def _supports_update_from(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return dialect.name != "sqlite" or dialect.server_version_info >= (3, 33)
+
+
+def rebalance_from(db: Session, account_number: str, pivot_date, pivot_id: int = 0) -> Decimal:
+    """Recompute ``balance_after_transaction`` of every row at or after the pivot.
+
+    Rows are ordered by ``(transaction_date, transaction_id)``; the pivot
+    is that key of the first row that may be stale. The opening balance is
+    taken from the row just before the pivot, else the account's archived
+    balance, else its initial deposit. Raises
+    ``InsufficientFundsError`` if any recomputed balance is negative, and
+    returns the balance after the last row. The caller owns the
+    transaction and must hold the account row lock.
+    """
+    T = models.AccountTransaction
+    key = tuple_(T.transaction_date, T.transaction_id)
+    pivot = tuple_(literal(pivot_date, T.transaction_date.type), literal(pivot_id))
+
+    opening = db.execute(
+        select(T.balance_after_transaction)
+        .where(T.account_number == account_number, key < pivot)
+        .order_by(T.transaction_date.desc(), T.transaction_id.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+    if opening is None:
+        opening = db.execute(
+            select(func.coalesce(models.Account.archived_balance, models.Account.initial_deposit_amount))
+            .where(models.Account.account_number == account_number)
+        ).scalar_one()
+    opening_balance = Decimal(str(opening))
+    opening = literal(opening_balance, Numeric(12, 0))
+
+    if _supports_update_from(db):
+        running = select(
+            T.transaction_id,
+            (opening + func.sum(_signed_amount_column(T)).over(
+                order_by=(T.transaction_date, T.transaction_id))).label("balance"),
+        ).where(T.account_number == account_number, key >= pivot).subquery()
+        stmt = update(T)\
+            .where(T.transaction_id == running.c.transaction_id)\
+            .values(balance_after_transaction=running.c.balance)
+    else:
+        # SQLite before 3.33 has no UPDATE ... FROM; a correlated running
+        # sum is quadratic but still one statement
+        earlier = aliased(T)
+        running_sum = select(func.sum(_signed_amount_column(earlier)))\
+            .where(
+                earlier.account_number == account_number,
+                tuple_(earlier.transaction_date, earlier.transaction_id) >= pivot,
+                tuple_(earlier.transaction_date, earlier.transaction_id) <= key,
+            ).scalar_subquery()
+        stmt = update(T)\
+            .where(T.account_number == account_number, key >= pivot)\
+            .values(balance_after_transaction=opening + running_sum)
+    db.execute(stmt.execution_options(synchronize_session=False))
+
+    lowest, total = db.execute(
+        select(func.min(T.balance_after_transaction), func.sum(_signed_amount_column(T)))
+        .where(T.account_number == account_number, key >= pivot)
+    ).one()
+    if lowest is not None and lowest < 0:
+        raise InsufficientFundsError(account_number)
+    return opening_balance + Decimal(str(total or 0))
+
+
+def post_transaction(db: Session, transaction: schemas.TransactionCreate,
+                     before_commit: Optional[Callable[[Session, models.AccountTransaction], None]] = None,
+                     ) -> models.AccountTransaction:
+    """Post a single deposit or withdrawal and commit it.
+
+    A back-dated posting is inserted at its place in the chain and every
+    later balance is recomputed. ``before_commit(db, row)`` runs once the
+    row is flushed, inside the posting's transaction.
+    """
+    delta = signed_amount(transaction.transaction_type, transaction.transaction_amount)
+    try:
+        new_balance, last_transaction_date = apply_to_balance(
+            db, transaction.account_number, delta, transaction_date=transaction.transaction_date)
+
+        transaction_data = transaction.dict()
+        transaction_data["balance_after_transaction"] = new_balance
+        db_transaction = models.AccountTransaction(**transaction_data)
+        db.add(db_transaction)
+        if transaction.transaction_date < last_transaction_date:
+            db.flush()
+            rebalance_from(db, transaction.account_number, db_transaction.transaction_date, db_transaction.transaction_id)
+        if transaction.transaction_date.date() < date.today():
+            db.flush()
+            snapshots.invalidate(db, [transaction.account_number], transaction.transaction_date.date())
+        if before_commit is not None:
+            db.flush()
+            before_commit(db, db_transaction)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    db.refresh(db_transaction)
+    return db_transaction
+
+
+def delete_transaction(db: Session, transaction_id: int) -> Optional[str]:
+    """Delete a ledger row, restore the running balance and rebalance later rows.
+
+    Returns the row's account number, or None when the row does not exist. Raises
+    ``InsufficientFundsError`` when removing a deposit would leave a later
+    balance negative.
+    """
+    T = models.AccountTransaction
+    try:
+        account_number = db.scalar(select(T.account_number).where(T.transaction_id == transaction_id))
+        if account_number is None:
+            return None
+        # Lock the account as postings do, then delete. Of two concurrent
+        # deletes only the one whose DELETE removed the row reverses it.
+        _lock_balances(db, [account_number])
+        table = T.__table__
+        row = db.execute(
+            table.delete().where(table.c.transaction_id == transaction_id)
+            .returning(table.c.account_number, table.c.transaction_date,
+                       table.c.transaction_type, table.c.transaction_amount)
+        ).one_or_none()
+        if row is None:
+            db.rollback()
+            return None
+        account_number, transaction_date, transaction_type, transaction_amount = row
+
+        apply_to_balance(db, account_number, -signed_amount(transaction_type, transaction_amount), postings=-1,
+                         recompute_last_date=True)
+        rebalance_from(db, account_number, transaction_date, transaction_id)
+        snapshots.invalidate(db, [account_number], transaction_date.date())
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return account_number
+
+
+def _lock_balances(db: Session, account_numbers) -> dict:
+    """Lock the given account rows and return their balances and last transaction dates.
+
+    A no-op UPDATE takes the row locks on PostgreSQL and the write lock on
+    SQLite, where SELECT ... FOR UPDATE is not available.
+    """
+    stmt = update(models.Account)\
+        .where(models.Account.account_number.in_(account_numbers))\
+        .values(ledger_sequence=models.Account.ledger_sequence)\
+        .returning(models.Account.account_number, models.Account.current_balance,
+                   models.Account.last_transaction_date)\
+        .execution_options(synchronize_session=False)
+    return {number: (Decimal(str(balance)), last) for number, balance, last in db.execute(stmt)}
+
+
+def post_batch(db: Session, transactions) -> list:
+    """Post many transactions with a few multi-row statements per commit.
+
+    ``transactions`` is a sequence of ``TransactionCreate``. Entries are
+    grouped by account and applied in ``transaction_date`` order (input
+    order for ties). Rejected entries, including those dated before the
+    archive watermark, do not stop the rest of the batch.
+    Entries dated before an account's last transaction are posted one by
+    one through ``post_transaction`` after the bulk chunks, since they
+    rebalance the rows after them.
+    Returns one ``TransactionBatchItemResult`` per entry, in input order.
+    """
+    results = [None] * len(transactions)
+    by_account = defaultdict(list)
+    for index, transaction in enumerate(transactions):
+        by_account[transaction.account_number].append(index)
+
+    # Sorted so concurrent batches lock accounts in the same order
+    account_numbers = sorted(by_account)
+    back_dated = []
+    for start in range(0, len(account_numbers), BATCH_ACCOUNTS_PER_COMMIT):
+        chunk = account_numbers[start:start + BATCH_ACCOUNTS_PER_COMMIT]
+        try:
+            _post_chunk(db, transactions, by_account, chunk, results, back_dated)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    for index in back_dated:
+        try:
+            db_transaction = post_transaction(db, transactions[index])
+        except InsufficientFundsError:
+            results[index] = schemas.TransactionBatchItemResult(
+                index=index, status="rejected", detail="Insufficient funds")
+            continue
+        except ArchivedPeriodError:
+            results[index] = schemas.TransactionBatchItemResult(
+                index=index, status="rejected", detail="Transaction date is archived")
+            continue
+        results[index] = schemas.TransactionBatchItemResult(
+            index=index,
+            status="posted",
+            transaction_id=db_transaction.transaction_id,
+            balance_after_transaction=db_transaction.balance_after_transaction,
+        )
+    return results
+
+
+def _post_chunk(db: Session, transactions, by_account, chunk, results, back_dated):
+    balances = _lock_balances(db, chunk)
+    cutoff = archive.watermark(db)
+    rows = []
+    row_indexes = []
+    account_updates = []
+
+    for account_number in chunk:
+        indexes = by_account[account_number]
+        if account_number not in balances:
+            for index in indexes:
+                results[index] = schemas.TransactionBatchItemResult(
+                    index=index, status="rejected", detail="Account not found")
+            continue
+
+        balance, last_transaction_date = balances[account_number]
+        posted = 0
+        for index in sorted(indexes, key=lambda i: (transactions[i].transaction_date, i)):
+            transaction = transactions[index]
+            if cutoff is not None and transaction.transaction_date < cutoff:
+                results[index] = schemas.TransactionBatchItemResult(
+                    index=index, status="rejected", detail="Transaction date is archived")
+                continue
+            if last_transaction_date is not None and transaction.transaction_date < last_transaction_date:
+                back_dated.append(index)
+                continue
+            new_balance = balance + signed_amount(transaction.transaction_type, transaction.transaction_amount)
+            if new_balance < 0:
+                results[index] = schemas.TransactionBatchItemResult(
+                    index=index, status="rejected", detail="Insufficient funds")
+                continue
+            balance = new_balance
+            last_transaction_date = transaction.transaction_date
+            posted += 1
+            transaction_data = transaction.dict()
+            transaction_data["balance_after_transaction"] = balance
+            rows.append(transaction_data)
+            row_indexes.append(index)
+        if posted:
+            account_updates.append({
+                "b_account_number": account_number,
+                "b_balance": balance,
+                "b_posted": posted,
+                "b_last_transaction_date": last_transaction_date,
+            })
+
+    if not rows:
+        return
+
+    transaction_ids = db.execute(
+        insert(models.AccountTransaction).returning(
+            models.AccountTransaction.transaction_id, sort_by_parameter_order=True),
+        rows,
+    ).scalars().all()
+    account_table = models.Account.__table__
+    db.execute(
+        account_table.update()
+        .where(account_table.c.account_number == bindparam("b_account_number"))
+        .values(
+            current_balance=bindparam("b_balance"),
+            ledger_sequence=account_table.c.ledger_sequence + bindparam("b_posted"),
+            last_transaction_date=bindparam("b_last_transaction_date"),
+        ),
+        account_updates,
+    )
+
+    # Rows landing on days that may already be snapshotted
+    today = date.today()
+    stale_from = {}
+    for row in rows:
+        day = row["transaction_date"].date()
+        if day < today and day < stale_from.get(row["account_number"], today):
+            stale_from[row["account_number"]] = day
+    for account_number, day in stale_from.items():
+        snapshots.invalidate(db, [account_number], day)
+
+    for index, transaction_id, row in zip(row_indexes, transaction_ids, rows):
+        results[index] = schemas.TransactionBatchItemResult(
+            index=index,
+            status="posted",
+            transaction_id=transaction_id,
+            balance_after_transaction=row["balance_after_transaction"],
+        )
@@ -1,15 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Path, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from typing import List, Optional
 import models
 import schemas
-from database import engine, get_db
+import ledger
+import sequences
+import pagination
+import archive
+import statements
+import cache
+import reconcile
+import snapshots
+import idempotency
+import metrics
+import serialization
+import bulk_import
+import events
+import search
+import conditional
+import compression
+import migrate
+from database import (
+    DB_WARM_CONNECTIONS, async_engine, engine, engine_pool_status, get_db, get_read_db, read_async_engine, sync_url,
+)
 from datetime import datetime
+import asyncio
 import uuid
-from decimal import Decimal
-
-models.Base.metadata.create_all(bind=engine)
+import json
+import tempfile
 
 app = FastAPI(
     title="Deposit Account Management System",
@@ -24,238 +48,690 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, idempotency.REPLAYED_HEADER,
+                    bulk_import.CREATED_HEADER, bulk_import.REJECTED_HEADER, conditional.ETAG_HEADER,
+                    *metrics.DEBUG_HEADERS],
 )
 
+# gzip or brotli for large response bodies
+app.add_middleware(compression.CompressionMiddleware)
+
+# Per-route latency and SQL counts, served by GET /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+for instrumented_engine in {async_engine.sync_engine, read_async_engine.sync_engine, engine}:
+    metrics.instrument(instrumented_engine)
+
+# Cached lookups, returning schema snapshots
+async def lookup_customer(db: AsyncSession, customer_id: str) -> Optional[schemas.Customer]:
+    customer = cache.customers.get(customer_id)
+    if customer is None:
+        db_customer = await db.get(models.Customer, customer_id)
+        if db_customer is None:
+            return None
+        customer = schemas.Customer.model_validate(db_customer)
+        cache.customers.set(customer_id, customer)
+    return customer
+
+async def lookup_product(db: AsyncSession, product_code: str) -> Optional[schemas.Product]:
+    product = cache.products.get(product_code)
+    if product is None:
+        db_product = await db.get(models.Product, product_code)
+        if db_product is None:
+            return None
+        product = schemas.Product.model_validate(db_product)
+        cache.products.set(product_code, product)
+    return product
+
+async def idempotent(request: Request, db: AsyncSession, idempotency_key: Optional[str], create):
+    """Run ``create`` once per Idempotency-Key and replay its response to retries.
+
+    ``create`` receives ``record(session, result)``, which it may call in its
+    own transaction to store the response together with its writes.
+    """
+    if idempotency_key is None:
+        return await create()
+    if not idempotency_key or len(idempotency_key) > idempotency.MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+    scope = f"{request.method} {request.url.path}"
+
+    def record(session, result):
+        idempotency.store.record(session, scope, idempotency_key, status.HTTP_200_OK,
+                                 result.model_dump_json().encode())
+
+    async def handler():
+        result = await create(record)
+        return status.HTTP_200_OK, result.model_dump_json().encode()
+
+    try:
+        stored, replayed = await idempotency.store.run(
+            db, scope, idempotency_key, idempotency.fingerprint(await request.body()), handler)
+    except idempotency.IdempotencyConflictError:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    except idempotency.IdempotencyInProgressError:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress",
+                            headers={"Retry-After": "1"})
+    headers = {idempotency.REPLAYED_HEADER: "true"} if replayed else None
+    return Response(content=stored.body, status_code=stored.status_code, media_type="application/json",
+                    headers=headers)
+
+async def delete_unless_referenced(db: AsyncSession, delete_stmt, referencing, detail: str) -> bool:
+    """Run ``delete_stmt`` unless ``referencing`` selects a row; return whether a row was deleted.
+
+    The guard is one EXISTS probe on the referencing table's foreign key
+    index, so it never loads the referencing rows.
+    """
+    if await db.scalar(select(referencing.exists())):
+        raise HTTPException(status_code=400, detail=detail)
+    try:
+        result = await db.execute(delete_stmt)
+        await db.commit()
+    except IntegrityError:
+        # A referencing row was inserted after the probe
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=detail)
+    return result.rowcount > 0
+
+async def commit_account(db: AsyncSession, customer_id: str, product_code: str):
+    """Commit an account write, answering 404 when its customer or product is gone.
+
+    The existence checks read caches that only this worker invalidates, so
+    a customer or product deleted through another worker still passes them
+    and the write then fails on its foreign key.
+    """
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        for lookup_cache, model, key, detail in (
+            (cache.customers, models.Customer, customer_id, "Customer not found"),
+            (cache.products, models.Product, product_code, "Product not found"),
+        ):
+            if await db.get(model, key) is None:
+                lookup_cache.invalidate(key)
+                raise HTTPException(status_code=404, detail=detail)
+        raise
+
+def customer_account_activity(customer_id: str):
+    """Select each of a customer's accounts with its transaction count and last activity."""
+    T = models.AccountTransaction
+    return select(
+        *models.Account.__table__.c,
+        func.count(T.transaction_id).label("transaction_count"),
+        func.max(T.transaction_date).label("last_activity"),
+    ).outerjoin(T, T.account_number == models.Account.account_number)\
+        .where(models.Account.customer_id == customer_id)\
+        .group_by(models.Account.account_number)
+
 # Customer endpoints
 @app.post("/customers/", response_model=schemas.Customer)
-def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
+async def create_customer(customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_db)):
     db_customer = models.Customer(
         customer_id=str(uuid.uuid4()),
         **customer.dict()
     )
     db.add(db_customer)
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
+    await db.refresh(db_customer)
     return db_customer
 
 @app.get("/customers/", response_model=List[schemas.Customer])
-def get_customers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    customers = db.query(models.Customer).offset(skip).limit(limit).all()
-    return customers
+async def get_customers(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_read_db)):
+    stmt = select(*serialization.columns(models.Customer, schemas.Customer)).offset(skip).limit(limit)
+    return serialization.rows_response(schemas.Customer, await db.execute(stmt))
+
+@app.get("/customers/search", response_model=List[schemas.Customer])
+async def search_customers(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(search.DEFAULT_LIMIT, ge=1, le=search.MAX_LIMIT),
+    db: AsyncSession = Depends(get_read_db),
+):
+    rows = await db.run_sync(search.find_customers, q, limit)
+    return serialization.rows_response(schemas.Customer, rows)
 
 @app.get("/customers/{customer_id}", response_model=schemas.Customer)
-def get_customer(customer_id: str, db: Session = Depends(get_db)):
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+async def get_customer(customer_id: str, request: Request, response: Response,
+                       db: AsyncSession = Depends(get_read_db)):
+    version = await conditional.customer_version(db, customer_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    tag = conditional.request_etag(request, *version)
+    if conditional.matches(request, tag):
+        return conditional.not_modified(tag)
+    customer = await lookup_customer(db, customer_id)
+    if customer is not None and customer.last_modified_date != version.last_modified_date:
+        # Changed through another worker since it was cached
+        cache.customers.invalidate(customer_id)
+        customer = await lookup_customer(db, customer_id)
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
+    response.headers.update(conditional.headers(conditional.request_etag(request, customer.last_modified_date)))
     return customer
 
+@app.get("/customers/{customer_id}/accounts", response_model=List[schemas.AccountActivity])
+async def get_customer_accounts(customer_id: str, db: AsyncSession = Depends(get_read_db)):
+    if await lookup_customer(db, customer_id) is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    result = await db.execute(customer_account_activity(customer_id).order_by(models.Account.account_number))
+    return [schemas.AccountActivity.model_validate(row._mapping) for row in result]
+
+@app.get("/customers/{customer_id}/summary", response_model=schemas.CustomerSummary)
+async def get_customer_summary(customer_id: str, db: AsyncSession = Depends(get_read_db)):
+    customer = await lookup_customer(db, customer_id)
+    if customer is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    activity = customer_account_activity(customer_id).subquery()
+    totals = (await db.execute(select(
+        func.count(),
+        func.coalesce(func.sum(activity.c.current_balance), 0),
+        func.coalesce(func.sum(activity.c.transaction_count), 0),
+        func.max(activity.c.last_activity),
+    ))).one()
+    return schemas.CustomerSummary(
+        customer_id=customer_id,
+        customer_name=customer.customer_name,
+        account_count=totals[0],
+        total_balance=totals[1],
+        transaction_count=totals[2],
+        last_activity=totals[3],
+    )
+
 @app.put("/customers/{customer_id}", response_model=schemas.Customer)
-def update_customer(customer_id: str, customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
-    db_customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
+async def update_customer(customer_id: str, customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_db)):
+    db_customer = await db.get(models.Customer, customer_id)
     if db_customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
     
     for key, value in customer.dict().items():
         setattr(db_customer, key, value)
     
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
+    cache.customers.invalidate(customer_id)
+    await db.refresh(db_customer)
     return db_customer
 
 @app.delete("/customers/{customer_id}")
-def delete_customer(customer_id: str, db: Session = Depends(get_db)):
-    db_customer = db.query(models.Customer).filter(models.Customer.customer_id == customer_id).first()
-    if db_customer is None:
+async def delete_customer(customer_id: str, db: AsyncSession = Depends(get_db)):
+    deleted = await delete_unless_referenced(
+        db,
+        delete(models.Customer).where(models.Customer.customer_id == customer_id),
+        select(models.Account.account_number).where(models.Account.customer_id == customer_id),
+        "Cannot delete customer with existing accounts",
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Customer not found")
-    
-    # Check if customer has any accounts
-    if db_customer.accounts:
-        raise HTTPException(status_code=400, detail="Cannot delete customer with existing accounts")
-    
-    db.delete(db_customer)
-    db.commit()
+    cache.customers.invalidate(customer_id)
     return {"message": "Customer deleted successfully"}
 
 # Product endpoints
 @app.post("/products/", response_model=schemas.Product)
-def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
+async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
     db_product = models.Product(**product.dict())
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    cache.product_lists.invalidate()
+    await db.refresh(db_product)
     return db_product
 
 @app.get("/products/", response_model=List[schemas.Product])
-def get_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    products = db.query(models.Product).offset(skip).limit(limit).all()
+async def get_products(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                       db: AsyncSession = Depends(get_read_db)):
+    version = await conditional.product_list_version(db)
+    tag = conditional.request_etag(request, *version)
+    if conditional.matches(request, tag):
+        return conditional.not_modified(tag)
+    # Keyed by version, so writes from other processes are never served stale
+    products = cache.product_lists.get((skip, limit, version))
+    if products is None:
+        db_products = await db.scalars(select(models.Product).offset(skip).limit(limit))
+        products = [schemas.Product.model_validate(product) for product in db_products]
+        cache.product_lists.set((skip, limit, version), products)
+    response.headers.update(conditional.headers(tag))
     return products
 
 @app.get("/products/{product_code}", response_model=schemas.Product)
-def get_product(product_code: str, db: Session = Depends(get_db)):
-    product = db.query(models.Product).filter(models.Product.product_code == product_code).first()
+async def get_product(product_code: str, db: AsyncSession = Depends(get_read_db)):
+    product = await lookup_product(db, product_code)
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
 @app.put("/products/{product_code}", response_model=schemas.Product)
-def update_product(product_code: str, product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    db_product = db.query(models.Product).filter(models.Product.product_code == product_code).first()
+async def update_product(product_code: str, product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
+    db_product = await db.get(models.Product, product_code)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
     for key, value in product.dict().items():
         setattr(db_product, key, value)
     
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    cache.products.invalidate(product_code)
+    cache.product_lists.invalidate()
+    await db.refresh(db_product)
     return db_product
 
 @app.delete("/products/{product_code}")
-def delete_product(product_code: str, db: Session = Depends(get_db)):
-    db_product = db.query(models.Product).filter(models.Product.product_code == product_code).first()
-    if db_product is None:
+async def delete_product(product_code: str, db: AsyncSession = Depends(get_db)):
+    deleted = await delete_unless_referenced(
+        db,
+        delete(models.Product).where(models.Product.product_code == product_code),
+        select(models.Account.account_number).where(models.Account.product_code == product_code),
+        "Cannot delete product with existing accounts",
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    # Check if product has any accounts
-    if db_product.accounts:
-        raise HTTPException(status_code=400, detail="Cannot delete product with existing accounts")
-    
-    db.delete(db_product)
-    db.commit()
+    cache.products.invalidate(product_code)
+    cache.product_lists.invalidate()
     return {"message": "Product deleted successfully"}
 
 # Account endpoints
 @app.post("/accounts/", response_model=schemas.Account)
-def create_account(account: schemas.AccountCreate, db: Session = Depends(get_db)):
-    # Verify customer exists
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == account.customer_id).first()
-    if customer is None:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    
-    # Verify product exists
-    product = db.query(models.Product).filter(models.Product.product_code == account.product_code).first()
-    if product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    # Generate account number
-    account_number = f"100-{db.query(models.Account).count() + 1000:07d}"
+async def create_account(account: schemas.AccountCreate, request: Request, db: AsyncSession = Depends(get_db),
+                         idempotency_key: Optional[str] = Header(None)):
+    async def create(record=None):
+        # Verify customer exists
+        customer = await lookup_customer(db, account.customer_id)
+        if customer is None:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        
+        # Verify product exists
+        product = await lookup_product(db, account.product_code)
+        if product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        # Generate account number
+        account_number = await db.run_sync(sequences.next_account_number)
+        
+        db_account = models.Account(
+            account_number=account_number,
+            current_balance=account.initial_deposit_amount,
+            ledger_sequence=0,
+            **account.dict()
+        )
+        db.add(db_account)
+        await commit_account(db, account.customer_id, account.product_code)
+        await db.refresh(db_account)
+        return schemas.Account.model_validate(db_account)
     
-    db_account = models.Account(
-        account_number=account_number,
-        **account.dict()
-    )
-    db.add(db_account)
-    db.commit()
-    db.refresh(db_account)
-    return db_account
+    return await idempotent(request, db, idempotency_key, create)
 
 @app.get("/accounts/", response_model=List[schemas.Account])
-def get_accounts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    accounts = db.query(models.Account).offset(skip).limit(limit).all()
-    return accounts
+async def get_accounts(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_read_db)):
+    stmt = select(*serialization.columns(models.Account, schemas.Account)).offset(skip).limit(limit)
+    return serialization.rows_response(schemas.Account, await db.execute(stmt))
 
 @app.get("/accounts/{account_number}", response_model=schemas.Account)
-def get_account(account_number: str, db: Session = Depends(get_db)):
-    account = db.query(models.Account).filter(models.Account.account_number == account_number).first()
+async def get_account(account_number: str, request: Request, response: Response,
+                      db: AsyncSession = Depends(get_read_db)):
+    version = await conditional.account_version(db, account_number)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    tag = conditional.request_etag(request, *version)
+    if conditional.matches(request, tag):
+        return conditional.not_modified(tag)
+    account = await db.get(models.Account, account_number)
     if account is None:
         raise HTTPException(status_code=404, detail="Account not found")
+    response.headers.update(conditional.headers(
+        conditional.request_etag(request, account.last_modified_date, account.ledger_sequence)))
     return account
 
+@app.get("/accounts/{account_number}/balance", response_model=schemas.AccountBalance)
+async def get_account_balance(account_number: str, as_of: Optional[datetime] = None,
+                              db: AsyncSession = Depends(get_read_db)):
+    as_of = schemas.naive_utc(as_of)
+    if as_of is None:
+        account = await db.get(models.Account, account_number)
+        balance = account.current_balance if account is not None else None
+    else:
+        balance = await db.run_sync(snapshots.balance_as_of, account_number, as_of)
+    if balance is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return schemas.AccountBalance(account_number=account_number, as_of=as_of, balance=balance)
+
 @app.put("/accounts/{account_number}", response_model=schemas.Account)
-def update_account(account_number: str, account: schemas.AccountCreate, db: Session = Depends(get_db)):
-    db_account = db.query(models.Account).filter(models.Account.account_number == account_number).first()
+async def update_account(account_number: str, account: schemas.AccountCreate, db: AsyncSession = Depends(get_db)):
+    db_account = await db.get(models.Account, account_number)
     if db_account is None:
         raise HTTPException(status_code=404, detail="Account not found")
     
     # Verify customer exists
-    customer = db.query(models.Customer).filter(models.Customer.customer_id == account.customer_id).first()
+    customer = await lookup_customer(db, account.customer_id)
     if customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
     
     # Verify product exists
-    product = db.query(models.Product).filter(models.Product.product_code == account.product_code).first()
+    product = await lookup_product(db, account.product_code)
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
     for key, value in account.dict().items():
         setattr(db_account, key, value)
     
-    db.commit()
-    db.refresh(db_account)
+    # Without postings the balance is still the initial deposit
+    if db_account.ledger_sequence == 0:
+        db_account.current_balance = account.initial_deposit_amount
+    
+    await commit_account(db, account.customer_id, account.product_code)
+    await db.refresh(db_account)
     return db_account
 
 @app.delete("/accounts/{account_number}")
-def delete_account(account_number: str, db: Session = Depends(get_db)):
-    db_account = db.query(models.Account).filter(models.Account.account_number == account_number).first()
-    if db_account is None:
+async def delete_account(account_number: str, db: AsyncSession = Depends(get_db)):
+    A = models.Account
+    F = models.LedgerArchiveFile
+    # Archived rows count as transactions: the account's carry-forward or an
+    # archive file covering its number means it has history in cold storage
+    referencing = select(1).where(or_(
+        select(models.AccountTransaction.transaction_id)
+        .where(models.AccountTransaction.account_number == account_number).exists(),
+        select(A.account_number).where(
+            A.account_number == account_number,
+            or_(A.archived_before.is_not(None), A.archived_balance.is_not(None))).exists(),
+        select(F.file_id).where(F.first_account <= account_number, F.last_account >= account_number).exists(),
+    ))
+    deleted = await delete_unless_referenced(
+        db,
+        delete(A).where(A.account_number == account_number),
+        referencing,
+        "Cannot delete account with existing transactions",
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Account not found")
-    
-    # Check if account has any transactions
-    if db_account.transactions:
-        raise HTTPException(status_code=400, detail="Cannot delete account with existing transactions")
-    
-    db.delete(db_account)
-    db.commit()
     return {"message": "Account deleted successfully"}
 
 # Transaction endpoints
 @app.post("/transactions/", response_model=schemas.Transaction)
-def create_transaction(transaction: schemas.TransactionCreate, db: Session = Depends(get_db)):
-    # Verify account exists
-    account = db.query(models.Account).filter(models.Account.account_number == transaction.account_number).first()
-    if account is None:
-        raise HTTPException(status_code=404, detail="Account not found")
-    
-    # Calculate new balance
-    current_balance = Decimal(str(account.initial_deposit_amount))
-    last_transaction = db.query(models.AccountTransaction)\
-        .filter(models.AccountTransaction.account_number == transaction.account_number)\
-        .order_by(models.AccountTransaction.transaction_date.desc())\
-        .first()
-    
-    if last_transaction:
-        current_balance = Decimal(str(last_transaction.balance_after_transaction))
+async def create_transaction(transaction: schemas.TransactionCreate, request: Request,
+                             db: AsyncSession = Depends(get_db), idempotency_key: Optional[str] = Header(None)):
+    async def create(record=None):
+        def before_commit(session, db_transaction):
+            if record is not None:
+                session.refresh(db_transaction)
+                record(session, schemas.Transaction.model_validate(db_transaction))
+
+        try:
+            db_transaction = await db.run_sync(ledger.post_transaction, transaction, before_commit)
+        except ledger.AccountNotFoundError:
+            raise HTTPException(status_code=404, detail="Account not found")
+        except ledger.InsufficientFundsError:
+            raise HTTPException(status_code=400, detail="Insufficient funds")
+        except ledger.ArchivedPeriodError:
+            raise HTTPException(status_code=400, detail="Transaction date is archived")
+        result = schemas.Transaction.model_validate(db_transaction)
+        await events.publish_activity(db, [result.account_number], [result.transaction_id])
+        return result
     
-    transaction_amount = Decimal(str(transaction.transaction_amount))
+    return await idempotent(request, db, idempotency_key, create)
+
+def parse_batch_items(body: bytes, content_type: str) -> list:
+    """Split a JSON array or NDJSON body into items; unparsable NDJSON lines become ValueErrors."""
+    if content_type.startswith("application/x-ndjson"):
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(e)
+        return items
+    try:
+        items = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array")
+    return items
+
+@app.post("/transactions/batch", response_model=schemas.TransactionBatchResult)
+async def create_transactions_batch(request: Request, db: AsyncSession = Depends(get_db)):
+    items = parse_batch_items(await request.body(), request.headers.get("content-type", ""))
     
-    if transaction.transaction_type == 1:  # Deposit
-        new_balance = current_balance + transaction_amount
-    else:  # Withdrawal
-        if current_balance < transaction_amount:
-            raise HTTPException(status_code=400, detail="Insufficient funds")
-        new_balance = current_balance - transaction_amount
+    # Validate every item up front, invalid ones are rejected individually
+    results = [None] * len(items)
+    transactions = []
+    indexes = []
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, ValueError):
+                raise item
+            if not isinstance(item, dict):
+                raise ValueError("Item must be a JSON object")
+            transactions.append(schemas.TransactionCreate(**item))
+            indexes.append(index)
+        except (ValueError, ValidationError) as e:
+            results[index] = schemas.TransactionBatchItemResult(index=index, status="rejected", detail=str(e))
     
-    # Update transaction with calculated balance
-    transaction_data = transaction.dict()
-    transaction_data["balance_after_transaction"] = new_balance
+    batch_results = await db.run_sync(ledger.post_batch, transactions)
+    for index, result in zip(indexes, batch_results):
+        result.index = index
+        results[index] = result
+    posted = [(transaction, result) for transaction, result in zip(transactions, batch_results)
+              if result.status == "posted"]
+    await events.publish_activity(db, {transaction.account_number for transaction, _ in posted},
+                                  [result.transaction_id for _, result in posted])
     
-    db_transaction = models.AccountTransaction(**transaction_data)
-    db.add(db_transaction)
-    db.commit()
-    db.refresh(db_transaction)
-    return db_transaction
+    posted = sum(1 for result in results if result.status == "posted")
+    return schemas.TransactionBatchResult(posted=posted, rejected=len(results) - posted, results=results)
+
+# Bulk import endpoint
+IMPORT_SPOOL_BYTES = 1024 * 1024
+IMPORT_READ_BYTES = 64 * 1024
+
+def read_spool(spool):
+    try:
+        spool.seek(0)
+        while chunk := spool.read(IMPORT_READ_BYTES):
+            yield chunk
+    finally:
+        spool.close()
+
+@app.post("/import/{entity}")
+async def import_records(
+    request: Request,
+    entity: str = Path(..., pattern="^(customers|products|accounts)$"),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+):
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    importer = bulk_import.Importer(entity, format)
+    # Results go to a temporary file once they outgrow memory, so a large
+    # import holds one chunk of input and output at a time
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    try:
+        async for line in bulk_import.aiter_lines(request.stream()):
+            if importer.add(line):
+                spool.write(await db.run_sync(importer.flush))
+        spool.write(await db.run_sync(importer.flush))
+    except ValueError as e:
+        spool.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        spool.close()
+        raise
+    if entity == "products" and importer.created:
+        cache.product_lists.invalidate()
+    headers = {bulk_import.CREATED_HEADER: str(importer.created), bulk_import.REJECTED_HEADER: str(importer.rejected)}
+    return StreamingResponse(read_spool(spool), media_type="application/x-ndjson", headers=headers)
+
+async def paginate_transactions(db: AsyncSession, request: Request, stmt, cursor, from_date, to_date, skip, limit,
+                                account_number: Optional[str] = None):
+    if account_number is None:
+        version = await conditional.ledger_version(db)
+    else:
+        version = await conditional.account_version(db, account_number)
+    # Read before the rows, so a write in between only makes the tag stale
+    tag = conditional.request_etag(request, *(version or ()))
+    if conditional.matches(request, tag):
+        return conditional.not_modified(tag)
+    try:
+        after = pagination.decode_cursor(cursor) if cursor is not None else None
+    except pagination.InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # asyncpg refuses aware datetimes for TIMESTAMP columns
+    from_date, to_date = schemas.naive_utc(from_date), schemas.naive_utc(to_date)
+    # Legacy offset paging, kept for existing clients
+    offset = skip if cursor is None else 0
+    partitions = await db.run_sync(archive.partitions, account_number, from_date, to_date, after)
+    if not partitions:
+        stmt = pagination.transaction_page(stmt.offset(offset or None), cursor, from_date, to_date, limit)
+        transactions = (await db.execute(stmt)).all()
+    else:
+        # Merge the archived rows into the ledger's page
+        fields = tuple(schemas.Transaction.model_fields)
+        archived = await run_in_threadpool(
+            archive.read_transactions, partitions, fields, account_number, after, from_date, to_date, offset + limit)
+        stmt = pagination.transaction_page(stmt, cursor, from_date, to_date, offset + limit)
+        transactions = sorted(archived + (await db.execute(stmt)).all(),
+                              key=lambda row: (row.transaction_date, row.transaction_id))[offset:offset + limit]
+    next_cursor = pagination.next_cursor(transactions, limit)
+    headers = conditional.headers(tag)
+    if next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return serialization.rows_response(schemas.Transaction, transactions, headers)
 
 @app.get("/transactions/", response_model=List[schemas.Transaction])
-def get_transactions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    transactions = db.query(models.AccountTransaction).offset(skip).limit(limit).all()
-    return transactions
+async def get_transactions(
+    request: Request,
+    cursor: Optional[str] = None,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    stmt = select(*serialization.columns(models.AccountTransaction, schemas.Transaction))
+    return await paginate_transactions(db, request, stmt, cursor, from_date, to_date, skip, limit)
 
 @app.get("/accounts/{account_number}/transactions/", response_model=List[schemas.Transaction])
-def get_account_transactions(account_number: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    transactions = db.query(models.AccountTransaction)\
-        .filter(models.AccountTransaction.account_number == account_number)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    return transactions
+async def get_account_transactions(
+    account_number: str,
+    request: Request,
+    cursor: Optional[str] = None,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    stmt = select(*serialization.columns(models.AccountTransaction, schemas.Transaction))\
+        .where(models.AccountTransaction.account_number == account_number)
+    return await paginate_transactions(db, request, stmt, cursor, from_date, to_date, skip, limit, account_number)
+
+@app.get("/accounts/{account_number}/statement")
+async def export_account_statement(
+    account_number: str,
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    account = await db.get(models.Account, account_number)
+    if account is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    rows = await statements.stream_statement_rows(
+        db, account_number, schemas.naive_utc(from_date), schemas.naive_utc(to_date))
+    chunks = statements.ENCODERS[format](rows)
+    headers = {"Content-Disposition": f'attachment; filename="{account_number}.{format}"'}
+    # Brotli, when negotiated, is left to the compression middleware
+    if compression.negotiate(request.headers.get("accept-encoding", "")) == "gzip":
+        chunks = statements.gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=statements.MEDIA_TYPES[format], headers=headers)
 
 @app.delete("/transactions/{transaction_id}")
-def delete_transaction(transaction_id: int, db: Session = Depends(get_db)):
-    db_transaction = db.query(models.AccountTransaction).filter(models.AccountTransaction.transaction_id == transaction_id).first()
-    if db_transaction is None:
+async def delete_transaction(transaction_id: int, db: AsyncSession = Depends(get_db)):
+    try:
+        account_number = await db.run_sync(ledger.delete_transaction, transaction_id)
+    except ledger.InsufficientFundsError:
+        raise HTTPException(status_code=400, detail="Insufficient funds")
+    if account_number is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    
-    db.delete(db_transaction)
-    db.commit()
-    return {"message": "Transaction deleted successfully"} 
\ No newline at end of file
+    await events.publish_activity(db, [account_number], deleted=[(account_number, transaction_id)])
+    return {"message": "Transaction deleted successfully"}
+
+@app.get("/events/accounts")
+async def stream_account_events(
+    request: Request,
+    account: List[str] = Query(...),
+    last_event_id: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Stream account activity as server-sent events.
+
+    Browsers resend the last seen id in the ``Last-Event-ID`` header when
+    they reconnect; ``last_event_id`` does the same for a first connect.
+    """
+    account_numbers = set(account)
+    if len(account_numbers) > events.MAX_STREAM_ACCOUNTS:
+        raise HTTPException(status_code=400, detail=f"At most {events.MAX_STREAM_ACCOUNTS} accounts per stream")
+    found = set((await db.scalars(
+        select(models.Account.account_number).where(models.Account.account_number.in_(account_numbers))
+    )).all())
+    if found != account_numbers:
+        raise HTTPException(status_code=404, detail="Account not found")
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    try:
+        last_id = int(resume_from) if resume_from else await events.latest_transaction_id(db)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    stream = events.AccountStream(db, events.hub.subscribe(account_numbers), last_id)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream.frames(), media_type="text/event-stream", headers=headers)
+
+@app.post("/reconciliation/", response_model=schemas.ReconciliationReport)
+async def run_reconciliation(incremental: bool = False, workers: int = Query(1, ge=1, le=reconcile.MAX_WORKERS),
+                             db: AsyncSession = Depends(get_db)):
+    # Runs on its own sync connection in the threadpool; a full audit can take a while
+    return await run_in_threadpool(reconcile.run, sync_url(db.bind.url), workers, incremental)
+
+_warmed = False
+_warm_lock = asyncio.Lock()
+
+async def warm_up(db: AsyncSession):
+    """Open pooled connections and load the product catalog into the cache."""
+    async def ping(pool_engine):
+        async with pool_engine.connect() as connection:
+            await connection.exec_driver_sql("SELECT 1")
+
+    await asyncio.gather(*(ping(pool_engine) for pool_engine in {async_engine, read_async_engine}
+                           for _ in range(DB_WARM_CONNECTIONS)))
+    for product in await db.scalars(select(models.Product).limit(cache.products.maxsize)):
+        cache.products.set(product.product_code, schemas.Product.model_validate(product))
+
+@app.get("/ready")
+async def get_readiness(db: AsyncSession = Depends(get_db)):
+    """Ready once the schema is current and this worker is warmed up, which happens once."""
+    global _warmed
+    if not _warmed:
+        async with _warm_lock:
+            if not _warmed:
+                pending = await db.run_sync(lambda session: migrate.pending(session.connection()))
+                if pending:
+                    raise HTTPException(status_code=503, detail={
+                        "pending_migrations": [migration.version for migration in pending]})
+                await warm_up(db)
+                _warmed = True
+    return {"status": "ready"}
+
+@app.get("/health/pool")
+async def get_pool_status():
+    return engine_pool_status()
+
+@app.get("/health/events")
+async def get_event_status():
+    return events.hub.stats()
+
+@app.get("/health/cache")
+async def get_cache_status():
+    return cache.all_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
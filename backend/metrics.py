@@ -0,0 +1,214 @@
+"""Per-route request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and keeps, per method, route
+template and status, a latency histogram, a histogram of SQL statements
+per request and running totals of database time and rows. The SQL
+figures come from cursor events on every engine passed to
+``instrument``; the events find the request through a context variable,
+so they cost one lookup when no request is being measured. Statement
+counts that grow with the result size show up as N+1 queries.
+
+With ``METRICS_DEBUG_HEADERS=true`` responses also carry the counts of
+their own request, taken when the response headers are sent, so a
+streaming response reports only the statements that ran before its
+first chunk.
+"""
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+METRICS_DEBUG_HEADERS = os.getenv("METRICS_DEBUG_HEADERS", "false").lower() in ("1", "true", "yes")
+
+STATEMENTS_HEADER = "X-DB-Statements"
+DB_TIME_HEADER = "X-DB-Time-Ms"
+ROWS_HEADER = "X-DB-Rows"
+DEBUG_HEADERS = [STATEMENTS_HEADER, DB_TIME_HEADER, ROWS_HEADER]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info["metrics_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.pop("metrics_started", None)
+    if stats is None or started is None:
+        return
+    stats.statements += 1
+    stats.db_seconds += time.perf_counter() - started
+    # The async adapters buffer the whole result on execute and report no
+    # rowcount for SELECT; other drivers report it
+    buffered = getattr(cursor, "_rows", None)
+    if cursor.description is not None and buffered is not None:
+        stats.rows += len(buffered)
+    elif cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+def instrument(engine):
+    """Count the statements, time and rows of ``engine`` (a sync Engine) per request."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "statements", "db_seconds", "rows")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+class Registry:
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route, str(status))
+        with self._lock:
+            metrics = self._routes.get(key)
+            if metrics is None:
+                metrics = self._routes[key] = RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.statements.observe(stats.statements)
+            metrics.db_seconds += stats.db_seconds
+            metrics.rows += stats.rows
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        """Render every series in the Prometheus text exposition format."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+            _render_histogram(lines, "http_request_duration_seconds", "Request latency",
+                              [(key, metrics.latency) for key, metrics in routes])
+            _render_histogram(lines, "http_request_db_statements", "SQL statements per request",
+                              [(key, metrics.statements) for key, metrics in routes])
+            _render_counter(lines, "http_request_db_seconds_total", "Time spent executing SQL",
+                            [(key, metrics.db_seconds) for key, metrics in routes])
+            _render_counter(lines, "http_request_db_rows_total", "Rows returned or written by SQL",
+                            [(key, metrics.rows) for key, metrics in routes])
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key, **extra) -> str:
+    method, route, status = key
+    pairs = dict(method=method, route=route, status=status, **extra)
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs.items())
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_histogram(lines, name, help_text, series):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in series:
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{{{_labels(key, le=bound)}}} {cumulative}")
+        lines.append(f"{name}_sum{{{_labels(key)}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{_labels(key)}}} {cumulative}")
+
+
+def _render_counter(lines, name, help_text, series):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for key, value in series:
+        lines.append(f"{name}{{{_labels(key)}}} {value}")
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording every HTTP request in ``registry``."""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def route_path(self, scope) -> str:
+        """Return the path template of the route that handled ``scope``."""
+        router = scope.get("router")
+        if router is None or "endpoint" not in scope:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {route.endpoint: route.path for route in router.routes
+                                 if hasattr(route, "endpoint")}
+        return self._route_paths.get(scope["endpoint"], "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_metrics(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if METRICS_DEBUG_HEADERS:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (STATEMENTS_HEADER.lower().encode(), str(stats.statements).encode()),
+                        (DB_TIME_HEADER.lower().encode(), f"{stats.db_seconds * 1000:.3f}".encode()),
+                        (ROWS_HEADER.lower().encode(), str(stats.rows).encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _current.reset(token)
+            registry.record(scope["method"], self.route_path(scope), status_code,
+                            time.perf_counter() - started, stats)
@@ -0,0 +1,204 @@
+"""Versioned schema migrations.
+
+The schema is defined in one place. ``models`` describes the current
+tables, and the numbered files in ``migrations/`` bring older PostgreSQL
+databases up to them. The files also add what the models cannot
+express, such as the trigram index. ``schema_migrations`` records every
+applied file, so each file runs exactly once.
+
+An empty database is created from the models. All files are then
+applied; they are written with IF NOT EXISTS, so each one only adds what
+is still missing. SQLite databases, used for development and tests, are
+created from the models alone and every file is recorded as applied.
+A database created before this runner existed has tables but no
+``schema_migrations``. Record the files it already has with
+``--baseline``.
+
+Migrations run once per deploy, never at app import:
+
+    python migrate.py
+    python migrate.py --status
+    python migrate.py --baseline 12
+
+Concurrent runs serialize on a PostgreSQL advisory lock. A run that
+waited finds the files already applied and does nothing.
+"""
+import argparse
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import inspect, insert, select
+
+import models
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+LOCK_KEY = 7355608  # pg_advisory_lock key shared by every runner
+FILE_NAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+DOLLAR_QUOTE = re.compile(r"\$(?:[A-Za-z_]\w*)?\$")
+
+Migration = namedtuple("Migration", "version name path")
+
+
+class MigrationError(Exception):
+    """The database cannot be migrated as it is."""
+
+
+def discover(directory: str = MIGRATIONS_DIR) -> list:
+    """Return the migration files of ``directory`` in version order."""
+    migrations = {}
+    for file_name in os.listdir(directory):
+        match = FILE_NAME.match(file_name)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(f"Duplicate migration version {version}")
+        migrations[version] = Migration(version, match.group(2), os.path.join(directory, file_name))
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def applied_versions(connection) -> set:
+    if not inspect(connection).has_table(models.SchemaMigration.__tablename__):
+        return set()
+    return set(connection.scalars(select(models.SchemaMigration.version)))
+
+
+def pending(connection, directory: str = MIGRATIONS_DIR) -> list:
+    """Return the migrations not yet applied to the database of ``connection``."""
+    applied = applied_versions(connection)
+    return [migration for migration in discover(directory) if migration.version not in applied]
+
+
+def _record(connection, migration: Migration):
+    connection.execute(insert(models.SchemaMigration).values(
+        version=migration.version, name=migration.name, applied_at=datetime.utcnow()))
+
+
+def split_statements(sql: str) -> list:
+    """Split ``sql`` into its statements, without comments or trailing semicolons.
+
+    Semicolons inside quoted strings, quoted identifiers, dollar-quoted
+    bodies and comments do not end a statement.
+    """
+    statements = []
+    current = []
+    i = 0
+    while i < len(sql):
+        char = sql[i]
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = len(sql) if end == -1 else end
+            continue
+        if sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = len(sql) if end == -1 else end + 2
+            continue
+        if char in "'\"":
+            end = i + 1
+            while end < len(sql):
+                if sql[end] == char:
+                    if sql.startswith(char * 2, end):
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+            continue
+        tag = DOLLAR_QUOTE.match(sql, i) if char == "$" else None
+        if tag is not None:
+            end = sql.find(tag.group(0), tag.end())
+            end = len(sql) if end == -1 else end + len(tag.group(0))
+            current.append(sql[i:end])
+            i = end
+            continue
+        if char == ";":
+            statements.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    statements.append("".join(current))
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def _run_file(connection, migration: Migration):
+    with open(migration.path) as f:
+        statements = split_statements(f.read())
+    # One statement per call, through the driver in autocommit mode. A query
+    # string of several statements runs as one implicit transaction, where
+    # CREATE INDEX CONCURRENTLY is refused; the files' own BEGIN and COMMIT
+    # still group the statements between them.
+    cursor = connection.connection.cursor()
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+    except Exception:
+        # Abandon a BEGIN block the failed statement was part of
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.close()
+
+
+def upgrade(engine, directory: str = MIGRATIONS_DIR, log=print) -> list:
+    """Apply every pending migration and return them."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        postgres = connection.dialect.name == "postgresql"
+        if postgres:
+            connection.exec_driver_sql(f"SELECT pg_advisory_lock({LOCK_KEY})")
+        try:
+            inspector = inspect(connection)
+            if not postgres or not inspector.has_table(models.Account.__tablename__):
+                models.Base.metadata.create_all(connection)
+            elif not inspector.has_table(models.SchemaMigration.__tablename__):
+                raise MigrationError(
+                    "The database predates schema_migrations; record the migrations it already has "
+                    "with --baseline VERSION")
+            applied = []
+            for migration in pending(connection, directory):
+                if postgres:
+                    log(f"Applying {os.path.basename(migration.path)}")
+                    _run_file(connection, migration)
+                _record(connection, migration)
+                applied.append(migration)
+            return applied
+        finally:
+            if postgres:
+                connection.exec_driver_sql(f"SELECT pg_advisory_unlock({LOCK_KEY})")
+
+
+def baseline(engine, version: int, directory: str = MIGRATIONS_DIR) -> list:
+    """Record the migrations up to ``version`` as applied without running them."""
+    with engine.begin() as connection:
+        models.SchemaMigration.__table__.create(connection, checkfirst=True)
+        recorded = [migration for migration in pending(connection, directory) if migration.version <= version]
+        for migration in recorded:
+            _record(connection, migration)
+    return recorded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the pending schema migrations")
+    parser.add_argument("--status", action="store_true", help="list the pending migrations and exit")
+    parser.add_argument("--baseline", type=int, metavar="VERSION",
+                        help="record migrations up to VERSION as applied without running them")
+    args = parser.parse_args()
+
+    from database import engine
+    if args.status:
+        with engine.connect() as connection:
+            for migration in pending(connection):
+                print(f"pending {os.path.basename(migration.path)}")
+    elif args.baseline is not None:
+        for migration in baseline(engine, args.baseline):
+            print(f"recorded {os.path.basename(migration.path)}")
+    else:
+        applied = upgrade(engine)
+        print({"applied": [migration.version for migration in applied]})
+
+
+if __name__ == "__main__":
+    main()
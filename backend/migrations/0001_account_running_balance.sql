@@ -0,0 +1,31 @@
+-- Maintain the running balance on the account instead of looking up the
+-- latest ledger row on every posting.
+
+BEGIN;
+
+ALTER TABLE account ADD COLUMN IF NOT EXISTS current_balance NUMERIC(12, 0);
+ALTER TABLE account ADD COLUMN IF NOT EXISTS ledger_sequence INTEGER NOT NULL DEFAULT 0;
+
+-- Accounts without postings keep their initial deposit
+UPDATE account
+SET current_balance = initial_deposit_amount,
+    ledger_sequence = 0;
+
+-- Backfill from the latest ledger row of each account
+UPDATE account a
+SET current_balance = latest.balance_after_transaction,
+    ledger_sequence = latest.posting_count
+FROM (
+    SELECT DISTINCT ON (account_number)
+           account_number,
+           balance_after_transaction,
+           COUNT(*) OVER (PARTITION BY account_number) AS posting_count
+    FROM account_transaction
+    ORDER BY account_number, transaction_date DESC, transaction_id DESC
+) latest
+WHERE a.account_number = latest.account_number;
+
+ALTER TABLE account ALTER COLUMN current_balance SET NOT NULL;
+ALTER TABLE account ALTER COLUMN current_balance SET DEFAULT 0;
+
+COMMIT;
@@ -0,0 +1,28 @@
+-- Allocate account numbers from a sequence instead of COUNT(*) + 1000.
+-- Each nextval() reserves a block of 100 numbers (models.ACCOUNT_NUMBER_BLOCK_SIZE).
+
+BEGIN;
+
+CREATE SEQUENCE IF NOT EXISTS account_number_seq START WITH 1000 INCREMENT BY 100;
+
+-- Continue after the highest number already handed out
+SELECT setval(
+    'account_number_seq',
+    GREATEST(
+        1000,
+        COALESCE(
+            (SELECT MAX(CAST(SUBSTRING(account_number FROM 5) AS INTEGER))
+             FROM account
+             WHERE account_number ~ '^100-[0-9]{7}$'),
+            0
+        ) + 1
+    ),
+    false
+);
+
+CREATE TABLE IF NOT EXISTS sequence_block (
+    name VARCHAR PRIMARY KEY,
+    next_value BIGINT NOT NULL
+);
+
+COMMIT;
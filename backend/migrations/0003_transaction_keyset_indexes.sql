@@ -0,0 +1,9 @@
+-- Composite indexes backing keyset pagination of transaction history.
+-- CONCURRENTLY keeps the ledger writable while they build, so this file
+-- must not run inside a transaction block.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_account_transaction_account_date_id
+    ON account_transaction (account_number, transaction_date, transaction_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_account_transaction_date_id
+    ON account_transaction (transaction_date, transaction_id);
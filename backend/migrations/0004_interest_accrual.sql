@@ -0,0 +1,8 @@
+-- State carried between daily interest accrual runs.
+
+BEGIN;
+
+ALTER TABLE account ADD COLUMN IF NOT EXISTS interest_accrual_remainder BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE account ADD COLUMN IF NOT EXISTS interest_accrued_through DATE;
+
+COMMIT;
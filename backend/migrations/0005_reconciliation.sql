@@ -0,0 +1,13 @@
+-- Ledger reconciliation runs and the index behind incremental runs.
+
+CREATE TABLE IF NOT EXISTS reconciliation_run (
+    run_id SERIAL PRIMARY KEY,
+    incremental BOOLEAN NOT NULL DEFAULT FALSE,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP,
+    accounts_checked INTEGER NOT NULL DEFAULT 0,
+    divergent_accounts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_account_last_modified_date
+    ON account (last_modified_date);
@@ -0,0 +1,12 @@
+-- Latest transaction_date per account, used to detect back-dated postings.
+
+ALTER TABLE account ADD COLUMN IF NOT EXISTS last_transaction_date TIMESTAMP;
+
+UPDATE account
+SET last_transaction_date = latest.transaction_date
+FROM (
+    SELECT account_number, MAX(transaction_date) AS transaction_date
+    FROM account_transaction
+    GROUP BY account_number
+) AS latest
+WHERE latest.account_number = account.account_number;
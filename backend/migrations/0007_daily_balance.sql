@@ -0,0 +1,22 @@
+-- End-of-day balance snapshots for point-in-time balance lookups.
+-- Fill with: python snapshots.py --backfill
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS daily_balance (
+    account_number VARCHAR NOT NULL REFERENCES account (account_number),
+    balance_date DATE NOT NULL,
+    closing_balance NUMERIC(12, 0) NOT NULL,
+    PRIMARY KEY (account_number, balance_date)
+);
+
+CREATE TABLE IF NOT EXISTS balance_snapshot_run (
+    run_id SERIAL PRIMARY KEY,
+    backfill BOOLEAN NOT NULL DEFAULT FALSE,
+    through_date DATE NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP,
+    snapshots_written INTEGER NOT NULL DEFAULT 0
+);
+
+COMMIT;
@@ -0,0 +1,4 @@
+-- Customer account listings and summaries look accounts up by customer.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_account_customer_id
+    ON account (customer_id);
@@ -0,0 +1,18 @@
+-- Idempotency-Key claims and stored responses, used with IDEMPOTENCY_STORE=database.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS idempotency_key (
+    scope VARCHAR NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    fingerprint VARCHAR(64) NOT NULL,
+    status_code INTEGER,
+    response_body BYTEA,
+    created_at TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, key)
+);
+
+CREATE INDEX IF NOT EXISTS ix_idempotency_key_expires_at ON idempotency_key (expires_at);
+
+COMMIT;
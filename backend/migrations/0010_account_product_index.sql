@@ -0,0 +1,7 @@
+-- Product deletes probe account by product_code with EXISTS. The other
+-- foreign keys are already covered: account.customer_id by
+-- ix_account_customer_id and account_transaction.account_number by the
+-- leading column of ix_account_transaction_account_date_id.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_account_product_code
+    ON account (product_code);
@@ -0,0 +1,32 @@
+-- Archival of old ledger rows to columnar files.
+-- Run with: python archive.py [--cutoff 2023-01-01]
+
+BEGIN;
+
+ALTER TABLE account ADD COLUMN IF NOT EXISTS archived_before TIMESTAMP;
+ALTER TABLE account ADD COLUMN IF NOT EXISTS archived_balance NUMERIC(12, 0);
+
+CREATE TABLE IF NOT EXISTS ledger_archive_run (
+    run_id SERIAL PRIMARY KEY,
+    cutoff TIMESTAMP NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP,
+    rows_archived INTEGER NOT NULL DEFAULT 0,
+    files_written INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS ledger_archive_file (
+    file_id SERIAL PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES ledger_archive_run (run_id),
+    month DATE NOT NULL,
+    first_account VARCHAR NOT NULL,
+    last_account VARCHAR NOT NULL,
+    row_count INTEGER NOT NULL,
+    path VARCHAR NOT NULL UNIQUE,
+    created_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_ledger_archive_file_month_account
+    ON ledger_archive_file (month, first_account);
+
+COMMIT;
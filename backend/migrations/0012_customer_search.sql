@@ -0,0 +1,14 @@
+-- Indexes for GET /customers/search. Name prefixes are an index range scan
+-- over lower(customer_name) in the "C" collation, substrings use a trigram
+-- index and real-name identification numbers match exactly.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customer_name_prefix
+    ON customer ((lower(customer_name) COLLATE "C"));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customer_name_trgm
+    ON customer USING gin (lower(customer_name) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customer_real_name_identification_number
+    ON customer (real_name_identification_number);
@@ -0,0 +1,12 @@
+-- Version table of migrate.py, and the index behind the product list ETag.
+-- Databases created before the runner existed record their applied files
+-- with `python migrate.py --baseline 12` before running this one.
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR NOT NULL,
+    applied_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_last_modified_date
+    ON product (last_modified_date);
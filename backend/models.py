@@ -1,22 +1,59 @@
-from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, ForeignKey, Enum
+from sqlalchemy import DDL, collate, event, func, Column, Integer, BigInteger, String, Numeric, Boolean, Date, DateTime, ForeignKey, Enum, Sequence, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
 Base = declarative_base()
 
+# Account numbers are reserved from the database in blocks of this size
+ACCOUNT_NUMBER_START = 1000
+ACCOUNT_NUMBER_BLOCK_SIZE = 100
+
+account_number_seq = Sequence(
+    "account_number_seq",
+    start=ACCOUNT_NUMBER_START,
+    increment=ACCOUNT_NUMBER_BLOCK_SIZE,
+    metadata=Base.metadata,
+)
+
 class Customer(Base):
     __tablename__ = "customer"
 
     customer_id = Column(String, primary_key=True)
     customer_name = Column(String, nullable=False)
     customer_type = Column(Integer, nullable=False)  # 1: Individual, 2: Corporate
-    real_name_identification_number = Column(String(13), nullable=False)
+    real_name_identification_number = Column(String(13), nullable=False, index=True)  # Exact-match search
     registration_date = Column(DateTime, default=datetime.utcnow)
     last_modified_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     accounts = relationship("Account", back_populates="customer")
 
+# Name prefix search scans lower(customer_name) in byte order; PostgreSQL
+# also gets a trigram index for substrings in migration 0012
+Index("ix_customer_name_prefix", collate(func.lower(Customer.customer_name), "C")).ddl_if(dialect="postgresql")
+Index("ix_customer_name_prefix", func.lower(Customer.customer_name)).ddl_if(dialect="sqlite")
+
+# SQLite stand-in for the trigram index: an FTS5 trigram table over the
+# customer rows, kept in sync by triggers
+CUSTOMER_NAME_TRIGRAM = "customer_name_trigram"
+for statement in (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {CUSTOMER_NAME_TRIGRAM} USING fts5("
+    "customer_name, content='customer', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS customer_name_trigram_insert AFTER INSERT ON customer BEGIN "
+    f"INSERT INTO {CUSTOMER_NAME_TRIGRAM} (rowid, customer_name) VALUES (new.rowid, new.customer_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS customer_name_trigram_delete AFTER DELETE ON customer BEGIN "
+    f"INSERT INTO {CUSTOMER_NAME_TRIGRAM} ({CUSTOMER_NAME_TRIGRAM}, rowid, customer_name) "
+    "VALUES ('delete', old.rowid, old.customer_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS customer_name_trigram_update AFTER UPDATE OF customer_name ON customer BEGIN "
+    f"INSERT INTO {CUSTOMER_NAME_TRIGRAM} ({CUSTOMER_NAME_TRIGRAM}, rowid, customer_name) "
+    "VALUES ('delete', old.rowid, old.customer_name); "
+    f"INSERT INTO {CUSTOMER_NAME_TRIGRAM} (rowid, customer_name) VALUES (new.rowid, new.customer_name); END",
+    f"INSERT INTO {CUSTOMER_NAME_TRIGRAM} ({CUSTOMER_NAME_TRIGRAM}) VALUES ('rebuild')",
+):
+    event.listen(Customer.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Customer.__table__, "before_drop",
+             DDL(f"DROP TABLE IF EXISTS {CUSTOMER_NAME_TRIGRAM}").execute_if(dialect="sqlite"))
+
 class Product(Base):
     __tablename__ = "product"
 
@@ -29,7 +66,7 @@ class Product(Base):
     additional_interest_rate = Column(Numeric(5, 3), nullable=False)
     applied_interest_rate = Column(Numeric(5, 3), nullable=False)
     registration_date = Column(DateTime, default=datetime.utcnow)
-    last_modified_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    last_modified_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Product list ETag
 
     accounts = relationship("Account", back_populates="product")
 
@@ -37,8 +74,8 @@ class Account(Base):
     __tablename__ = "account"
 
     account_number = Column(String, primary_key=True)
-    customer_id = Column(String, ForeignKey("customer.customer_id"), nullable=False)
-    product_code = Column(String(6), ForeignKey("product.product_code"), nullable=False)
+    customer_id = Column(String, ForeignKey("customer.customer_id"), nullable=False, index=True)  # Customer dashboards
+    product_code = Column(String(6), ForeignKey("product.product_code"), nullable=False, index=True)  # Product delete guard
     real_name_identification_number = Column(String(13), nullable=False)
     customer_type = Column(Integer, nullable=False)
     taxation_code = Column(String(1), nullable=False)
@@ -51,8 +88,15 @@ class Account(Base):
     cash_amount = Column(Numeric(12, 0), nullable=False)
     linked_substitute_amount = Column(Numeric(12, 0), nullable=False)
     linked_substitute_account_number = Column(String(10))
+    current_balance = Column(Numeric(12, 0), nullable=False, default=0)  # Running balance maintained by posting
+    ledger_sequence = Column(Integer, nullable=False, default=0)  # Number of postings applied to current_balance
+    interest_accrual_remainder = Column(BigInteger, nullable=False, default=0)  # Sub-won interest carried to the next accrual
+    last_transaction_date = Column(DateTime)  # Latest transaction_date in the ledger; earlier postings are back-dated
+    interest_accrued_through = Column(Date)  # Last day interest was accrued for
+    archived_before = Column(DateTime)  # Ledger rows dated before this were moved to archive files
+    archived_balance = Column(Numeric(12, 0))  # Balance after the last archived row; the hot chain's opening balance
     account_opening_date = Column(DateTime, default=datetime.utcnow)
-    last_modified_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    last_modified_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Drives incremental reconciliation
 
     customer = relationship("Customer", back_populates="accounts")
     product = relationship("Product", back_populates="accounts")
@@ -69,4 +113,92 @@ class AccountTransaction(Base):
     balance_after_transaction = Column(Numeric(12, 0), nullable=False)
     registration_date = Column(DateTime, default=datetime.utcnow)
 
-    account = relationship("Account", back_populates="transactions") 
\ No newline at end of file
+    account = relationship("Account", back_populates="transactions")
+
+    __table_args__ = (
+        # Keyset pagination of an account's history and of the full ledger
+        Index("ix_account_transaction_account_date_id", "account_number", "transaction_date", "transaction_id"),
+        Index("ix_account_transaction_date_id", "transaction_date", "transaction_id"),
+    ) 
+
+class SequenceBlock(Base):
+    """Block counter used where the database has no native sequences (SQLite)."""
+    __tablename__ = "sequence_block"
+
+    name = Column(String, primary_key=True)
+    next_value = Column(BigInteger, nullable=False)
+
+class ReconciliationRun(Base):
+    __tablename__ = "reconciliation_run"
+
+    run_id = Column(Integer, primary_key=True, autoincrement=True)
+    incremental = Column(Boolean, nullable=False, default=False)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    accounts_checked = Column(Integer, nullable=False, default=0)
+    divergent_accounts = Column(Integer, nullable=False, default=0)
+
+class DailyBalance(Base):
+    """Closing balance of an account on a day it had transactions."""
+    __tablename__ = "daily_balance"
+
+    account_number = Column(String, ForeignKey("account.account_number"), primary_key=True)
+    balance_date = Column(Date, primary_key=True)
+    closing_balance = Column(Numeric(12, 0), nullable=False)
+
+class BalanceSnapshotRun(Base):
+    __tablename__ = "balance_snapshot_run"
+
+    run_id = Column(Integer, primary_key=True, autoincrement=True)
+    backfill = Column(Boolean, nullable=False, default=False)
+    through_date = Column(Date, nullable=False)  # Every day up to and including this one is snapshotted
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    snapshots_written = Column(Integer, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    """Claimed Idempotency-Key and, once the request completed, its response."""
+    __tablename__ = "idempotency_key"
+
+    scope = Column(String, primary_key=True)  # Method and path the key was used on
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 of the request
+    status_code = Column(Integer)  # Null while the request is in flight
+    response_body = Column(LargeBinary)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class LedgerArchiveRun(Base):
+    __tablename__ = "ledger_archive_run"
+
+    run_id = Column(Integer, primary_key=True, autoincrement=True)
+    cutoff = Column(DateTime, nullable=False)  # Rows dated before this are archived; postings before it are rejected
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    rows_archived = Column(Integer, nullable=False, default=0)
+    files_written = Column(Integer, nullable=False, default=0)
+
+class LedgerArchiveFile(Base):
+    """Columnar file holding one month of archived ledger rows for an account-number range."""
+    __tablename__ = "ledger_archive_file"
+
+    file_id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, ForeignKey("ledger_archive_run.run_id"), nullable=False)
+    month = Column(Date, nullable=False)  # First day of the month
+    first_account = Column(String, nullable=False)
+    last_account = Column(String, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    path = Column(String, nullable=False, unique=True)  # Relative to ARCHIVE_DIR
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_ledger_archive_file_month_account", "month", "first_account"),
+    )
+
+class SchemaMigration(Base):
+    """A file of ``migrations/`` that ``migrate.py`` has applied."""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)  # The file's number
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, nullable=False, default=datetime.utcnow)
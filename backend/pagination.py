@@ -0,0 +1,55 @@
+"""Keyset (cursor) pagination for ledger queries.
+
+Pages are ordered by ``(transaction_date, transaction_id)`` and each page
+continues strictly after the last row of the previous one, so fetching
+a deep page costs one index seek instead of skipping every earlier row.
+"""
+import base64
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import tuple_
+
+import models
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(transaction) -> str:
+    """Encode the position of a transaction instance or row."""
+    raw = f"{transaction.transaction_date.isoformat()}|{transaction.transaction_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        transaction_date, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(transaction_date), int(transaction_id)
+    except ValueError:
+        raise InvalidCursorError(cursor)
+
+
+def transaction_page(stmt, cursor: Optional[str], from_date: Optional[datetime],
+                     to_date: Optional[datetime], limit: int):
+    """Narrow a select over ``account_transaction`` to one page.
+
+    ``from_date`` is inclusive and ``to_date`` exclusive.
+    """
+    T = models.AccountTransaction
+    if from_date is not None:
+        stmt = stmt.where(T.transaction_date >= from_date)
+    if to_date is not None:
+        stmt = stmt.where(T.transaction_date < to_date)
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(T.transaction_date, T.transaction_id) > tuple_(*after))
+    return stmt.order_by(T.transaction_date, T.transaction_id).limit(limit)
+
+
+def next_cursor(rows, limit: int) -> Optional[str]:
+    """Cursor for the page after ``rows``, or None once the last page was returned."""
+    return encode_cursor(rows[-1]) if rows and len(rows) == limit else None
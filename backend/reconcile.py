@@ -0,0 +1,189 @@
+"""Ledger reconciliation.
+
+Verifies that every account's transaction chain is consistent: ordered
+by ``(transaction_date, transaction_id)``, each ``balance_after_transaction``
+must equal the previous balance plus or minus ``transaction_amount``,
+starting from ``archived_balance`` for archived accounts and
+``initial_deposit_amount`` otherwise, and the last balance must match
+``Account.current_balance``. Archived rows are not re-verified.
+
+Accounts are split into contiguous account-number ranges and each range
+is verified by a separate process streaming the ledger through a
+server-side cursor, so a full audit scales with cores. Incremental runs
+only re-verify accounts modified since the previous run started.
+
+    python reconcile.py --workers 8 [--incremental]
+"""
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+import ledger
+import models
+import schemas
+
+FETCH_SIZE = 10000
+# Upper bound on the worker processes one API request may start
+MAX_WORKERS = int(os.getenv("RECONCILE_MAX_WORKERS", "8"))
+
+
+def verify_account(account_number, opening_balance, current_balance, rows) -> list:
+    """Return the divergences of one account's chain; ``rows`` are in posting order."""
+    divergences = []
+    balance = Decimal(str(opening_balance))
+    for transaction_id, transaction_type, transaction_amount, balance_after in rows:
+        if transaction_id is None:
+            # Account without transactions (outer join)
+            continue
+        balance += ledger.signed_amount(transaction_type, transaction_amount)
+        actual = Decimal(str(balance_after))
+        if actual != balance and not divergences:
+            divergences.append(schemas.LedgerDivergence(
+                account_number=account_number, reason="chain", transaction_id=transaction_id,
+                expected_balance=balance, actual_balance=actual,
+            ))
+        # Continue from the recorded balance so one bad row is reported once
+        balance = actual
+    actual = Decimal(str(current_balance))
+    if actual != balance:
+        divergences.append(schemas.LedgerDivergence(
+            account_number=account_number, reason="current_balance",
+            expected_balance=balance, actual_balance=actual,
+        ))
+    return divergences
+
+
+def _account_filter(stmt, first, last, touched_since):
+    A = models.Account
+    if first is not None:
+        stmt = stmt.where(A.account_number >= first)
+    if last is not None:
+        stmt = stmt.where(A.account_number <= last)
+    if touched_since is not None:
+        stmt = stmt.where(A.last_modified_date >= touched_since)
+    return stmt
+
+
+def reconcile_range(db: Session, first=None, last=None, touched_since=None):
+    """Verify accounts in ``[first, last]``; returns ``(accounts_checked, divergences)``."""
+    A = models.Account
+    T = models.AccountTransaction
+    stmt = select(
+        A.account_number, func.coalesce(A.archived_balance, A.initial_deposit_amount), A.current_balance,
+        T.transaction_id, T.transaction_type, T.transaction_amount, T.balance_after_transaction,
+    ).outerjoin(T, T.account_number == A.account_number)\
+        .order_by(A.account_number, T.transaction_date, T.transaction_id)\
+        .execution_options(yield_per=FETCH_SIZE)
+    stmt = _account_filter(stmt, first, last, touched_since)
+
+    checked = 0
+    divergences = []
+    for (account_number, opening, current), rows in groupby(db.execute(stmt), key=itemgetter(0, 1, 2)):
+        checked += 1
+        divergences.extend(verify_account(account_number, opening, current, (row[3:] for row in rows)))
+    return checked, divergences
+
+
+def _reconcile_shard(url, first, last, touched_since):
+    engine = create_engine(url)
+    try:
+        with Session(engine) as db:
+            return reconcile_range(db, first, last, touched_since)
+    finally:
+        engine.dispose()
+
+
+def shard_bounds(db: Session, shards: int, touched_since=None) -> list:
+    """Split the accounts into ``shards`` contiguous, roughly equal account-number ranges."""
+    A = models.Account
+    numbered = _account_filter(
+        select(A.account_number, func.ntile(shards).over(order_by=A.account_number).label("shard")),
+        None, None, touched_since,
+    ).subquery()
+    stmt = select(func.min(numbered.c.account_number), func.max(numbered.c.account_number))\
+        .group_by(numbered.c.shard)\
+        .order_by(numbered.c.shard)
+    return [tuple(bounds) for bounds in db.execute(stmt)]
+
+
+def reconcile(db: Session, url: str, workers: int = 1, incremental: bool = False) -> schemas.ReconciliationReport:
+    """Run a full or incremental reconciliation and record it in ``reconciliation_run``.
+
+    ``db`` records the run; with more than one worker each shard opens its
+    own connection to ``url``.
+    """
+    touched_since = None
+    if incremental:
+        previous = db.execute(
+            select(models.ReconciliationRun)
+            .where(models.ReconciliationRun.finished_at.is_not(None))
+            .order_by(models.ReconciliationRun.run_id.desc())
+            .limit(1)
+        ).scalar_one_or_none()
+        if previous is not None:
+            touched_since = previous.started_at
+
+    run = models.ReconciliationRun(incremental=incremental, started_at=datetime.utcnow())
+    db.add(run)
+    db.commit()
+
+    checked = 0
+    divergences = []
+    if workers > 1:
+        bounds = shard_bounds(db, workers, touched_since)
+        db.rollback()  # Release the snapshot while the shards run
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_reconcile_shard, url, first, last, touched_since) for first, last in bounds]
+            for future in futures:
+                shard_checked, shard_divergences = future.result()
+                checked += shard_checked
+                divergences.extend(shard_divergences)
+    else:
+        checked, divergences = reconcile_range(db, touched_since=touched_since)
+
+    run.finished_at = datetime.utcnow()
+    run.accounts_checked = checked
+    run.divergent_accounts = len({d.account_number for d in divergences})
+    db.commit()
+
+    return schemas.ReconciliationReport(
+        run_id=run.run_id,
+        incremental=incremental,
+        started_at=run.started_at,
+        finished_at=run.finished_at,
+        accounts_checked=checked,
+        divergent_accounts=divergences,
+    )
+
+
+def run(url: str, workers: int = 1, incremental: bool = False) -> schemas.ReconciliationReport:
+    """Reconcile the database at ``url`` on a dedicated connection."""
+    engine = create_engine(url)
+    try:
+        with Session(engine) as db:
+            return reconcile(db, url, workers, incremental)
+    finally:
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify every account's ledger chain")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--incremental", action="store_true",
+                        help="only accounts modified since the previous run")
+    args = parser.parse_args()
+
+    from database import SQLALCHEMY_DATABASE_URL
+    print(run(SQLALCHEMY_DATABASE_URL, args.workers, args.incremental).model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timezone
 from decimal import Decimal
 
 class CustomerBase(BaseModel):
@@ -67,25 +67,81 @@ class AccountCreate(AccountBase):
 
 class Account(AccountBase):
     account_number: str
+    current_balance: Decimal
+    ledger_sequence: int
     account_opening_date: datetime
     last_modified_date: datetime
 
     class Config:
         from_attributes = True
 
+class AccountActivity(Account):
+    transaction_count: int
+    last_activity: Optional[datetime] = None  # Latest transaction_date
+
+class CustomerSummary(BaseModel):
+    customer_id: str
+    customer_name: str
+    account_count: int
+    total_balance: Decimal
+    transaction_count: int
+    last_activity: Optional[datetime] = None
+
+class AccountBalance(BaseModel):
+    account_number: str
+    as_of: Optional[datetime] = None  # None for the current balance
+    balance: Decimal
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to the naive UTC the ledger's TIMESTAMP columns hold."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 class TransactionBase(BaseModel):
     account_number: str
     transaction_date: datetime
     transaction_type: int = Field(..., ge=1, le=2)
     transaction_amount: Decimal = Field(..., gt=0)
-    balance_after_transaction: Decimal = Field(..., ge=0)
+
+    # Clients send ISO dates with an offset, e.g. "...Z" from toISOString()
+    _naive_transaction_date = validator('transaction_date', allow_reuse=True)(naive_utc)
 
 class TransactionCreate(TransactionBase):
-    pass
+    # Ignored: the balance is always computed by the server
+    balance_after_transaction: Optional[Decimal] = None
 
 class Transaction(TransactionBase):
     transaction_id: int
+    balance_after_transaction: Decimal
     registration_date: datetime
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class TransactionBatchItemResult(BaseModel):
+    index: int
+    status: str  # posted, rejected
+    transaction_id: Optional[int] = None
+    balance_after_transaction: Optional[Decimal] = None
+    detail: Optional[str] = None
+
+class TransactionBatchResult(BaseModel):
+    posted: int
+    rejected: int
+    results: List[TransactionBatchItemResult]
+
+class LedgerDivergence(BaseModel):
+    account_number: str
+    reason: str  # chain, current_balance
+    transaction_id: Optional[int] = None
+    expected_balance: Decimal
+    actual_balance: Decimal
+
+class ReconciliationReport(BaseModel):
+    run_id: int
+    incremental: bool
+    started_at: datetime
+    finished_at: datetime
+    accounts_checked: int
+    divergent_accounts: List[LedgerDivergence]
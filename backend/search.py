@@ -0,0 +1,90 @@
+"""Customer search for type-ahead lookups.
+
+A query of 13 digits is a real-name identification number and matches
+exactly through ``ix_customer_real_name_identification_number``. Any
+other query matches customer names case-insensitively. Name prefix
+matches come first, in name order. Substring matches then fill the rest
+of the limit, once the query is ``MIN_SUBSTRING_LENGTH`` characters
+long. That is the shortest query a trigram index can narrow down.
+
+Every step is one indexed query with a LIMIT, so latency does not grow
+with the number of customers:
+
+- Prefixes are an index range scan over ``lower(customer_name)``. On
+  PostgreSQL the index and the comparison use the "C" collation, so the
+  range is byte-wise and the index also returns the rows in order.
+- Substrings use the ``pg_trgm`` GIN index from migration 0012 on
+  PostgreSQL. On SQLite they use the FTS5 trigram table
+  ``customer_name_trigram``, which triggers keep in step with
+  ``customer``.
+"""
+from sqlalchemy import collate, func, literal_column, select, table
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+import serialization
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MIN_SUBSTRING_LENGTH = 3
+REAL_NAME_ID_LENGTH = 13
+
+
+def name_key(dialect_name: str):
+    """The indexed sort key of ``customer_name`` on this dialect."""
+    lowered = func.lower(models.Customer.customer_name)
+    return collate(lowered, "C") if dialect_name == "postgresql" else lowered
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def name_contains(dialect_name: str, text: str):
+    """A trigram-indexed filter for customers whose lowered name contains ``text``."""
+    C = models.Customer
+    if dialect_name == "sqlite":
+        trigrams = table(models.CUSTOMER_NAME_TRIGRAM)
+        phrase = '"' + text.replace('"', '""') + '"'
+        matches = select(literal_column("rowid")).select_from(trigrams)\
+            .where(literal_column(models.CUSTOMER_NAME_TRIGRAM).op("MATCH")(phrase))
+        return literal_column("customer.rowid").in_(matches)
+    # Matches the trigram index expression, which has no collation
+    return func.lower(C.customer_name).like(f"%{_escape_like(text)}%", escape="\\")
+
+
+def _prefix_range(key, prefix: str):
+    last = ord(prefix[-1])
+    if last == 0x10FFFF:
+        return (key.startswith(prefix, autoescape=True),)
+    return key >= prefix, key < prefix[:-1] + chr(last + 1)
+
+
+def find_customers(db: Session, query: str, limit: int = DEFAULT_LIMIT) -> list:
+    """Return up to ``limit`` customers matching ``query``, as ``schemas.Customer`` rows."""
+    C = models.Customer
+    columns = serialization.columns(C, schemas.Customer)
+    query = query.strip()
+    if not query:
+        return []
+    if query.isdigit() and len(query) == REAL_NAME_ID_LENGTH:
+        return db.execute(
+            select(*columns)
+            .where(C.real_name_identification_number == query)
+            .order_by(C.customer_name, C.customer_id)
+            .limit(limit)
+        ).all()
+
+    text = query.lower()
+    dialect_name = db.get_bind().dialect.name
+    key = name_key(dialect_name)
+    rows = db.execute(
+        select(*columns).where(*_prefix_range(key, text)).order_by(key, C.customer_id).limit(limit)
+    ).all()
+    if len(rows) < limit and len(text) >= MIN_SUBSTRING_LENGTH:
+        stmt = select(*columns).where(name_contains(dialect_name, text)).limit(limit - len(rows))
+        if rows:
+            stmt = stmt.where(C.customer_id.notin_([row.customer_id for row in rows]))
+        rows += sorted(db.execute(stmt).all(), key=lambda row: (row.customer_name.lower(), row.customer_id))
+    return rows
@@ -0,0 +1,110 @@
+"""Block-reserved number allocation.
+
+Each worker reserves a block of numbers from the database in one
+round-trip and hands them out from memory, so allocation cost does not
+depend on table size and numbers are never reused across workers, even
+after deletes. PostgreSQL reserves blocks from a native sequence whose
+increment is the block size; other databases fall back to a counter row
+in ``sequence_block``. Numbers left in a block when a worker exits are
+skipped, never reissued. A counter row created on a database that
+already holds account numbers starts after the highest of them, as
+migration 0002 does for the sequence.
+"""
+import threading
+
+from sqlalchemy import Integer, cast, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+
+class BlockAllocator:
+    def __init__(self, sequence, block_size: int, floor=None):
+        self.sequence = sequence
+        self.block_size = block_size
+        self.floor = floor  # Optional floor(connection): the first number not yet in use
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._spare = []
+
+    def next_value(self, db: Session) -> int:
+        return self.reserve(db, 1)[0]
+
+    def reserve(self, db: Session, count: int) -> list:
+        """Return ``count`` unique numbers, reserving new blocks as needed."""
+        values = []
+        while len(values) < count:
+            with self._lock:
+                if self._next >= self._end and self._spare:
+                    self._next, self._end = self._spare.pop()
+                take = min(count - len(values), self._end - self._next)
+                if take > 0:
+                    values.extend(range(self._next, self._next + take))
+                    self._next += take
+                    continue
+            # Reserved outside the lock: under AsyncSession.run_sync the
+            # database wait yields to other requests on this same thread,
+            # which would block on the lock and never let it finish
+            start = self._reserve_block(db)
+            with self._lock:
+                self._spare.append((start, start + self.block_size))
+        return values
+
+    def _reserve_block(self, db: Session) -> int:
+        bind = db.get_bind()
+        if bind.dialect.supports_sequences:
+            # nextval() is not transactional, the block survives a rollback
+            return db.execute(select(self.sequence.next_value())).scalar_one()
+        return self._reserve_counter_block(bind)
+
+    def _reserve_counter_block(self, bind) -> int:
+        # Own connection and commit, so the caller rolling back cannot hand
+        # the same block to another worker.
+        counter = models.SequenceBlock
+        while True:
+            with bind.connect() as conn:
+                start = conn.execute(
+                    update(counter)
+                    .where(counter.name == self.sequence.name)
+                    .values(next_value=counter.next_value + self.block_size)
+                    .returning(counter.next_value - self.block_size)
+                ).scalar_one_or_none()
+                if start is None:
+                    start = self.sequence.start
+                    if self.floor is not None:
+                        start = max(start, self.floor(conn))
+                    try:
+                        conn.execute(counter.__table__.insert().values(
+                            name=self.sequence.name,
+                            next_value=start + self.block_size,
+                        ))
+                    except IntegrityError:
+                        # Another worker created the counter first
+                        conn.rollback()
+                        continue
+                conn.commit()
+                return start
+
+
+def first_unused_account_number(conn) -> int:
+    """One past the highest account number already handed out, or 0 when there is none."""
+    A = models.Account
+    highest = conn.execute(
+        select(func.max(cast(func.substr(A.account_number, 5), Integer)))
+        .where(A.account_number.like("100-_______"))
+    ).scalar()
+    return (highest or 0) + 1
+
+
+account_numbers = BlockAllocator(models.account_number_seq, models.ACCOUNT_NUMBER_BLOCK_SIZE,
+                                 floor=first_unused_account_number)
+
+
+def format_account_number(value: int) -> str:
+    return f"100-{value:07d}"
+
+
+def next_account_number(db: Session) -> str:
+    return format_account_number(account_numbers.next_value(db))
@@ -0,0 +1,40 @@
+"""Fast JSON responses for list endpoints.
+
+List pages select only the columns their response schema declares, as
+plain row tuples, and encode them with orjson in one call. There are no
+ORM instances and no per-row Pydantic validation, which is safe because
+every value comes straight from the database. The output matches what
+the schemas produce: the same keys in the same order, Decimals as
+strings and datetimes in ISO 8601. The routes keep their
+``response_model`` for the OpenAPI schema.
+"""
+from decimal import Decimal
+
+import orjson
+from fastapi import Response
+
+
+def columns(model, schema) -> list:
+    """Return the ``model`` columns for every field of ``schema``, in field order."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_rows(schema, rows) -> bytes:
+    """Encode rows selected with ``columns(model, schema)`` as a JSON array."""
+    names = tuple(schema.model_fields)
+    return orjson.dumps([dict(zip(names, row)) for row in rows], default=_default)
+
+
+def encode_row(schema, row) -> bytes:
+    """Encode one row selected with ``columns(model, schema)`` as a JSON object."""
+    return orjson.dumps(dict(zip(schema.model_fields, row)), default=_default)
+
+
+def rows_response(schema, rows, headers=None) -> Response:
+    return Response(content=encode_rows(schema, rows), media_type="application/json", headers=headers)
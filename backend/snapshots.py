@@ -0,0 +1,231 @@
+"""End-of-day balance snapshots.
+
+``daily_balance`` holds the closing balance of every account on every day
+it had transactions, up to the ``through_date`` of the last finished
+``balance_snapshot_run``. The end-of-day job only reads the ledger rows
+dated after that watermark, and a backfill rebuilds the table from the
+ledger in account-number chunks. Snapshots of archived days are kept, since
+their rows are no longer in the ledger, so a backfill starts at the
+archive watermark. Both take the closing balance from
+the last row of each day with one windowed INSERT ... SELECT per chunk.
+
+A balance as of any moment is then the ``balance_after_transaction`` of
+the latest row between the last snapshot before that day and the moment
+itself, or the snapshot's closing balance when there is none, so a
+lookup reads one snapshot row plus at most a day's worth of ledger. A
+moment before the account's archive cutoff reads that day from the
+archive files instead.
+
+Postings dated before today, deleted rows and rebalances call
+``invalidate``, which drops and rebuilds the affected snapshots inside
+the posting's transaction. Only completed days can be closed.
+
+    python snapshots.py [--through 2024-01-31] [--backfill]
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+import archive
+import models
+
+CHUNK_SIZE = 10000
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _closing_balances(from_day: Optional[date], through_day: date, first=None, last=None, account_numbers=None):
+    """Select ``(account_number, balance_date, closing_balance)`` from the ledger."""
+    T = models.AccountTransaction
+    day = func.date(T.transaction_date)
+    ranked = select(
+        T.account_number,
+        day.label("balance_date"),
+        T.balance_after_transaction,
+        func.row_number().over(
+            partition_by=(T.account_number, day),
+            order_by=(T.transaction_date.desc(), T.transaction_id.desc()),
+        ).label("position"),
+    ).where(T.transaction_date < _day_start(through_day + timedelta(days=1)))
+    if from_day is not None:
+        ranked = ranked.where(T.transaction_date >= _day_start(from_day))
+    if first is not None:
+        ranked = ranked.where(T.account_number.between(first, last))
+    if account_numbers is not None:
+        ranked = ranked.where(T.account_number.in_(account_numbers))
+    ranked = ranked.subquery()
+    return select(ranked.c.account_number, ranked.c.balance_date, ranked.c.balance_after_transaction)\
+        .where(ranked.c.position == 1)
+
+
+def _write_snapshots(db: Session, rows) -> int:
+    D = models.DailyBalance.__table__
+    result = db.execute(
+        D.insert().from_select(["account_number", "balance_date", "closing_balance"], rows)
+    )
+    return max(result.rowcount, 0)
+
+
+def invalidate(db: Session, account_numbers, from_day: date):
+    """Rebuild the snapshots of ``account_numbers`` from ``from_day`` on.
+
+    Called after the ledger rows of those days changed. Only days that
+    were already snapshotted are rebuilt. The caller owns the transaction
+    and must have flushed the ledger changes.
+    """
+    D = models.DailyBalance.__table__
+    dropped = db.execute(
+        D.delete()
+        .where(D.c.account_number.in_(account_numbers), D.c.balance_date >= from_day)
+        .returning(D.c.balance_date)
+    ).scalars().all()
+    if dropped:
+        _write_snapshots(db, _closing_balances(from_day, max(dropped), account_numbers=account_numbers))
+
+
+def last_run(db: Session) -> Optional[models.BalanceSnapshotRun]:
+    """Return the last finished snapshot run; its ``through_date`` is the watermark."""
+    return db.execute(
+        select(models.BalanceSnapshotRun)
+        .where(models.BalanceSnapshotRun.finished_at.is_not(None))
+        .order_by(models.BalanceSnapshotRun.run_id.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+
+
+def _chunk_bounds(db: Session, after, chunk_size: int):
+    stmt = select(models.Account.account_number)\
+        .order_by(models.Account.account_number)\
+        .limit(chunk_size)
+    if after is not None:
+        stmt = stmt.where(models.Account.account_number > after)
+    numbers = db.execute(stmt).scalars().all()
+    return (numbers[0], numbers[-1]) if numbers else None
+
+
+def close_days(db: Session, through_date: Optional[date] = None, backfill: bool = False,
+               chunk_size: int = CHUNK_SIZE) -> models.BalanceSnapshotRun:
+    """Snapshot every day after the watermark up to ``through_date``.
+
+    ``through_date`` defaults to yesterday and must be before today. With
+    ``backfill`` the snapshots from the archive watermark up to
+    ``through_date`` are rebuilt from the ledger. Each chunk of accounts commits on its own; the run only
+    moves the watermark once every chunk is written. Returns the previous
+    run when there is nothing new to snapshot.
+    """
+    if through_date is None:
+        through_date = date.today() - timedelta(days=1)
+    if through_date >= date.today():
+        raise ValueError("Only completed days can be snapshotted")
+
+    from_day = None
+    if backfill:
+        cutoff = archive.watermark(db)
+        if cutoff is not None:
+            from_day = cutoff.date()
+    else:
+        previous = last_run(db)
+        if previous is not None:
+            if previous.through_date >= through_date:
+                return previous
+            from_day = previous.through_date + timedelta(days=1)
+
+    run = models.BalanceSnapshotRun(backfill=backfill, through_date=through_date, started_at=datetime.utcnow())
+    db.add(run)
+    db.commit()
+
+    D = models.DailyBalance
+    written = 0
+    after = None
+    while True:
+        bounds = _chunk_bounds(db, after, chunk_size)
+        if bounds is None:
+            break
+        after = bounds[1]
+        try:
+            stale = delete(D).where(D.account_number.between(*bounds), D.balance_date <= through_date)
+            if from_day is not None:
+                stale = stale.where(D.balance_date >= from_day)
+            db.execute(stale.execution_options(synchronize_session=False))
+            written += _write_snapshots(db, _closing_balances(from_day, through_date, *bounds))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    run.finished_at = datetime.utcnow()
+    run.snapshots_written = written
+    db.commit()
+    return run
+
+
+def balance_as_of(db: Session, account_number: str, as_of: datetime) -> Optional[Decimal]:
+    """Return the account's balance after every posting dated at or before ``as_of``.
+
+    Before the first posting this is the initial deposit. Returns None
+    when the account does not exist.
+    """
+    A = models.Account
+    D = models.DailyBalance
+    T = models.AccountTransaction
+    snapshot = select(D).where(D.account_number == account_number, D.balance_date < as_of.date())\
+        .order_by(D.balance_date.desc())\
+        .limit(1)\
+        .subquery()
+    account = db.execute(
+        select(A.initial_deposit_amount, A.archived_before, A.archived_balance,
+               snapshot.c.balance_date, snapshot.c.closing_balance)
+        .outerjoin(snapshot, snapshot.c.account_number == A.account_number)
+        .where(A.account_number == account_number)
+    ).one_or_none()
+    if account is None:
+        return None
+    opening, archived_before, archived_balance, snapshot_date, closing_balance = account
+    since = _day_start(snapshot_date + timedelta(days=1)) if snapshot_date is not None else None
+
+    if archived_before is not None and as_of < archived_before:
+        balance = archive.latest_balance(db, account_number, as_of, since)
+        if balance is not None:
+            return balance
+        return Decimal(str(opening if snapshot_date is None else closing_balance))
+
+    latest = select(T.balance_after_transaction)\
+        .where(T.account_number == account_number, T.transaction_date <= as_of)\
+        .order_by(T.transaction_date.desc(), T.transaction_id.desc())\
+        .limit(1)
+    if snapshot_date is not None:
+        latest = latest.where(T.transaction_date >= since)
+        opening = closing_balance
+    if archived_before is not None and (since is None or since < archived_before):
+        # The rows between the snapshot and the cutoff are archived
+        opening = opening if archived_balance is None else archived_balance
+    balance = db.execute(latest).scalar_one_or_none()
+    return Decimal(str(opening if balance is None else balance))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot end-of-day balances")
+    parser.add_argument("--through", type=date.fromisoformat, default=None,
+                        help="last day to snapshot (default: yesterday)")
+    parser.add_argument("--backfill", action="store_true", help="rebuild every snapshot from the ledger")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        run = close_days(db, args.through, args.backfill, args.chunk_size)
+        print({"run_id": run.run_id, "through_date": run.through_date.isoformat(),
+               "snapshots_written": run.snapshots_written})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,68 @@
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 import pytest
-from datetime import datetime
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import asyncio
+import threading
+import numpy as np
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 from decimal import Decimal
+from typing import List
+from pydantic import TypeAdapter
 
 from main import app
-from database import Base, get_db
+from database import Base, get_db, get_read_db
 from models import Customer, Product, Account, AccountTransaction
+import models
+import schemas
+import ledger
+import sequences
+import cache
+import interest
+import snapshots
+import idempotency
+import metrics
+import bulk_import
+import events
+import archive
+import reconcile
 
-# Create test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Create test database, shared by the sync engine used for setup and the
+# async engine used by the app
+TEST_DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DATABASE_PATH}"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def override_get_db():
-    db = None
-    try:
-        db = TestingSessionLocal()
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        if db is not None:
-            db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+metrics.instrument(async_engine.sync_engine)
 
 client = TestClient(app)
 
 @pytest.fixture(autouse=True)
 def setup_database():
+    cache.clear_all()
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
@@ -247,4 +276,1297 @@ def test_delete_customer_with_accounts():
     # Try to delete the customer
     response = client.delete(f"/customers/{customer_id}")
     assert response.status_code == 400
-    assert response.json()["detail"] == "Cannot delete customer with existing accounts" 
\ No newline at end of file
+    assert response.json()["detail"] == "Cannot delete customer with existing accounts"
+
+
+def create_test_account(initial_deposit="1000000"):
+    customer_id = client.post(
+        "/customers/",
+        json={
+            "customer_name": "John Doe",
+            "customer_type": 1,
+            "real_name_identification_number": "1234567890123"
+        }
+    ).json()["customer_id"]
+    if client.get("/products/123456").status_code == 404:
+        client.post(
+            "/products/",
+            json={
+                "product_code": "123456",
+                "product_name": "Savings Account",
+                "eligible_customer_type": 1,
+                "taxation_code": "1",
+                "eligible_age": 18,
+                "base_interest_rate": "3.500",
+                "additional_interest_rate": "0.500",
+                "applied_interest_rate": "4.000"
+            }
+        )
+    response = client.post(
+        "/accounts/",
+        json={
+            "customer_id": customer_id,
+            "product_code": "123456",
+            "real_name_identification_number": "1234567890123",
+            "customer_type": 1,
+            "taxation_code": "1",
+            "initial_deposit_amount": initial_deposit,
+            "passbook_exemption_flag": False,
+            "base_interest_rate": "3.500",
+            "additional_interest_rate": "0.500",
+            "applied_interest_rate": "4.000",
+            "account_password": "1234",
+            "cash_amount": initial_deposit,
+            "linked_substitute_amount": "0",
+            "linked_substitute_account_number": None
+        }
+    )
+    return response.json()["account_number"]
+
+def post_transaction(account_number, transaction_type, amount):
+    return client.post(
+        "/transactions/",
+        json={
+            "account_number": account_number,
+            "transaction_date": datetime.utcnow().isoformat(),
+            "transaction_type": transaction_type,
+            "transaction_amount": amount
+        }
+    )
+
+def test_running_balance_is_maintained():
+    account_number = create_test_account()
+    assert client.get(f"/accounts/{account_number}").json()["current_balance"] == "1000000"
+
+    assert post_transaction(account_number, 1, "500000").json()["balance_after_transaction"] == "1500000"
+    assert post_transaction(account_number, 2, "200000").json()["balance_after_transaction"] == "1300000"
+
+    response = post_transaction(account_number, 2, "2000000")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient funds"
+
+    data = client.get(f"/accounts/{account_number}").json()
+    assert data["current_balance"] == "1300000"
+    assert data["ledger_sequence"] == 2
+
+def test_timezone_aware_transaction_dates_post_as_utc():
+    account_number = create_test_account("0")
+    for date, amount in (("2026-10-17T04:00:00.000Z", "100"), ("2026-10-17T12:30:00+09:00", "50")):
+        response = client.post("/transactions/", json={
+            "account_number": account_number, "transaction_date": date,
+            "transaction_type": 1, "transaction_amount": amount})
+        assert response.status_code == 200
+    # The second posting is 03:30 UTC, back-dated before the first
+    rows = client.get(f"/accounts/{account_number}/transactions/").json()
+    assert [(row["transaction_date"], row["balance_after_transaction"]) for row in rows] == [
+        ("2026-10-17T03:30:00", "50"), ("2026-10-17T04:00:00", "150")]
+
+    # Date filters are converted the same way before they reach a statement
+    params = {"from": "2026-10-17T12:15:00+09:00", "to": "2026-10-17T04:00:00Z"}
+    rows = client.get(f"/accounts/{account_number}/transactions/", params=params).json()
+    assert [row["transaction_date"] for row in rows] == ["2026-10-17T03:30:00"]
+    balance = client.get(f"/accounts/{account_number}/balance", params={"as_of": "2026-10-17T12:45:00+09:00"}).json()
+    assert balance["balance"] == "50"
+
+def file_ledger(path, account_numbers, balance):
+    """Session factory of a file-backed ledger, for tests that post from several threads.
+
+    The ledger holds one customer, one product and ``account_numbers`` opened
+    with ``balance``.
+    """
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    models.Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = SessionLocal()
+    db.add(Customer(customer_id="c1", customer_name="John Doe", customer_type=1,
+                    real_name_identification_number="1234567890123"))
+    db.add(Product(product_code="123456", product_name="Savings Account", eligible_customer_type=1,
+                   taxation_code="1", base_interest_rate=Decimal("3.5"),
+                   additional_interest_rate=Decimal("0.5"), applied_interest_rate=Decimal("4")))
+    for account_number in account_numbers:
+        db.add(Account(account_number=account_number, customer_id="c1", product_code="123456",
+                       real_name_identification_number="1234567890123", customer_type=1,
+                       taxation_code="1", initial_deposit_amount=Decimal(balance),
+                       base_interest_rate=Decimal("3.5"), additional_interest_rate=Decimal("0.5"),
+                       applied_interest_rate=Decimal("4"), account_password="1234",
+                       cash_amount=Decimal(balance), linked_substitute_amount=Decimal(0),
+                       current_balance=Decimal(balance), ledger_sequence=0))
+    db.commit()
+    db.close()
+    return SessionLocal
+
+def test_concurrent_postings_keep_ledger_consistent(tmp_path):
+    account_numbers = [f"100-{n:07d}" for n in range(1000, 1016)]
+    StressSessionLocal = file_ledger(tmp_path / "stress.db", account_numbers, 5000)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        session = StressSessionLocal()
+        try:
+            for _ in range(50):
+                transaction = schemas.TransactionCreate(
+                    account_number=rng.choice(account_numbers),
+                    transaction_date=datetime.utcnow(),
+                    transaction_type=rng.choice((ledger.DEPOSIT, ledger.WITHDRAWAL)),
+                    transaction_amount=Decimal(rng.randint(1, 3000)),
+                )
+                try:
+                    ledger.post_transaction(session, transaction)
+                except ledger.InsufficientFundsError:
+                    pass
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(worker, range(8)))
+
+    db = StressSessionLocal()
+    posted = 0
+    for account in db.query(Account).all():
+        rows = db.query(AccountTransaction)\
+            .filter(AccountTransaction.account_number == account.account_number)\
+            .order_by(AccountTransaction.transaction_date, AccountTransaction.transaction_id)\
+            .all()
+        balance = Decimal(5000)
+        for row in rows:
+            balance += ledger.signed_amount(row.transaction_type, row.transaction_amount)
+            assert balance >= 0
+            assert row.balance_after_transaction == balance
+        assert account.current_balance == balance
+        assert account.ledger_sequence == len(rows)
+        posted += len(rows)
+    db.close()
+    assert posted > 0
+
+def test_account_numbers_are_not_reused_after_delete():
+    first = create_test_account()
+    second = create_test_account()
+    assert client.delete(f"/accounts/{second}").status_code == 200
+    third = create_test_account()
+    assert len({first, second, third}) == 3
+    assert third.startswith("100-") and len(third) == 11
+
+def test_concurrent_account_creation_reserves_blocks_without_deadlock(monkeypatch):
+    # A block per request, so requests reserve while others wait on the database
+    monkeypatch.setattr(sequences, "account_numbers", sequences.BlockAllocator(models.account_number_seq, 1))
+    customer_id = client.get(f"/accounts/{create_test_account()}").json()["customer_id"]
+    account = client.get(f"/customers/{customer_id}/accounts").json()[0]
+    body = {key: account[key] for key in schemas.AccountCreate.model_fields}
+
+    async def create_all():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            return await asyncio.gather(*[async_client.post("/accounts/", json=body) for _ in range(10)])
+
+    responses = asyncio.run(create_all())
+    assert [response.status_code for response in responses] == [200] * 10
+    assert len({response.json()["account_number"] for response in responses}) == 10
+
+def test_block_allocators_never_share_numbers(tmp_path):
+    allocator_engine = create_engine(
+        f"sqlite:///{tmp_path / 'allocator.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    models.Base.metadata.create_all(bind=allocator_engine)
+    AllocatorSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=allocator_engine)
+    # One allocator per simulated worker process
+    workers = [sequences.BlockAllocator(models.account_number_seq, 7) for _ in range(4)]
+
+    def allocate(allocator):
+        db = AllocatorSessionLocal()
+        try:
+            return [allocator.next_value(db) for _ in range(50)]
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        values = [value for chunk in pool.map(allocate, workers) for value in chunk]
+    assert len(values) == len(set(values)) == 200
+    assert min(values) >= models.ACCOUNT_NUMBER_START
+
+def test_counter_fallback_starts_after_existing_account_numbers(tmp_path):
+    # A database whose accounts predate the counter row, as after an upgrade
+    SessionLocal = file_ledger(tmp_path / "upgraded.db", ["100-0001000", "100-0004321"], 1000)
+    db = SessionLocal()
+    try:
+        allocator = sequences.BlockAllocator(models.account_number_seq, 7,
+                                             floor=sequences.first_unused_account_number)
+        assert allocator.reserve(db, 8) == list(range(4322, 4330))
+    finally:
+        db.close()
+
+def test_batch_posting_reports_each_item():
+    first = create_test_account("1000")
+    second = create_test_account("0")
+    response = client.post(
+        "/transactions/batch",
+        json=[
+            {"account_number": first, "transaction_date": "2024-01-02T00:00:00", "transaction_type": 2, "transaction_amount": "1500"},
+            {"account_number": first, "transaction_date": "2024-01-01T00:00:00", "transaction_type": 1, "transaction_amount": "1000"},
+            {"account_number": second, "transaction_date": "2024-01-01T00:00:00", "transaction_type": 2, "transaction_amount": "1"},
+            {"account_number": "100-9999999", "transaction_date": "2024-01-01T00:00:00", "transaction_type": 1, "transaction_amount": "1"},
+            {"account_number": second, "transaction_type": 1},
+        ]
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["posted"] == 2
+    assert data["rejected"] == 3
+    results = data["results"]
+    # Applied in transaction_date order: the deposit funds the withdrawal
+    assert results[1]["balance_after_transaction"] == "2000"
+    assert results[0]["balance_after_transaction"] == "500"
+    assert results[2]["detail"] == "Insufficient funds"
+    assert results[3]["detail"] == "Account not found"
+    assert results[4]["status"] == "rejected"
+    assert client.get(f"/accounts/{first}").json()["current_balance"] == "500"
+
+def test_batch_posting_accepts_ndjson():
+    account_number = create_test_account("0")
+    lines = [
+        f'{{"account_number": "{account_number}", "transaction_date": "2024-01-01T00:00:00", "transaction_type": 1, "transaction_amount": "{amount}"}}'
+        for amount in (100, 200, 300)
+    ]
+    response = client.post(
+        "/transactions/batch",
+        content="\n".join(lines + ["not json"]),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    data = response.json()
+    assert data["posted"] == 3
+    assert data["rejected"] == 1
+    with pytest.raises(ValueError) as parse_error:
+        json.loads("not json")
+    assert data["results"][3]["detail"] == str(parse_error.value)
+    assert [r["balance_after_transaction"] for r in data["results"][:3]] == ["100", "300", "600"]
+    account = client.get(f"/accounts/{account_number}").json()
+    assert account["current_balance"] == "600"
+    assert account["ledger_sequence"] == 3
+
+def test_account_transactions_keyset_pagination():
+    account_number = create_test_account("0")
+    client.post("/transactions/batch", json=[
+        {"account_number": account_number, "transaction_date": f"2024-01-{day:02d}T09:00:00",
+         "transaction_type": 1, "transaction_amount": "100"}
+        for day in range(1, 11)
+    ])
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3, "from": "2024-01-02T00:00:00", "to": "2024-01-10T00:00:00"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/accounts/{account_number}/transactions/", params=params)
+        assert response.status_code == 200
+        seen.extend(t["transaction_date"] for t in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == [f"2024-01-{day:02d}T09:00:00" for day in range(2, 10)]
+    response = client.get(f"/accounts/{account_number}/transactions/", params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+def test_export_account_statement():
+    account_number = create_test_account("0")
+    client.post("/transactions/batch", json=[
+        {"account_number": account_number, "transaction_date": f"2024-01-{day:02d}T09:00:00",
+         "transaction_type": 1, "transaction_amount": "100"}
+        for day in range(1, 6)
+    ])
+
+    response = client.get(f"/accounts/{account_number}/statement", params={"from": "2024-01-02T00:00:00"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["balance_after_transaction"] for line in lines] == ["200", "300", "400", "500"]
+
+    response = client.get(
+        f"/accounts/{account_number}/statement",
+        params={"format": "csv"},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0][0] == "transaction_id"
+    assert len(rows) == 6
+    response = client.get(f"/accounts/{account_number}/statement", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in response.headers
+
+    assert client.get("/accounts/100-9999999/statement").status_code == 404
+
+def test_pool_status():
+    response = client.get("/health/pool")
+    assert response.status_code == 200
+    assert "pool" in response.json()["primary"]
+
+def test_catalog_cache_hits_and_invalidation():
+    create_test_account()
+    hits = cache.products.stats()["hits"]
+    create_test_account()
+    assert cache.products.stats()["hits"] > hits
+
+    product = client.get("/products/123456").json()
+    product["product_name"] = "Renamed"
+    assert client.put("/products/123456", json=product).status_code == 200
+    assert client.get("/products/123456").json()["product_name"] == "Renamed"
+    assert client.get("/products/").json()[0]["product_name"] == "Renamed"
+
+    invalidated = []
+    cache.register_invalidation_listener(lambda name, key: invalidated.append((name, key)))
+    try:
+        client.put("/products/123456", json=product)
+    finally:
+        cache._listeners.clear()
+    assert ("products", "123456") in invalidated
+    assert client.get("/health/cache").json()["products"]["hits"] >= 1
+
+def test_ttl_cache_evicts_least_recently_used_and_expired():
+    now = [0.0]
+    lru = cache.TTLCache("test", maxsize=2, ttl=10, clock=lambda: now[0])
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    now[0] = 11
+    assert lru.get("a") is None
+    assert lru.stats()["evictions"] == 1
+
+def test_interest_accrual_posts_net_interest_once():
+    account_number = create_test_account("1000000")
+    empty = create_test_account("0")
+
+    db = TestingSessionLocal()
+    try:
+        db.query(Account).update({Account.account_opening_date: datetime(2024, 1, 1)})
+        db.commit()
+        totals = interest.accrue_interest(db, date(2024, 1, 31), chunk_size=1)
+        assert totals["accounts"] == 2
+        assert totals["postings"] == 1
+        # 1,000,000 * 4.000% / 365 = 109.58 gross, 15.4% withholding truncated to 16
+        assert (totals["gross_interest"], totals["withholding_tax"], totals["net_interest"]) == (109, 16, 93)
+
+        # Rerunning the same day credits nothing
+        assert interest.accrue_interest(db, date(2024, 1, 31))["accounts"] == 0
+
+        # The sub-won remainder carries into the next day
+        assert interest.accrue_interest(db, date(2024, 2, 1))["gross_interest"] == 110
+    finally:
+        db.close()
+
+    account = client.get(f"/accounts/{account_number}").json()
+    assert account["current_balance"] == str(1000000 + 93 + 94)
+    assert account["ledger_sequence"] == 2
+    assert client.get(f"/accounts/{empty}").json()["ledger_sequence"] == 0
+
+def test_interest_accrues_on_the_closing_balance_of_open_accounts():
+    account_number = create_test_account("1000000")
+    later = create_test_account("1000000")
+    db = TestingSessionLocal()
+    db.query(Account).filter_by(account_number=account_number)\
+        .update({Account.account_opening_date: datetime(2024, 1, 1)})
+    db.query(Account).filter_by(account_number=later)\
+        .update({Account.account_opening_date: datetime(2024, 2, 1, 9)})
+    db.commit()
+    # Made the next morning, after the accrual date
+    client.post("/transactions/", json={"account_number": account_number, "transaction_date": "2024-02-01T09:00:00",
+                                        "transaction_type": 1, "transaction_amount": "9000000"})
+    try:
+        totals = interest.accrue_interest(db, date(2024, 1, 31))
+    finally:
+        db.close()
+    assert totals["accounts"] == 1
+    assert totals["net_interest"] == 93
+
+    rows = client.get(f"/accounts/{account_number}/transactions/").json()
+    assert [(row["transaction_amount"], row["balance_after_transaction"]) for row in rows] == [
+        ("93", "1000093"), ("9000000", "10000093")]
+    assert client.get(f"/accounts/{account_number}").json()["current_balance"] == "10000093"
+    assert client.get(f"/accounts/{later}/transactions/").json() == []
+    assert client.post("/reconciliation/").json()["divergent_accounts"] == []
+
+def test_reconciliation_reports_broken_chains():
+    healthy = create_test_account("1000")
+    broken = create_test_account("1000")
+    for account_number in (healthy, broken):
+        client.post("/transactions/batch", json=[
+            {"account_number": account_number, "transaction_date": f"2024-01-0{day}T09:00:00",
+             "transaction_type": 1, "transaction_amount": "100"}
+            for day in range(1, 4)
+        ])
+
+    report = client.post("/reconciliation/").json()
+    assert report["accounts_checked"] == 2
+    assert report["divergent_accounts"] == []
+
+    # Corrupt a historical balance behind the ledger's back
+    first = client.get(f"/accounts/{broken}/transactions/").json()[0]
+    db = TestingSessionLocal()
+    db.query(AccountTransaction)\
+        .filter(AccountTransaction.transaction_id == first["transaction_id"])\
+        .update({"balance_after_transaction": Decimal(1200)})
+    db.query(Account).filter(Account.account_number == broken).update({"last_modified_date": datetime.utcnow()})
+    db.commit()
+    db.close()
+
+    assert client.post("/reconciliation/", params={"workers": reconcile.MAX_WORKERS + 1}).status_code == 422
+    report = client.post("/reconciliation/", params={"incremental": True, "workers": 2}).json()
+    assert report["accounts_checked"] == 1
+    assert [d["account_number"] for d in report["divergent_accounts"]] == [broken]
+    assert report["divergent_accounts"][0]["reason"] == "chain"
+    assert report["divergent_accounts"][0]["expected_balance"] == "1100"
+
+def test_back_dated_posting_and_delete_rebalance_later_rows():
+    account_number = create_test_account("1000")
+    client.post("/transactions/batch", json=[
+        {"account_number": account_number, "transaction_date": f"2024-01-0{day}T09:00:00",
+         "transaction_type": 1, "transaction_amount": "100"}
+        for day in (1, 3, 5)
+    ])
+
+    def balances():
+        rows = client.get(f"/accounts/{account_number}/transactions/").json()
+        return [(row["transaction_date"][:10], row["balance_after_transaction"]) for row in rows]
+
+    response = client.post("/transactions/", json={
+        "account_number": account_number,
+        "transaction_date": "2024-01-02T09:00:00",
+        "transaction_type": 2,
+        "transaction_amount": "1050",
+    })
+    assert response.json()["balance_after_transaction"] == "50"
+    assert balances() == [("2024-01-01", "1100"), ("2024-01-02", "50"), ("2024-01-03", "150"), ("2024-01-05", "250")]
+
+    # Removing the first deposit would take 2024-01-02 negative
+    first = client.get(f"/accounts/{account_number}/transactions/").json()[0]
+    response = client.delete(f"/transactions/{first['transaction_id']}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient funds"
+
+    # A back-dated withdrawal that overdraws a later point is rejected too
+    response = client.post("/transactions/", json={
+        "account_number": account_number,
+        "transaction_date": "2024-01-02T10:00:00",
+        "transaction_type": 2,
+        "transaction_amount": "100",
+    })
+    assert response.status_code == 400
+
+    withdrawal = client.get(f"/accounts/{account_number}/transactions/").json()[1]
+    assert client.delete(f"/transactions/{withdrawal['transaction_id']}").status_code == 200
+    assert balances() == [("2024-01-01", "1100"), ("2024-01-03", "1200"), ("2024-01-05", "1300")]
+    account = client.get(f"/accounts/{account_number}").json()
+    assert account["current_balance"] == "1300"
+    assert account["ledger_sequence"] == 3
+    assert client.post("/reconciliation/").json()["divergent_accounts"] == []
+
+    # Deleting the latest row moves the account's last transaction date back
+    latest = client.get(f"/accounts/{account_number}/transactions/").json()[-1]
+    assert client.delete(f"/transactions/{latest['transaction_id']}").status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.get(Account, account_number).last_transaction_date == datetime(2024, 1, 3, 9)
+    finally:
+        db.close()
+
+def test_daily_balance_snapshots_and_as_of_lookup():
+    account_number = create_test_account("1000")
+    client.post("/transactions/batch", json=[
+        {"account_number": account_number, "transaction_date": date_time,
+         "transaction_type": 1, "transaction_amount": amount}
+        for date_time, amount in (("2024-01-01T09:00:00", "100"), ("2024-01-01T15:00:00", "10"),
+                                  ("2024-01-03T09:00:00", "200"), ("2024-01-04T09:00:00", "300"))
+    ])
+
+    def balance(as_of):
+        response = client.get(f"/accounts/{account_number}/balance", params={"as_of": as_of})
+        assert response.status_code == 200
+        return response.json()["balance"]
+
+    def snapshot_rows():
+        db = TestingSessionLocal()
+        try:
+            return db.query(models.DailyBalance.balance_date, models.DailyBalance.closing_balance)\
+                .filter(models.DailyBalance.account_number == account_number)\
+                .order_by(models.DailyBalance.balance_date).all()
+        finally:
+            db.close()
+
+    db = TestingSessionLocal()
+    try:
+        run = snapshots.close_days(db, date(2024, 1, 3), backfill=True, chunk_size=1)
+        assert run.snapshots_written == 2
+        # Only the days after the watermark are read
+        assert snapshots.close_days(db, date(2024, 1, 4)).snapshots_written == 1
+        assert snapshots.close_days(db, date(2024, 1, 2)).through_date == date(2024, 1, 4)
+        with pytest.raises(ValueError):
+            snapshots.close_days(db, date.today())
+    finally:
+        db.close()
+    assert snapshot_rows() == [(date(2024, 1, 1), 1110), (date(2024, 1, 3), 1310), (date(2024, 1, 4), 1610)]
+
+    assert balance("2023-12-31T00:00:00") == "1000"
+    assert balance("2024-01-01T12:00:00") == "1100"
+    assert balance("2024-01-02T12:00:00") == "1110"
+    assert balance("2024-01-03T08:59:59") == "1110"
+    assert balance("2024-01-03T09:00:00") == "1310"
+    assert balance("2024-02-01T00:00:00") == "1610"
+    assert client.get(f"/accounts/{account_number}/balance").json()["balance"] == "1610"
+    assert client.get("/accounts/999-9999999/balance", params={"as_of": "2024-01-01T00:00:00"}).status_code == 404
+
+    # A back-dated posting rebuilds the snapshots it shifted
+    client.post("/transactions/", json={
+        "account_number": account_number,
+        "transaction_date": "2024-01-02T09:00:00",
+        "transaction_type": 2,
+        "transaction_amount": "500",
+    })
+    assert snapshot_rows() == [(date(2024, 1, 1), 1110), (date(2024, 1, 2), 610),
+                               (date(2024, 1, 3), 810), (date(2024, 1, 4), 1110)]
+    assert balance("2024-01-02T12:00:00") == "610"
+
+    first = client.get(f"/accounts/{account_number}/transactions/").json()[0]
+    assert client.delete(f"/transactions/{first['transaction_id']}").status_code == 200
+    assert snapshot_rows() == [(date(2024, 1, 1), 1010), (date(2024, 1, 2), 510),
+                               (date(2024, 1, 3), 710), (date(2024, 1, 4), 1010)]
+
+def test_customer_accounts_and_summary():
+    first = create_test_account("1000")
+    customer_id = client.get(f"/accounts/{first}").json()["customer_id"]
+    other = create_test_account("5000")
+    account = client.get(f"/accounts/{first}").json()
+    for key in ("account_number", "current_balance", "ledger_sequence", "account_opening_date", "last_modified_date"):
+        account.pop(key)
+    second = client.post("/accounts/", json=account).json()["account_number"]
+    post_transaction(first, 1, "100")
+    post_transaction(first, 2, "50")
+    post_transaction(other, 1, "100")
+
+    accounts = client.get(f"/customers/{customer_id}/accounts").json()
+    assert [(a["account_number"], a["current_balance"], a["transaction_count"]) for a in accounts] == [
+        (first, "1050", 2), (second, "1000", 0)]
+    assert accounts[0]["last_activity"] is not None
+    assert accounts[1]["last_activity"] is None
+
+    summary = client.get(f"/customers/{customer_id}/summary").json()
+    assert summary["customer_name"] == "John Doe"
+    assert (summary["account_count"], summary["total_balance"], summary["transaction_count"]) == (2, "2050", 2)
+    assert summary["last_activity"] == accounts[0]["last_activity"]
+
+    assert client.get("/customers/missing/accounts").status_code == 404
+    assert client.get("/customers/missing/summary").status_code == 404
+
+def test_idempotency_key_replays_postings():
+    account_number = create_test_account("1000")
+    body = {
+        "account_number": account_number,
+        "transaction_date": "2024-01-01T09:00:00",
+        "transaction_type": 1,
+        "transaction_amount": "100",
+    }
+    headers = {"Idempotency-Key": "deposit-1"}
+    first = client.post("/transactions/", json=body, headers=headers)
+    retry = client.post("/transactions/", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert client.get(f"/accounts/{account_number}").json()["ledger_sequence"] == 1
+
+    # The same key with another body is refused
+    response = client.post("/transactions/", json={**body, "transaction_amount": "200"}, headers=headers)
+    assert response.status_code == 422
+
+    # Failures are not stored, so the key can be retried
+    headers = {"Idempotency-Key": "withdrawal-1"}
+    withdrawal = {**body, "transaction_type": 2, "transaction_amount": "5000"}
+    assert client.post("/transactions/", json=withdrawal, headers=headers).status_code == 400
+    client.post("/transactions/", json={**body, "transaction_date": "2024-01-01T08:00:00", "transaction_amount": "5000"})
+    response = client.post("/transactions/", json=withdrawal, headers=headers)
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+
+    # Keys are scoped to the endpoint
+    account = client.get(f"/accounts/{account_number}").json()
+    for key in ("account_number", "current_balance", "ledger_sequence", "account_opening_date", "last_modified_date"):
+        account.pop(key)
+    created = client.post("/accounts/", json=account, headers={"Idempotency-Key": "deposit-1"})
+    replayed = client.post("/accounts/", json=account, headers={"Idempotency-Key": "deposit-1"})
+    assert replayed.json()["account_number"] == created.json()["account_number"]
+
+def test_idempotency_key_runs_concurrent_duplicates_once():
+    store = idempotency.KeyStore(ttl=60, maxsize=10)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 200, b"{}"
+
+    async def submit_all():
+        return await asyncio.gather(*[store.run(None, "POST /transactions/", "key", "fp", handler) for _ in range(20)])
+
+    results = asyncio.run(submit_all())
+    assert len(calls) == 1
+    assert sum(1 for _, replayed in results if not replayed) == 1
+    assert all(stored.body == b"{}" for stored, _ in results)
+
+def test_idempotency_keys_in_database():
+    account_number = create_test_account("1000")
+    body = {
+        "account_number": account_number,
+        "transaction_date": "2024-01-01T09:00:00",
+        "transaction_type": 1,
+        "transaction_amount": "100",
+    }
+    idempotency.store.use_database = True
+    try:
+        first = client.post("/transactions/", json=body, headers={"Idempotency-Key": "db-1"})
+        # Another worker only sees the table
+        cache.clear_all()
+        retry = client.post("/transactions/", json=body, headers={"Idempotency-Key": "db-1"})
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+
+        # A key claimed by a request still in flight elsewhere
+        content = json.dumps(body).encode()
+        db = TestingSessionLocal()
+        db.add(models.IdempotencyKey(scope="POST /transactions/", key="db-2", fingerprint=idempotency.fingerprint(content),
+                                     created_at=datetime.utcnow(), expires_at=datetime(2999, 1, 1)))
+        db.commit()
+        db.close()
+        headers = {"Idempotency-Key": "db-2", "Content-Type": "application/json"}
+        response = client.post("/transactions/", content=content, headers=headers)
+        assert response.status_code == 409
+        assert response.headers["Retry-After"] == "1"
+        response = client.post("/transactions/", json={**body, "transaction_amount": "1"}, headers=headers)
+        assert response.status_code == 422
+    finally:
+        idempotency.store.use_database = False
+    assert client.get(f"/accounts/{account_number}").json()["ledger_sequence"] == 1
+
+def test_idempotency_claims_are_leases_and_postings_store_their_response(monkeypatch):
+    account_number = create_test_account("1000")
+    body = {
+        "account_number": account_number,
+        "transaction_date": "2024-01-01T09:00:00",
+        "transaction_type": 1,
+        "transaction_amount": "100",
+    }
+    content = json.dumps(body).encode()
+    headers = {"Idempotency-Key": "lease-1", "Content-Type": "application/json"}
+    monkeypatch.setattr(idempotency.store, "use_database", True)
+
+    # A claim left by a worker that died before posting blocks retries only until its lease runs out
+    db = TestingSessionLocal()
+    db.add(models.IdempotencyKey(scope="POST /transactions/", key="lease-1", fingerprint=idempotency.fingerprint(content),
+                                 created_at=datetime.utcnow(), expires_at=datetime.utcnow()))
+    db.commit()
+    response = client.post("/transactions/", content=content, headers=headers)
+    assert response.status_code == 200
+    stored = db.get(models.IdempotencyKey, ("POST /transactions/", "lease-1"))
+    assert stored.status_code == 200
+    assert (stored.expires_at - datetime.utcnow()).total_seconds() > idempotency.store.lease
+
+    # The response commits with the posting, so a worker dying before
+    # completing the key cannot make a retry post twice
+    async def died(*args):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(idempotency.store, "_complete", died)
+    headers["Idempotency-Key"] = "lease-2"
+    with pytest.raises(RuntimeError):
+        client.post("/transactions/", content=content, headers=headers)
+    monkeypatch.undo()
+    monkeypatch.setattr(idempotency.store, "use_database", True)
+    cache.clear_all()
+    retry = client.post("/transactions/", content=content, headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    db.close()
+    assert client.get(f"/accounts/{account_number}").json()["ledger_sequence"] == 2
+
+def test_metrics_count_statements_per_route(monkeypatch):
+    account_number = create_test_account("1000")
+    metrics.registry.clear()
+    monkeypatch.setattr(metrics, "METRICS_DEBUG_HEADERS", True)
+    for _ in range(3):
+        response = client.get(f"/accounts/{account_number}")
+        assert response.status_code == 200
+    assert int(response.headers["X-DB-Statements"]) >= 1
+    assert int(response.headers["X-DB-Rows"]) >= 1
+    assert float(response.headers["X-DB-Time-Ms"]) > 0
+    client.get("/accounts/missing")
+
+    body = client.get("/metrics").text
+    labels = 'method="GET",route="/accounts/{account_number}",status="200"'
+    assert f"http_request_duration_seconds_count{{{labels}}} 3" in body
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in body
+    assert f"http_request_db_statements_count{{{labels}}} 3" in body
+    assert 'route="/accounts/{account_number}",status="404"' in body
+    statements = next(line for line in body.splitlines()
+                      if line.startswith(f"http_request_db_statements_sum{{{labels}}}"))
+    assert float(statements.split()[-1]) == 3 * int(response.headers["X-DB-Statements"])
+    assert account_number not in body
+
+def test_delete_guards_probe_with_exists(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DEBUG_HEADERS", True)
+    small = create_test_account()
+    large = create_test_account()
+    post_transaction(small, 1, "100")
+    db = TestingSessionLocal()
+    db.execute(AccountTransaction.__table__.insert(), [
+        dict(account_number=large, transaction_date=datetime(2024, 1, 1), transaction_type=ledger.DEPOSIT,
+             transaction_amount=1, balance_after_transaction=1000000 + n)
+        for n in range(1, 2001)
+    ])
+    db.commit()
+    db.close()
+
+    # The guard costs the same for one transaction as for thousands and loads none of them
+    guarded = [client.delete(f"/accounts/{number}") for number in (small, large)]
+    for response in guarded:
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Cannot delete account with existing transactions"
+        assert int(response.headers["X-DB-Rows"]) <= 1
+    assert guarded[0].headers["X-DB-Statements"] == guarded[1].headers["X-DB-Statements"] == "1"
+
+    customer_id = client.get(f"/accounts/{large}").json()["customer_id"]
+    response = client.delete(f"/customers/{customer_id}")
+    assert response.status_code == 400
+    assert response.headers["X-DB-Statements"] == "1"
+    response = client.delete("/products/123456")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cannot delete product with existing accounts"
+
+    for path in ("/accounts/missing", "/customers/missing", "/products/000000"):
+        assert client.delete(path).status_code == 404
+
+    empty = create_test_account()
+    customer_id = client.get(f"/accounts/{empty}").json()["customer_id"]
+    response = client.delete(f"/accounts/{empty}")
+    assert response.status_code == 200
+    assert response.headers["X-DB-Statements"] == "2"
+    assert client.get(f"/accounts/{empty}").status_code == 404
+    assert client.delete(f"/customers/{customer_id}").status_code == 200
+    assert client.get(f"/customers/{customer_id}").status_code == 404
+
+def test_list_endpoints_encode_like_the_response_models():
+    account_number = create_test_account()
+    post_transaction(account_number, 1, "500000")
+    post_transaction(account_number, 2, "1234")
+    client.post("/transactions/", json={"account_number": account_number, "transaction_date": "2024-01-01T09:00:00",
+                                        "transaction_type": 1, "transaction_amount": "7"})
+
+    db = TestingSessionLocal()
+    expected = {
+        "/customers/": (schemas.Customer, db.query(Customer).all()),
+        "/accounts/": (schemas.Account, db.query(Account).all()),
+        "/transactions/": (schemas.Transaction, db.query(AccountTransaction)
+                           .order_by(AccountTransaction.transaction_date, AccountTransaction.transaction_id).all()),
+    }
+    db.close()
+    for path, (schema, rows) in expected.items():
+        response = client.get(path)
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == TypeAdapter(List[schema]).dump_json([schema.model_validate(row) for row in rows])
+
+    response = client.get(f"/accounts/{account_number}/transactions/", params={"limit": 2})
+    assert [row["transaction_amount"] for row in response.json()] == ["7", "500000"]
+    response = client.get(f"/accounts/{account_number}/transactions/",
+                          params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]})
+    assert [row["transaction_amount"] for row in response.json()] == ["1234"]
+    assert "X-Next-Cursor" not in response.headers
+
+def test_bulk_import_reports_each_row(monkeypatch):
+    monkeypatch.setattr(bulk_import, "CHUNK_SIZE", 2)
+    products = "\n".join([
+        "product_code,product_name,eligible_customer_type,taxation_code,eligible_age,base_interest_rate,"
+        "additional_interest_rate,applied_interest_rate",
+        "200001,Imported savings,1,1,,3.5,0.5,4.0",
+        "200002,Imported deposit,1,2,19,2.000,0,2.000",
+        "200001,Duplicate,1,1,,1,0,1",
+        "200003,Bad rate,1,1,,300,0,300",
+    ])
+    response = client.post("/import/products", content=products, headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    assert (response.headers["X-Import-Created"], response.headers["X-Import-Rejected"]) == ("2", "2")
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["index"], r["status"]) for r in results] == [
+        (0, "created"), (1, "created"), (2, "rejected"), (3, "rejected")]
+    assert results[2]["detail"] == "Product already exists"
+    assert client.get("/products/200001").json()["eligible_age"] is None
+    assert len(client.get("/products/").json()) == 2
+
+    customers = [
+        {"customer_id": "legacy-1", "customer_name": "Kim", "customer_type": 1,
+         "real_name_identification_number": "1234567890123"},
+        {"customer_name": "Lee", "customer_type": 2, "real_name_identification_number": "1234567890124"},
+        {"customer_id": "legacy-1", "customer_name": "Park", "customer_type": 1,
+         "real_name_identification_number": "1234567890125"},
+    ]
+    body = "\n".join(json.dumps(customer) for customer in customers) + "\n{not json\n[1]\n"
+    results = [json.loads(line) for line in client.post("/import/customers", content=body).text.splitlines()]
+    assert [r["status"] for r in results] == ["created", "created", "rejected", "rejected", "rejected"]
+    assert results[0]["id"] == "legacy-1"
+    assert client.get(f"/customers/{results[1]['id']}").json()["customer_name"] == "Lee"
+
+    account = {
+        "customer_id": "legacy-1", "product_code": "200001", "real_name_identification_number": "1234567890123",
+        "customer_type": 1, "taxation_code": "1", "initial_deposit_amount": "1000", "base_interest_rate": "3.5",
+        "additional_interest_rate": "0.5", "applied_interest_rate": "4.0", "account_password": "1234",
+        "cash_amount": "1000", "linked_substitute_amount": "0",
+    }
+    accounts = [account, {**account, "customer_id": "missing"}, {**account, "product_code": "999999"},
+                {**account, "account_password": "12"}, {**account, "cash_amount": "700",
+                                                           "linked_substitute_amount": "300"}]
+    response = client.post("/import/accounts", params={"format": "ndjson"},
+                           content="\n".join(json.dumps(a) for a in accounts))
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r.get("detail", r["status"]) for r in results[:3]] == ["created", "Customer not found", "Product not found"]
+    assert results[3]["status"] == "rejected" and "account_password" in results[3]["detail"]
+    assert results[4]["status"] == "created"
+    created = [r["id"] for r in results if r["status"] == "created"]
+    assert len(set(created)) == 2
+    for account_number in created:
+        data = client.get(f"/accounts/{account_number}").json()
+        assert (data["customer_id"], data["current_balance"], data["ledger_sequence"]) == ("legacy-1", "1000", 0)
+    assert post_transaction(created[0], 1, "10").status_code == 200
+
+    assert client.post("/import/branches", content="").status_code == 422
+    assert client.post("/import/customers", content=b"\xff\xfe,x\n", headers={"Content-Type": "text/csv"}).status_code == 400
+
+def test_account_event_stream(monkeypatch):
+    account_number = create_test_account("1000")
+    other = create_test_account("1000")
+    first = post_transaction(account_number, 1, "100").json()
+
+    def parse(frame):
+        fields = dict(line.split(": ", 1) for line in frame.decode().splitlines()
+                      if line and not line.startswith(":"))
+        return fields.get("event"), fields.get("id"), json.loads(fields["data"]) if "data" in fields else None
+
+    async def scenario():
+        monkeypatch.setattr(events.hub, "queue_size", 3)
+        async with TestingAsyncSessionLocal() as db, httpx.AsyncClient(app=app, base_url="http://test") as api:
+            subscription = events.hub.subscribe([account_number])
+            frames = events.AccountStream(db, subscription, first["transaction_id"] - 1, heartbeat=0.2).frames()
+            assert await frames.__anext__() == b"retry: 3000\n\n"
+
+            # Resume replays the missed row, then the current balance
+            assert parse(await frames.__anext__()) == ("transaction", str(first["transaction_id"]), first)
+            name, _, data = parse(await frames.__anext__())
+            assert (name, data["current_balance"], data["ledger_sequence"]) == ("balance", "1100", 1)
+
+            # Live postings; other accounts are not delivered
+            await api.post("/transactions/", json={"account_number": other, "transaction_date": datetime.utcnow().isoformat(),
+                                                   "transaction_type": 1, "transaction_amount": "5"})
+            posted = (await api.post("/transactions/", json={
+                "account_number": account_number, "transaction_date": datetime.utcnow().isoformat(),
+                "transaction_type": 2, "transaction_amount": "30"})).json()
+            assert parse(await frames.__anext__()) == ("transaction", str(posted["transaction_id"]), posted)
+            assert parse(await frames.__anext__())[2]["current_balance"] == "1070"
+
+            # A burst beyond the queue size is dropped and read back from the database
+            now = datetime.utcnow().isoformat()
+            batch = [{"account_number": account_number, "transaction_date": now, "transaction_type": 1,
+                      "transaction_amount": str(n)} for n in (1, 2, 3)]
+            results = (await api.post("/transactions/batch", json=batch)).json()["results"]
+            assert subscription.overflowed
+            replayed = [parse(await frames.__anext__()) for _ in range(4)]
+            assert [event[1] for event in replayed[:3]] == [str(r["transaction_id"]) for r in results]
+            assert replayed[3][2]["current_balance"] == "1076"
+
+            # Rows written by another process show up after a heartbeat
+            db_sync = TestingSessionLocal()
+            db_sync.execute(AccountTransaction.__table__.insert().values(
+                account_number=account_number, transaction_date=datetime.utcnow(), transaction_type=1,
+                transaction_amount=4, balance_after_transaction=1080))
+            db_sync.query(Account).filter(Account.account_number == account_number).update(
+                {"current_balance": 1080, "ledger_sequence": Account.ledger_sequence + 1})
+            db_sync.commit()
+            db_sync.close()
+            assert await frames.__anext__() == b": keepalive\n\n"
+            name, event_id, data = parse(await frames.__anext__())
+            assert (name, data["transaction_amount"]) == ("transaction", "4")
+            assert parse(await frames.__anext__())[2]["current_balance"] == "1080"
+
+            assert (await api.delete(f"/transactions/{event_id}")).status_code == 200
+            assert parse(await frames.__anext__()) == (
+                "deleted", None, {"account_number": account_number, "transaction_id": int(event_id)})
+            assert parse(await frames.__anext__())[2]["current_balance"] == "1076"
+
+            assert events.hub.stats()["subscriptions"] == 1
+            await frames.aclose()
+            assert events.hub.stats() == {"accounts": 0, "subscriptions": 0, "queued": 0}
+
+    asyncio.run(scenario())
+
+    assert client.get("/events/accounts", params={"account": "missing"}).status_code == 404
+    response = client.get("/events/accounts", params={"account": account_number}, headers={"Last-Event-ID": "x"})
+    assert response.status_code == 400
+
+def test_archived_ledger_rows_stay_readable(monkeypatch, tmp_path):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    account_number = create_test_account("1000")
+    other = create_test_account("1000")
+    client.post("/transactions/batch", json=[
+        {"account_number": number, "transaction_date": date_time, "transaction_type": 1, "transaction_amount": amount}
+        for number in (account_number, other)
+        for date_time, amount in (("2024-01-05T09:00:00", "100"), ("2024-01-20T09:00:00", "10"),
+                                  ("2024-02-03T09:00:00", "200"), ("2024-03-01T00:00:00", "300"),
+                                  ("2024-03-09T09:00:00", "400"))
+    ])
+
+    def history(path, **params):
+        rows, cursor = [], None
+        while True:
+            response = client.get(path, params=dict(params, **({"cursor": cursor} if cursor else {})))
+            assert response.status_code == 200
+            rows += response.json()
+            cursor = response.headers.get("x-next-cursor")
+            if cursor is None:
+                return rows
+
+    def balance(as_of):
+        return client.get(f"/accounts/{account_number}/balance", params={"as_of": as_of}).json()["balance"]
+
+    account_path = f"/accounts/{account_number}/transactions/"
+    before = client.get(account_path).json()
+    everything = client.get("/transactions/").json()
+    statement = client.get(f"/accounts/{account_number}/statement", params={"format": "csv"}).text
+    as_of = ["2023-12-31T00:00:00", "2024-01-20T08:00:00", "2024-02-29T23:59:59", "2024-03-05T00:00:00"]
+    balances = [balance(moment) for moment in as_of]
+
+    db = TestingSessionLocal()
+    try:
+        run = archive.archive_ledger(db, datetime(2024, 3, 1), chunk_size=1)
+        assert (run.rows_archived, run.files_written) == (6, 4)
+        assert db.query(AccountTransaction).count() == 4
+        account = db.get(Account, account_number)
+        assert (account.archived_before, account.archived_balance) == (datetime(2024, 3, 1), 1310)
+        with pytest.raises(ValueError):
+            archive.archive_ledger(db, datetime(2024, 2, 1))
+    finally:
+        db.close()
+    assert sorted(p.name for p in tmp_path.glob("2024-01/*.ledger")) == [
+        f"{account_number}_{account_number}.r1.ledger", f"{other}_{other}.r1.ledger"]
+
+    # History, cursors, offsets, ranges and statements read across both tiers
+    assert client.get(account_path).json() == before
+    assert history(account_path, limit=2) == before
+    assert client.get(account_path, params={"skip": 1, "limit": 3}).json() == before[1:4]
+    assert client.get(account_path, params={"from": "2024-01-10T00:00:00", "to": "2024-03-02T00:00:00"}).json() \
+        == before[1:4]
+    assert history("/transactions/", limit=3) == everything
+    assert client.get(f"/accounts/{account_number}/statement", params={"format": "csv"}).text == statement
+    assert [balance(moment) for moment in as_of] == balances
+
+    # The archived period is closed; the hot chain opens from the carry-forward
+    response = client.post("/transactions/", json={"account_number": account_number, "transaction_type": 1,
+                                                   "transaction_date": "2024-02-10T00:00:00", "transaction_amount": "1"})
+    assert (response.status_code, response.json()["detail"]) == (400, "Transaction date is archived")
+    results = client.post("/transactions/batch", json=[
+        {"account_number": other, "transaction_date": "2024-02-10T00:00:00", "transaction_type": 1,
+         "transaction_amount": "1"}]).json()["results"]
+    assert results[0]["detail"] == "Transaction date is archived"
+    client.post("/transactions/", json={"account_number": account_number, "transaction_type": 2,
+                                        "transaction_date": "2024-03-02T00:00:00", "transaction_amount": "10"})
+    hot = client.get(account_path, params={"from": "2024-03-01T00:00:00"}).json()
+    assert [row["balance_after_transaction"] for row in hot] == ["1610", "1600", "2000"]
+    assert client.delete(f"/transactions/{hot[0]['transaction_id']}").status_code == 200
+    assert client.get(f"/accounts/{account_number}").json()["current_balance"] == "1700"
+
+    db = TestingSessionLocal()
+    try:
+        assert reconcile.reconcile_range(db) == (2, [])
+    finally:
+        db.close()
+
+def test_accounts_with_archived_history_cannot_be_deleted(monkeypatch, tmp_path):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    archived, covered = create_test_account(), create_test_account()
+    client.post("/transactions/batch", json=[
+        {"account_number": number, "transaction_date": "2024-02-05T09:00:00", "transaction_type": 1,
+         "transaction_amount": "100"}
+        for number in (archived, covered)])
+    db = TestingSessionLocal()
+    try:
+        assert archive.archive_ledger(db, datetime(2024, 3, 1)).rows_archived >= 2
+        assert db.query(AccountTransaction).filter(
+            AccountTransaction.account_number.in_([archived, covered])).count() == 0
+        # Only an archive file still references this one
+        db.query(Account).filter(Account.account_number == covered).update(
+            {"archived_before": None, "archived_balance": None})
+        db.commit()
+    finally:
+        db.close()
+
+    for number in (archived, covered):
+        response = client.delete(f"/accounts/{number}")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Cannot delete account with existing transactions"
+        assert client.get(f"/accounts/{number}").status_code == 200
+
+def test_archive_file_round_trip(tmp_path):
+    columns = {
+        "transaction_id": [5, 3, 9],
+        "account_number": ["100-0001000", "100-0001000", "100-0001100"],
+        "transaction_date": np.array(["2024-01-02T09:00", "2024-01-03T10:30", "2024-01-01"], dtype="datetime64[us]"),
+        "transaction_type": [1, 2, 1],
+        "transaction_amount": [100, 40, 7],
+        "balance_after_transaction": [100, 60, 7],
+        "registration_date": np.array(["2024-01-02", "NaT", "2024-01-01"], dtype="datetime64[us]"),
+    }
+    for codec in archive.CODECS:
+        path = str(tmp_path / f"{codec}.ledger")
+        archive.write_file(path, columns, codec, row_group_size=2)
+        with archive.ArchiveFile(path) as archive_file:
+            assert len(archive_file.row_groups) == 2
+            whole = archive_file.read()
+            assert whole["transaction_id"].tolist() == [5, 3, 9]
+            assert (whole["transaction_date"] == columns["transaction_date"].view("<i8")).all()
+            one = archive_file.read("100-0001100")
+            assert one["account_number"].tolist() == ["100-0001100"]
+            assert one["balance_after_transaction"].tolist() == [7]
+            assert archive_file.read("100-0002000")["transaction_id"].tolist() == []
+        rows = archive.read_transactions([models.LedgerArchiveFile(month=date(2024, 1, 1), path=path)],
+                                         account_number="100-0001000", after=(datetime(2024, 1, 2, 9), 5),
+                                         directory=str(tmp_path))
+        assert [(row.transaction_id, row.registration_date, row.transaction_amount) for row in rows] == [
+            (3, None, Decimal(40))]
+
+def test_customer_search_by_name_and_real_name_id():
+    db = TestingSessionLocal()
+    for customer_id, name, number in (("c1", "Kim Minjun", "9001011234567"), ("c2", "kim minseo", "9001011234568"),
+                                      ("c3", "Park Kimberly", "9001011234569"), ("c4", "Lee 100%_x", "9001011234570"),
+                                      ("c5", "Lee 1000x", "9001011234571")):
+        db.add(Customer(customer_id=customer_id, customer_name=name, customer_type=1,
+                        real_name_identification_number=number))
+    db.commit()
+    plan = db.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN SELECT * FROM customer WHERE lower(customer_name) >= 'ki' "
+        "AND lower(customer_name) < 'kj' ORDER BY lower(customer_name) LIMIT 20").all()
+    db.close()
+    assert "ix_customer_name_prefix" in str(plan)
+
+    def search(q, **params):
+        response = client.get("/customers/search", params=dict(params, q=q))
+        assert response.status_code == 200
+        return [customer["customer_id"] for customer in response.json()]
+
+    # Prefixes first, in name order, then substrings
+    assert search("kim") == ["c1", "c2", "c3"]
+    assert search("KIM M") == ["c1", "c2"]
+    assert search("ki") == ["c1", "c2"]
+    assert search("kim", limit=2) == ["c1", "c2"]
+    assert search("imb") == ["c3"]
+    # LIKE wildcards are matched literally
+    assert search("0%_") == ["c4"]
+    assert search("9001011234569") == ["c3"]
+    assert search("900101") == []
+    assert client.get("/customers/search", params={"q": ""}).status_code == 422
+    assert client.get("/customers/search", params={"q": "kim", "limit": 101}).status_code == 422
+    assert client.get("/customers/search", params={"q": "kim"}).json()[0] == client.get("/customers/c1").json()
+
+    # Renames and deletes reach the substring index
+    client.put("/customers/c3", json={"customer_name": "Park Jiho", "customer_type": 1,
+                                      "real_name_identification_number": "9001011234569"})
+    assert search("kim") == ["c1", "c2"]
+    assert search("jiho") == ["c3"]
+    assert client.delete("/customers/c3").status_code == 200
+    assert search("jiho") == []
+
+def test_conditional_get_and_compression():
+    account_number = create_test_account("0")
+    customer_id = client.get(f"/accounts/{account_number}").json()["customer_id"]
+
+    def revalidate(url, **params):
+        first = client.get(url, params=params)
+        assert first.status_code == 200
+        tag = first.headers["etag"]
+        assert first.headers["cache-control"] == "no-cache"
+        again = client.get(url, params=params, headers={"If-None-Match": tag})
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["etag"] == tag
+        return tag
+
+    urls = ["/products/", f"/customers/{customer_id}", f"/accounts/{account_number}",
+            "/transactions/", f"/accounts/{account_number}/transactions/"]
+    tags = {url: revalidate(url) for url in urls}
+
+    # A cached customer changed through another worker is reloaded, not served stale
+    db = TestingSessionLocal()
+    db.get(Customer, customer_id).customer_name = "Renamed Elsewhere"
+    db.commit()
+    db.close()
+    response = client.get(f"/customers/{customer_id}", headers={"If-None-Match": tags[f"/customers/{customer_id}"]})
+    assert response.status_code == 200
+    assert response.json()["customer_name"] == "Renamed Elsewhere"
+    assert cache.customers.get(customer_id).customer_name == "Renamed Elsewhere"
+    tags[f"/customers/{customer_id}"] = revalidate(f"/customers/{customer_id}")
+    # The query string is part of the tag
+    assert revalidate("/products/", limit=1) != tags["/products/"]
+    assert client.get("/products/", headers={"If-None-Match": f'"x", {tags["/products/"]}'}).status_code == 304
+
+    posted = client.post("/transactions/", json={
+        "account_number": account_number, "transaction_date": "2024-01-01T09:00:00",
+        "transaction_type": 1, "transaction_amount": "100"})
+    assert posted.status_code == 200
+    for url in (f"/accounts/{account_number}", "/transactions/", f"/accounts/{account_number}/transactions/"):
+        response = client.get(url, headers={"If-None-Match": tags[url]})
+        assert response.status_code == 200
+        assert response.headers["etag"] != tags[url]
+    assert client.get("/products/", headers={"If-None-Match": tags["/products/"]}).status_code == 304
+
+    client.delete(f"/transactions/{posted.json()['transaction_id']}")
+    response = client.get(f"/accounts/{account_number}", headers={"If-None-Match": tags[f"/accounts/{account_number}"]})
+    assert response.status_code == 200
+    assert response.json()["ledger_sequence"] == 0
+
+    product = client.get("/products/123456").json()
+    product["product_name"] = "Renamed"
+    client.put("/products/123456", json=product)
+    response = client.get("/products/", headers={"If-None-Match": tags["/products/"]})
+    assert response.status_code == 200
+    assert response.json()[0]["product_name"] == "Renamed"
+
+    client.post("/transactions/batch", json=[
+        {"account_number": account_number, "transaction_date": f"2024-02-01T09:{minute:02d}:00",
+         "transaction_type": 1, "transaction_amount": "100"}
+        for minute in range(30)
+    ])
+    url = f"/accounts/{account_number}/transactions/"
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["vary"]
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert compressed.json() == plain.json()
+    assert int(compressed.headers["content-length"]) < int(plain.headers["content-length"])
+    # Small bodies are sent as they are
+    assert "content-encoding" not in client.get(f"/accounts/{account_number}",
+                                                 headers={"Accept-Encoding": "gzip"}).headers
+
+def test_migrations_and_readiness(tmp_path, monkeypatch):
+    import main
+    import migrate
+    versions = [migration.version for migration in migrate.discover()]
+    assert versions == sorted(set(versions))
+
+    monkeypatch.setattr(main, "_warmed", False)
+    monkeypatch.setattr(main, "async_engine", async_engine)
+    monkeypatch.setattr(main, "read_async_engine", async_engine)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["detail"]["pending_migrations"] == versions
+
+    # A new database is created from the models and every file is recorded
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    assert [migration.version for migration in migrate.upgrade(fresh, log=lambda line: None)] == versions
+    assert migrate.upgrade(fresh) == []
+    with fresh.connect() as connection:
+        assert migrate.pending(connection) == []
+        assert "ix_product_last_modified_date" in str(connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index'").all())
+
+    # Files run one statement at a time, so CREATE INDEX CONCURRENTLY never
+    # shares PostgreSQL's implicit multi-statement transaction
+    for migration in migrate.discover():
+        statements = migrate.split_statements(open(migration.path).read())
+        in_block = False
+        for statement in statements:
+            in_block = {"BEGIN": True, "COMMIT": False}.get(statement.upper(), in_block)
+            assert not (in_block and "CONCURRENTLY" in statement.upper()), migration.path
+    assert migrate.split_statements("SELECT 'a;''b'; -- c;\nDO $x$ BEGIN; END $x$; SELECT \"x;\" /* ; */ ;") == [
+        "SELECT 'a;''b'", "DO $x$ BEGIN; END $x$", 'SELECT "x;"']
+
+    # sqlite3, like a CONCURRENTLY statement, refuses a string of several statements
+    (tmp_path / "0001_two_tables.sql").write_text(
+        "BEGIN;\nCREATE TABLE first (id INTEGER);\nCREATE TABLE second (id INTEGER);\nCOMMIT;\n"
+        "CREATE INDEX ix_first_id ON first (id);\n")
+    (tmp_path / "0002_broken.sql").write_text(
+        "BEGIN;\nCREATE TABLE third (id INTEGER);\nCREATE TABLE first (id INTEGER);\nCOMMIT;\n")
+    scratch = create_engine(f"sqlite:///{tmp_path / 'scratch.db'}")
+    first, broken = migrate.discover(str(tmp_path))
+    with scratch.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        migrate._run_file(connection, first)
+        with pytest.raises(Exception):
+            migrate._run_file(connection, broken)
+        tables = {row[0] for row in connection.exec_driver_sql("SELECT name FROM sqlite_master").all()}
+    assert {"first", "second", "ix_first_id"} <= tables
+    assert "third" not in tables
+
+    migrate.baseline(engine, versions[-1])
+    create_test_account()
+    cache.clear_all()
+    assert client.get("/ready").json() == {"status": "ready"}
+    assert cache.products.stats()["entries"] == 1
+    assert client.get("/ready").status_code == 200
+
+def test_account_writes_see_customers_deleted_by_other_workers():
+    from sqlalchemy import event
+    account_number = create_test_account()
+    account = client.get(f"/accounts/{account_number}").json()
+    payload = {field: account[field] for field in schemas.AccountCreate.model_fields}
+    customer_id = client.post("/customers/", json={
+        "customer_name": "Jane Roe", "customer_type": 1, "real_name_identification_number": "1234567890124",
+    }).json()["customer_id"]
+    assert client.get(f"/customers/{customer_id}").status_code == 200
+
+    # Deleted by another worker, whose invalidation never reaches this one
+    db = TestingSessionLocal()
+    db.query(Customer).filter_by(customer_id=customer_id).delete()
+    db.commit()
+    db.close()
+    stale = cache.customers.get(customer_id)
+    assert stale is not None
+
+    def enforce_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+    event.listen(async_engine.sync_engine, "connect", enforce_foreign_keys)
+    try:
+        response = client.post("/accounts/", json=dict(payload, customer_id=customer_id))
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Customer not found"
+        assert cache.customers.get(customer_id) is None
+
+        cache.customers.set(customer_id, stale)
+        response = client.put(f"/accounts/{account_number}", json=dict(payload, customer_id=customer_id))
+        assert response.status_code == 404
+        assert client.get(f"/accounts/{account_number}").json()["customer_id"] == account["customer_id"]
+    finally:
+        event.remove(async_engine.sync_engine, "connect", enforce_foreign_keys)
+
+def test_concurrent_deletes_of_one_transaction_reverse_it_once(tmp_path):
+    RaceSessionLocal = file_ledger(tmp_path / "race.db", ["100-0001000"], 1000)
+
+    db = RaceSessionLocal()
+    for _ in range(10):
+        transaction_id = ledger.post_transaction(db, schemas.TransactionCreate(
+            account_number="100-0001000", transaction_date=datetime.utcnow(),
+            transaction_type=ledger.DEPOSIT, transaction_amount=Decimal(500),
+        )).transaction_id
+        barrier = threading.Barrier(2)
+
+        def delete(_):
+            session = RaceSessionLocal()
+            try:
+                barrier.wait()
+                return ledger.delete_transaction(session, transaction_id)
+            finally:
+                session.close()
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(delete, range(2)))
+        assert sorted(results, key=str) == ["100-0001000", None]
+
+        db.expire_all()
+        account = db.get(Account, "100-0001000")
+        assert account.current_balance == 1000
+        assert account.ledger_sequence == 0
+    db.close()
@@ -0,0 +1,93 @@
+import React, { useEffect, useState } from 'react';
+import { Autocomplete, CircularProgress, TextField } from '@mui/material';
+import { customerApi } from '../services/api';
+
+export interface Customer {
+  customer_id: string;
+  customer_name: string;
+  customer_type: number;
+  real_name_identification_number: string;
+}
+
+interface CustomerSearchProps {
+  label: string;
+  value: Customer | null;
+  onChange: (customer: Customer | null) => void;
+}
+
+// Wait for a pause in typing before querying the server
+const SEARCH_DELAY_MS = 250;
+
+// Type-ahead customer picker backed by GET /customers/search
+const CustomerSearch: React.FC<CustomerSearchProps> = ({ label, value, onChange }) => {
+  const [input, setInput] = useState('');
+  const [options, setOptions] = useState<Customer[]>([]);
+  const [loading, setLoading] = useState(false);
+
+  useEffect(() => {
+    const query = input.trim();
+    if (!query || (value && input === value.customer_name)) {
+      setOptions(value ? [value] : []);
+      return;
+    }
+    let active = true;
+    const timer = setTimeout(async () => {
+      setLoading(true);
+      try {
+        const response = await customerApi.search(query);
+        if (active) {
+          setOptions(response.data);
+        }
+      } catch (error) {
+        console.error('Error searching customers:', error);
+      } finally {
+        if (active) {
+          setLoading(false);
+        }
+      }
+    }, SEARCH_DELAY_MS);
+    return () => {
+      active = false;
+      clearTimeout(timer);
+    };
+  }, [input, value]);
+
+  return (
+    <Autocomplete
+      value={value}
+      options={options}
+      loading={loading}
+      // The server already filtered the options
+      filterOptions={(x) => x}
+      getOptionLabel={(customer) => customer.customer_name}
+      isOptionEqualToValue={(option, selected) => option.customer_id === selected.customer_id}
+      renderOption={(props, customer) => (
+        <li {...props} key={customer.customer_id}>
+          {customer.customer_name} ({customer.customer_type === 1 ? '개인' : '법인'})
+        </li>
+      )}
+      onChange={(_, customer) => onChange(customer)}
+      onInputChange={(_, text) => setInput(text)}
+      noOptionsText={input.trim() ? '검색 결과 없음' : '고객명 또는 실명 인증 번호 입력'}
+      renderInput={(params) => (
+        <TextField
+          {...params}
+          label={label}
+          slotProps={{
+            input: {
+              ...params.InputProps,
+              endAdornment: (
+                <>
+                  {loading ? <CircularProgress color="inherit" size={20} /> : null}
+                  {params.InputProps.endAdornment}
+                </>
+              ),
+            },
+          }}
+        />
+      )}
+    />
+  );
+};
+
+export default CustomerSearch;
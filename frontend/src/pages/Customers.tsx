@@ -21,16 +21,14 @@ import {
   InputLabel,
 } from '@mui/material';
 import { customerApi } from '../services/api';
+import { Customer } from '../components/CustomerSearch';
 
-interface Customer {
-  customer_id: string;
-  customer_name: string;
-  customer_type: number;
-  real_name_identification_number: string;
-}
+// Wait for a pause in typing before querying the server
+const SEARCH_DELAY_MS = 250;
 
 const Customers: React.FC = () => {
   const [customers, setCustomers] = useState<Customer[]>([]);
+  const [query, setQuery] = useState('');
   const [open, setOpen] = useState(false);
   const [formData, setFormData] = useState({
     customer_name: '',
@@ -38,9 +36,12 @@ const Customers: React.FC = () => {
     real_name_identification_number: '',
   });
 
-  const loadCustomers = async () => {
+  // The first page of customers, or the matches of the search box
+  const loadCustomers = async (search = query) => {
     try {
-      const response = await customerApi.getAll();
+      const response = search.trim()
+        ? await customerApi.search(search.trim(), 100)
+        : await customerApi.getAll();
       setCustomers(response.data);
     } catch (error) {
       console.error('Error loading customers:', error);
@@ -48,8 +49,10 @@ const Customers: React.FC = () => {
   };
 
   useEffect(() => {
-    loadCustomers();
-  }, []);
+    const timer = setTimeout(() => loadCustomers(query), SEARCH_DELAY_MS);
+    return () => clearTimeout(timer);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [query]);
 
   const handleOpen = () => {
     setOpen(true);
@@ -99,6 +102,14 @@ const Customers: React.FC = () => {
         </Button>
       </Box>
 
+      <TextField
+        fullWidth
+        label="고객명 또는 실명 인증 번호 검색"
+        value={query}
+        onChange={(e) => setQuery(e.target.value)}
+        sx={{ mb: 2 }}
+      />
+
       <TableContainer component={Paper}>
         <Table>
           <TableHead>
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import {
   Box,
   Typography,
@@ -22,14 +22,10 @@ import {
   DialogActions,
   TextField,
 } from '@mui/material';
-import { customerApi, accountApi, transactionApi } from '../services/api';
-
-interface Customer {
-  customer_id: string;
-  customer_name: string;
-  customer_type: number;
-  real_name_identification_number: string;
-}
+import {
+  customerApi, accountApi, transactionApi, eventApi, MAX_STREAM_ACCOUNTS,
+} from '../services/api';
+import CustomerSearch, { Customer } from '../components/CustomerSearch';
 
 interface Account {
   account_number: string;
@@ -41,6 +37,18 @@ interface Account {
   base_interest_rate: number;
   additional_interest_rate: number;
   applied_interest_rate: number;
+  current_balance: number;
+  transaction_count: number;
+  last_activity: string | null;
+}
+
+interface CustomerSummary {
+  customer_id: string;
+  customer_name: string;
+  account_count: number;
+  total_balance: number;
+  transaction_count: number;
+  last_activity: string | null;
 }
 
 interface Transaction {
@@ -52,6 +60,17 @@ interface Transaction {
   balance_after_transaction: number;
 }
 
+interface BalanceEvent {
+  account_number: string;
+  current_balance: number;
+  ledger_sequence: number;
+}
+
+interface DeletedEvent {
+  account_number: string;
+  transaction_id: number;
+}
+
 interface TransactionCreate {
   account_number: string;
   transaction_type: number;
@@ -59,9 +78,10 @@ interface TransactionCreate {
 }
 
 const Dashboard: React.FC = () => {
-  const [customers, setCustomers] = useState<Customer[]>([]);
+  const [customer, setCustomer] = useState<Customer | null>(null);
   const [selectedCustomer, setSelectedCustomer] = useState<string>('');
   const [accounts, setAccounts] = useState<Account[]>([]);
+  const [summary, setSummary] = useState<CustomerSummary | null>(null);
   const [selectedAccount, setSelectedAccount] = useState<string>('');
   const [transactions, setTransactions] = useState<Transaction[]>([]);
   const [openTransactionDialog, setOpenTransactionDialog] = useState(false);
@@ -70,59 +90,145 @@ const Dashboard: React.FC = () => {
     transaction_type: 1,
     transaction_amount: 0,
   });
+  const selectedAccountRef = useRef(selectedAccount);
+  selectedAccountRef.current = selectedAccount;
+  const transactionsRef = useRef(transactions);
+  transactionsRef.current = transactions;
 
-  // Load customers only once when component mounts
-  useEffect(() => {
-    const loadCustomers = async () => {
-      try {
-        const response = await customerApi.getAll();
-        setCustomers(response.data);
-      } catch (error) {
-        console.error('Error loading customers:', error);
-      }
-    };
-    loadCustomers();
-  }, []); // Empty dependency array means this runs once on mount
+  // Load the selected customer's accounts and totals
+  const loadCustomerAccounts = async (customerId: string) => {
+    try {
+      const [accountsResponse, summaryResponse] = await Promise.all([
+        customerApi.getAccounts(customerId),
+        customerApi.getSummary(customerId),
+      ]);
+      setAccounts(accountsResponse.data);
+      setSummary(summaryResponse.data);
+    } catch (error) {
+      console.error('Error loading accounts:', error);
+    }
+  };
 
-  // Load accounts when customer is selected
   useEffect(() => {
-    const loadAccounts = async () => {
-      if (selectedCustomer) {
-        try {
-          const response = await accountApi.getAll();
-          const customerAccounts = response.data.filter(
-            (account: Account) => account.customer_id === selectedCustomer
-          );
-          setAccounts(customerAccounts);
-        } catch (error) {
-          console.error('Error loading accounts:', error);
-        }
-      }
-    };
-    loadAccounts();
+    if (selectedCustomer) {
+      loadCustomerAccounts(selectedCustomer);
+    }
   }, [selectedCustomer]);
 
+  const loadTransactions = async (accountNumber: string) => {
+    try {
+      const response = await accountApi.getTransactions(accountNumber);
+      setTransactions(response.data);
+    } catch (error) {
+      console.error('Error loading transactions:', error);
+    }
+  };
+
   // Load transactions when account is selected
   useEffect(() => {
-    const loadTransactions = async () => {
-      if (selectedAccount) {
-        try {
-          const response = await accountApi.getTransactions(selectedAccount);
-          // Sort transactions by date in descending order
-          const sortedTransactions = response.data.sort((a: Transaction, b: Transaction) => 
-            new Date(b.transaction_date).getTime() - new Date(a.transaction_date).getTime()
-          );
-          setTransactions(sortedTransactions);
-        } catch (error) {
-          console.error('Error loading transactions:', error);
-        }
+    if (selectedAccount) {
+      loadTransactions(selectedAccount);
+    }
+  }, [selectedAccount]);
+
+  // Keep the summary in step with account updates pushed by the server
+  useEffect(() => {
+    setSummary((current) => current && {
+      ...current,
+      account_count: accounts.length,
+      total_balance: accounts.reduce((total, account) => total + Number(account.current_balance), 0),
+      transaction_count: accounts.reduce((total, account) => total + account.transaction_count, 0),
+      last_activity: accounts.reduce<string | null>(
+        (latest, account) => (account.last_activity && (!latest || account.last_activity > latest)
+          ? account.last_activity : latest),
+        null,
+      ),
+    });
+  }, [accounts]);
+
+  // Subscribe to the customer's accounts instead of re-reading them after every change
+  const accountNumbers = accounts.map((account) => account.account_number).join(',');
+  useEffect(() => {
+    if (!accountNumbers) {
+      return undefined;
+    }
+    const numbers = accountNumbers.split(',');
+    const sources: EventSource[] = [];
+    for (let start = 0; start < numbers.length; start += MAX_STREAM_ACCOUNTS) {
+      sources.push(eventApi.accountEvents(numbers.slice(start, start + MAX_STREAM_ACCOUNTS)));
+    }
+
+    const onTransaction = (event: Event) => {
+      const transaction: Transaction = JSON.parse((event as MessageEvent).data);
+      setAccounts((current) => current.map((account) => (
+        account.account_number === transaction.account_number
+          ? {
+            ...account,
+            transaction_count: account.transaction_count + 1,
+            last_activity: !account.last_activity || transaction.transaction_date > account.last_activity
+              ? transaction.transaction_date : account.last_activity,
+          }
+          : account
+      )));
+      if (transaction.account_number !== selectedAccountRef.current) {
+        return;
+      }
+      if (transactionsRef.current.some((row) => row.transaction_date > transaction.transaction_date)) {
+        // A back-dated posting changed the balances of the rows after it
+        loadTransactions(transaction.account_number);
+      } else {
+        setTransactions((current) => (
+          current.some((row) => row.transaction_id === transaction.transaction_id)
+            ? current
+            : [...current, transaction]
+        ));
       }
     };
-    loadTransactions();
-  }, [selectedAccount]);
 
-  const handleCustomerChange = (event: any) => {
-    const newCustomerId = event.target.value;
+    const onBalance = (event: Event) => {
+      const balance: BalanceEvent = JSON.parse((event as MessageEvent).data);
+      setAccounts((current) => current.map((account) => (
+        account.account_number === balance.account_number
+          ? { ...account, current_balance: balance.current_balance }
+          : account
+      )));
+    };
+
+    const onDeleted = (event: Event) => {
+      const deleted: DeletedEvent = JSON.parse((event as MessageEvent).data);
+      setAccounts((current) => current.map((account) => (
+        account.account_number === deleted.account_number
+          ? { ...account, transaction_count: Math.max(account.transaction_count - 1, 0) }
+          : account
+      )));
+      if (deleted.account_number === selectedAccountRef.current) {
+        loadTransactions(deleted.account_number);
+      }
+    };
+
+    sources.forEach((source) => {
+      source.addEventListener('transaction', onTransaction);
+      source.addEventListener('balance', onBalance);
+      source.addEventListener('deleted', onDeleted);
+      // A stream refused on connect (e.g. a 400) is closed rather than retried;
+      // an established stream that drops reconnects by itself
+      let opened = false;
+      source.addEventListener('open', () => {
+        opened = true;
+      });
+      source.addEventListener('error', () => {
+        if (!opened || source.readyState === EventSource.CLOSED) {
+          source.close();
+        }
+      });
+    });
+
+    return () => sources.forEach((source) => source.close());
+  }, [accountNumbers]);
+
+  const handleCustomerChange = (newCustomer: Customer | null) => {
+    const newCustomerId = newCustomer ? newCustomer.customer_id : '';
+    setCustomer(newCustomer);
     setSelectedCustomer(newCustomerId);
     // Don't clear selected account immediately
     if (newCustomerId !== selectedCustomer) {
@@ -161,12 +267,7 @@ const Dashboard: React.FC = () => {
       
       console.log('Transaction response:', response);
       handleCloseTransactionDialog();
-      
-      // Reload transactions
-      if (selectedAccount) {
-        const response = await accountApi.getTransactions(selectedAccount);
-        setTransactions(response.data);
-      }
+      // The new row and balance arrive on the account event stream
     } catch (error: any) {
       console.error('Error creating transaction:', error);
       if (error.response) {
@@ -193,6 +294,10 @@ const Dashboard: React.FC = () => {
     
     if (savedCustomer) {
       setSelectedCustomer(savedCustomer);
+      // Only the id is saved; fetch the name for the search box
+      customerApi.getById(savedCustomer)
+        .then((response) => setCustomer(response.data))
+        .catch((error) => console.error('Error loading customer:', error));
     }
     if (savedAccount) {
       setSelectedAccount(savedAccount);
@@ -210,24 +315,44 @@ const Dashboard: React.FC = () => {
         <Box sx={{ width: '100%' }}>
           <Card>
             <CardContent>
-              <FormControl fullWidth>
-                <InputLabel>고객 선택</InputLabel>
-                <Select
-                  value={selectedCustomer}
-                  label="고객 선택"
-                  onChange={handleCustomerChange}
-                >
-                  {customers.map((customer) => (
-                    <MenuItem key={customer.customer_id} value={customer.customer_id}>
-                      {customer.customer_name} ({customer.customer_type === 1 ? '개인' : '법인'})
-                    </MenuItem>
-                  ))}
-                </Select>
-              </FormControl>
+              <CustomerSearch label="고객 검색" value={customer} onChange={handleCustomerChange} />
             </CardContent>
           </Card>
         </Box>
 
+        {/* Customer Summary */}
+        {selectedCustomer && summary && (
+          <Box sx={{ width: '100%' }}>
+            <Card>
+              <CardContent>
+                <Typography variant="h6" gutterBottom>
+                  고객 요약
+                </Typography>
+                <Box sx={{ display: 'flex', flexWrap: 'wrap', gap: 2 }}>
+                  <Box sx={{ flex: '1 1 200px' }}>
+                    <Typography variant="subtitle2">계좌 수</Typography>
+                    <Typography variant="h6">{summary.account_count.toLocaleString()}</Typography>
+                  </Box>
+                  <Box sx={{ flex: '1 1 200px' }}>
+                    <Typography variant="subtitle2">총 잔액</Typography>
+                    <Typography variant="h6">{Number(summary.total_balance).toLocaleString()}원</Typography>
+                  </Box>
+                  <Box sx={{ flex: '1 1 200px' }}>
+                    <Typography variant="subtitle2">거래 건수</Typography>
+                    <Typography variant="h6">{summary.transaction_count.toLocaleString()}</Typography>
+                  </Box>
+                  <Box sx={{ flex: '1 1 200px' }}>
+                    <Typography variant="subtitle2">최근 거래일시</Typography>
+                    <Typography variant="h6">
+                      {summary.last_activity ? new Date(summary.last_activity).toLocaleString() : '-'}
+                    </Typography>
+                  </Box>
+                </Box>
+              </CardContent>
+            </Card>
+          </Box>
+        )}
+
         {/* Account Selection */}
         <Box sx={{ width: '100%' }}>
           <Card>
@@ -242,7 +367,7 @@ const Dashboard: React.FC = () => {
                 >
                   {accounts.map((account) => (
                     <MenuItem key={account.account_number} value={account.account_number}>
-                      {account.account_number} - {account.initial_deposit_amount.toLocaleString()}원
+                      {account.account_number} - {Number(account.current_balance).toLocaleString()}원
                     </MenuItem>
                   ))}
                 </Select>
@@ -280,6 +405,16 @@ const Dashboard: React.FC = () => {
                           <Typography variant="subtitle2">적용 금리</Typography>
                           <Typography variant="h6">{account.applied_interest_rate}%</Typography>
                         </Box>
+                        <Box sx={{ flex: '1 1 300px' }}>
+                          <Typography variant="subtitle2">거래 건수</Typography>
+                          <Typography variant="h6">{account.transaction_count.toLocaleString()}</Typography>
+                        </Box>
+                        <Box sx={{ flex: '1 1 300px' }}>
+                          <Typography variant="subtitle2">최근 거래일시</Typography>
+                          <Typography variant="h6">
+                            {account.last_activity ? new Date(account.last_activity).toLocaleString() : '-'}
+                          </Typography>
+                        </Box>
                       </React.Fragment>
                     ))}
                 </Box>
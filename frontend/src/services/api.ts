@@ -12,10 +12,14 @@ const api = axios.create({
 // Customer API
 export const customerApi = {
   getAll: () => api.get('/customers/'),
+  // Name prefix or substring, or an exact real-name identification number
+  search: (q: string, limit = 20) => api.get('/customers/search', { params: { q, limit } }),
   getById: (id: string) => api.get(`/customers/${id}`),
   create: (data: any) => api.post('/customers/', data),
   update: (id: string, data: any) => api.put(`/customers/${id}`, data),
   delete: (id: string) => api.delete(`/customers/${id}`),
+  getAccounts: (id: string) => api.get(`/customers/${id}/accounts`),
+  getSummary: (id: string) => api.get(`/customers/${id}/summary`),
 };
 
 // Product API
@@ -44,4 +48,17 @@ export const transactionApi = {
   delete: (id: number) => api.delete(`/transactions/${id}`),
 };
 
+// Account activity pushed as server-sent events. EventSource reconnects by
+// itself and resumes from the last transaction it received.
+// Matches MAX_STREAM_ACCOUNTS in backend/events.py; larger sets need several streams.
+export const MAX_STREAM_ACCOUNTS = 100;
+
+export const eventApi = {
+  accountEvents: (numbers: string[]) => {
+    const params = new URLSearchParams();
+    numbers.forEach((number) => params.append('account', number));
+    return new EventSource(`${API_BASE_URL}/events/accounts?${params.toString()}`);
+  },
+};
+
 export default api; 
\ No newline at end of file